@@ -0,0 +1,220 @@
+"""
+API 层公共部分：app_jessdb.py（Flask）与 app_jessdb_async.py（Quart）共用的
+常量、行转字典函数和流式输出编码
+"""
+
+import json
+
+# 批量下单接口单次请求允许的最大订单数
+BULK_ORDER_LIMIT = 5000
+
+# 订单列表分页大小
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# 流式输出每批写出的行数
+STREAM_BATCH_SIZE = 500
+
+# 订单事件流（SSE）：无事件时发送注释行保活的间隔、断线后客户端重连等待（毫秒）
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 3000
+
+
+def product_to_dict(product):
+    return {
+        'id': product[0],
+        'name': product[1],
+        'price': float(product[2]),
+        'is_active': product[3],
+        'category': product[4]
+    }
+
+
+def category_to_dict(category):
+    return {
+        'id': category[0],
+        'name': category[1],
+        'description': category[2]
+    }
+
+
+def customer_to_dict(customer):
+    return {
+        'customer_id': customer[0],
+        'name': customer[1],
+        'phone': customer[2],
+        'email': customer[3],
+        'address': customer[4],
+        'customer_type': customer[5]
+    }
+
+
+def member_to_dict(member):
+    return {
+        'customer_id': member[0],
+        'name': member[1],
+        'phone': member[2],
+        'email': member[3],
+        'address': member[4],
+        'date_of_birth': member[5],
+        'registration_date': member[6]
+    }
+
+
+def order_to_dict(order):
+    return {
+        'order_id': order[0],
+        'customer_name': order[1],
+        'order_date': order[2],
+        'status': order[3],
+        'payment_method': order[4],
+        'total_amount': float(order[5])
+    }
+
+
+def order_item_to_dict(item):
+    return {
+        'product_id': item[0],
+        'product_name': item[1],
+        'quantity': item[2],
+        'unit_price': float(item[3]),
+        'line_amount': float(item[4]) if item[4] else 0
+    }
+
+
+def sales_row_to_dict(row):
+    return {
+        'date': row[0],
+        'order_count': row[1],
+        'total_sales': float(row[2]) if row[2] else 0,
+        'avg_order_value': float(row[3]) if row[3] else 0
+    }
+
+
+def product_report_to_dict(row):
+    return {
+        'product_name': row[0],
+        'category': row[1],
+        'total_quantity': row[2],
+        'total_revenue': float(row[3]) if row[3] else 0,
+        'order_count': row[4]
+    }
+
+
+def customer_report_to_dict(row):
+    return {
+        'customer_name': row[0],
+        'customer_type': row[1],
+        'order_count': row[2] if row[2] else 0,
+        'total_spent': float(row[3]) if row[3] else 0,
+        'avg_order_value': float(row[4]) if row[4] else 0,
+        'last_order_date': row[5]
+    }
+
+
+def order_with_items_to_dict(entry):
+    """(订单行, 订单项行列表) -> 带 items 的订单（后厨队列、批量订单详情）"""
+    order, items = entry
+    return dict(order_to_dict(order), items=[order_item_to_dict(item) for item in items])
+
+
+def order_event_to_dict(row):
+    return {
+        'event_id': row[0],
+        'type': row[1],
+        'order_id': row[2],
+        'old_status': row[3],
+        'status': row[4],
+        'created_at': row[5],
+        'order': None if row[7] is None else {
+            'order_id': row[2],
+            'customer_name': row[6],
+            'order_date': row[7],
+            'status': row[4],
+            'payment_method': row[8],
+            'total_amount': float(row[9])
+        }
+    }
+
+
+def parse_id_list(value, limit):
+    """逗号分隔的 ID 列表（?ids=1,2,3），最多 limit 个；格式不对或超出数量时抛出 ValueError"""
+    ids = [int(part) for part in (value or '').split(',') if part.strip()]
+    if not ids:
+        raise ValueError("缺少 ids 参数")
+    if len(ids) > limit:
+        raise ValueError(f"单次最多查询 {limit} 个订单")
+    return ids
+
+
+def bearer_token(header):
+    """Authorization: Bearer <token> 中的令牌，没有时返回 None"""
+    scheme, _, token = (header or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+def member_denial(claims, customer_id):
+    """会员专属数据的授权：未登录返回 (401, 错误信息)，令牌不属于 customer_id 返回 (403, 错误信息)，通过返回 None"""
+    if claims is None:
+        return 401, '请先登录会员'
+    if str(claims['sub']) != str(customer_id).strip():
+        return 403, '无权访问其他会员的数据'
+    return None
+
+
+def parse_last_event_id(header, arg):
+    """断点续传位置：EventSource 重连时带 Last-Event-ID 头，首次连接可用 ?last_event_id=；都没有时返回 None"""
+    value = header or arg
+    if value in (None, ''):
+        return None
+    event_id = int(value)
+    if event_id < 0:
+        raise ValueError("last_event_id 不能为负数")
+    return event_id
+
+
+def sse_event(row):
+    """把一条订单事件编码为 SSE 消息：id 为 event_id，事件名为 order_created / order_status"""
+    data = json.dumps(order_event_to_dict(row), ensure_ascii=False)
+    return f"id: {row[0]}\nevent: order_{row[1]}\ndata: {data}\n\n"
+
+
+def parse_stream_mode(value):
+    """?stream=json|ndjson 开启流式输出（stream=1 等同 json），否则返回 None"""
+    mode = (value or '').lower()
+    if mode in ('1', 'true', 'json'):
+        return 'json'
+    if mode == 'ndjson':
+        return 'ndjson'
+    return None
+
+
+def stream_mimetype(mode):
+    return 'application/x-ndjson' if mode == 'ndjson' else 'application/json'
+
+
+class StreamEncoder:
+    """把一批批行编码成 JSON（与普通响应同结构）或 NDJSON 文本片段
+
+    依次调用 start()、每批 batch(rows)、最后 end()，把返回的字符串按顺序写出即可。
+    """
+
+    def __init__(self, to_dict, mode):
+        self.to_dict = to_dict
+        self.mode = mode
+        self._separator = ''
+
+    def start(self):
+        return '' if self.mode == 'ndjson' else '{"success": true, "data": ['
+
+    def batch(self, rows):
+        if self.mode == 'ndjson':
+            return ''.join(json.dumps(self.to_dict(row), ensure_ascii=False) + '\n' for row in rows)
+        chunk = self._separator + ','.join(json.dumps(self.to_dict(row), ensure_ascii=False) for row in rows)
+        self._separator = ','
+        return chunk
+
+    def end(self):
+        return '' if self.mode == 'ndjson' else ']}'
@@ -1,14 +1,149 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from database_jessdb import JessDBCoffeeShop
+from config_jessdb import JessDBConfig
+from passwords_jessdb import PasswordHasherBusy
+import metrics_jessdb as metrics
+from api_common_jessdb import (BULK_ORDER_LIMIT, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SSE_KEEPALIVE_SECONDS,
+                               SSE_RETRY_MS, STREAM_BATCH_SIZE, StreamEncoder, bearer_token,
+                               category_to_dict, customer_report_to_dict, customer_to_dict,
+                               member_denial, member_to_dict, order_item_to_dict, order_to_dict,
+                               order_with_items_to_dict, parse_id_list, parse_last_event_id,
+                               parse_stream_mode, product_report_to_dict, product_to_dict,
+                               sales_row_to_dict, sse_event, stream_mimetype)
 import json
+import os
+import threading
+import time
 from datetime import datetime
+from itertools import islice
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify 的序列化耗时计入 Server-Timing 的 json 阶段"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.phase('json'):
+            return super().dumps(obj, **kwargs)
+
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
-# 初始化数据库
-db = JessDBCoffeeShop()
+# 初始化数据库（连接池与 PRAGMA 配置可通过 JESSDB_* 环境变量调整）
+db = JessDBCoffeeShop(config=JessDBConfig.from_env())
+# 启动时预热后厨队列的活跃订单索引
+db.active_orders.warm()
+
+# 订单事件流（SSE）连接数上限：每个连接独占一个请求线程直到断开，不加限制时几个浏览器标签页就能占满
+# gthread 工作进程的全部线程，其他请求只能排队。超出上限返回 503，客户端稍后重连。
+# 上限按服务器线程数设置（JESSDB_SSE_MAX_SUBSCRIBERS，gunicorn_jessdb.conf.py 自动设置），未设置时不限制
+_sse_limit = db.db_manager.config.sse_max_subscribers
+_sse_slots = threading.BoundedSemaphore(_sse_limit) if _sse_limit else None
+_sse_lock = threading.Lock()
+_sse_subscribers = 0
+
+metrics.REGISTRY.gauge('jessdb_sse_subscribers', '本进程当前的订单事件流连接数', (),
+                       lambda: {(): _sse_subscribers})
+
+metrics.REGISTRY.gauge('jessdb_pool_connections', '连接池连接数', ['state'], lambda: {
+    ('open',): db.db_manager.pool.stats()['open'],
+    ('idle',): db.db_manager.pool.stats()['idle'],
+})
+
+
+@app.before_request
+def start_request_timing():
+    metrics.begin_request()
+
+
+@app.after_request
+def add_server_timing(response):
+    """记录请求耗时并输出 Server-Timing（流式响应只统计到开始输出为止）"""
+    timings = metrics.end_request()
+    if timings is not None:
+        total = time.perf_counter() - timings.started
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_DURATION.observe(total, endpoint, request.method, str(response.status_code))
+        response.headers['Server-Timing'] = timings.server_timing(total)
+    return response
+
+
+@app.teardown_request
+def clear_request_timing(exc):
+    metrics.end_request()
+
+
+def stream_mode():
+    """?stream=json|ndjson 开启流式输出（stream=1 等同 json），否则返回 None"""
+    return parse_stream_mode(request.args.get('stream'))
+
+
+def include_items():
+    """?include=items 时订单列表附带每个订单的订单项"""
+    return 'items' in request.args.get('include', '').split(',')
+
+
+def member_denied(customer_id):
+    """会员专属数据：校验 Authorization: Bearer 令牌（只查内存），未登录或非本人时返回错误响应"""
+    claims = db.sessions.verify(bearer_token(request.headers.get('Authorization')))
+    denial = member_denial(claims, customer_id)
+    if denial is None:
+        return None
+    status, message = denial
+    return jsonify({'success': False, 'error': message}), status
+
+
+def stream_rows(rows, to_dict, mode):
+    """把行迭代器按批写成 JSON（与普通响应同结构）或 NDJSON，内存占用与结果行数无关"""
+    # 先取第一批：查询本身出错时仍能返回正常的错误响应
+    first_batch = list(islice(rows, STREAM_BATCH_SIZE))
+
+    def batches():
+        batch = first_batch
+        while batch:
+            yield batch
+            batch = list(islice(rows, STREAM_BATCH_SIZE))
+
+    def generate():
+        encoder = StreamEncoder(to_dict, mode)
+        yield encoder.start()
+        for batch in batches():
+            yield encoder.batch(batch)
+        yield encoder.end()
+
+    response = Response(stream_with_context(generate()), mimetype=stream_mimetype(mode))
+
+    # 客户端中途断开时也要在请求线程内关闭生成器，及时把连接还给连接池
+    if hasattr(rows, 'close'):
+        response.call_on_close(rows.close)
+    return response
+
+
+def acquire_sse_slot():
+    """占用一个事件流名额，返回归还名额的函数（只生效一次）；名额已满时返回 None"""
+    global _sse_subscribers
+    if _sse_slots is not None and not _sse_slots.acquire(blocking=False):
+        return None
+    with _sse_lock:
+        _sse_subscribers += 1
+    released = False
+
+    def release():
+        global _sse_subscribers
+        nonlocal released
+        with _sse_lock:
+            if released:
+                return
+            released = True
+            _sse_subscribers -= 1
+        if _sse_slots is not None:
+            _sse_slots.release()
+
+    return release
+
 
 @app.route('/')
 def index():
@@ -22,21 +157,37 @@ def admin():
 
 # API路由
 
+# 菜单接口序列化结果缓存：key -> (etag, JSON 文本)，ETag 不变时直接复用
+_menu_responses = {}
+
+
+def menu_response(key, build_data):
+    """带 ETag 的菜单响应：If-None-Match 命中时返回 304，不查库也不重新序列化"""
+    etag = db.menu_etag(key)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        cached = _menu_responses.get(key)
+        if cached is None or cached[0] != etag:
+            data = build_data()
+            with metrics.phase('json'):
+                body = json.dumps({'success': True, 'data': data}, ensure_ascii=False)
+            cached = (etag, body)
+            _menu_responses[key] = cached
+        response = Response(cached[1], mimetype='application/json')
+    response.set_etag(etag)
+    # 允许浏览器缓存，但每次使用前都需带 If-None-Match 重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
     """获取所有产品"""
     try:
-        products = db.get_all_products()
-        product_list = []
-        for product in products:
-            product_list.append({
-                'id': product[0],
-                'name': product[1],
-                'price': float(product[2]),
-                'is_active': product[3],
-                'category': product[4]
-            })
-        return jsonify({'success': True, 'data': product_list})
+        def build_data():
+            return [product_to_dict(product) for product in db.get_all_products()]
+        return menu_response('products', build_data)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -44,15 +195,9 @@ def get_products():
 def get_categories():
     """获取所有分类"""
     try:
-        categories = db.get_categories()
-        category_list = []
-        for category in categories:
-            category_list.append({
-                'id': category[0],
-                'name': category[1],
-                'description': category[2]
-            })
-        return jsonify({'success': True, 'data': category_list})
+        def build_data():
+            return [category_to_dict(category) for category in db.get_categories()]
+        return menu_response('categories', build_data)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -61,21 +206,21 @@ def create_customer():
     """创建客户"""
     try:
         data = request.get_json()
-        customer_id = db.create_customer(
+        customer_id = db.writes.create_customer(
             name=data['name'],
             phone=data.get('phone', ''),
             email=data.get('email', ''),
             address=data.get('address', ''),
             customer_type=data.get('customer_type', 'GUEST')
-        )
+        ).result()
         
         # 如果是会员类型，创建会员记录
         if data.get('customer_type') == 'MEMBER' and data.get('password'):
-            db.create_member_customer(
+            db.writes.create_member_customer(
                 customer_id=customer_id,
                 password=data['password'],
                 date_of_birth=data.get('date_of_birth')
-            )
+            ).result()
         
         return jsonify({'success': True, 'customer_id': customer_id})
     except Exception as e:
@@ -83,19 +228,14 @@ def create_customer():
 
 @app.route('/api/customers/<int:customer_id>', methods=['GET'])
 def get_customer(customer_id):
-    """获取客户信息"""
+    """获取客户信息（仅限本人，需要会员令牌）"""
     try:
+        denied = member_denied(customer_id)
+        if denied:
+            return denied
         customer = db.get_customer_by_id(customer_id)
         if customer:
-            customer_data = {
-                'customer_id': customer[0],
-                'name': customer[1],
-                'phone': customer[2],
-                'email': customer[3],
-                'address': customer[4],
-                'customer_type': customer[5]
-            }
-            return jsonify({'success': True, 'data': customer_data})
+            return jsonify({'success': True, 'data': customer_to_dict(customer)})
         else:
             return jsonify({'success': False, 'error': '客户不存在'}), 404
     except Exception as e:
@@ -106,24 +246,14 @@ def get_members():
     """获取会员列表"""
     try:
         members = db.get_member_customers()
-        member_list = []
-        for member in members:
-            member_list.append({
-                'customer_id': member[0],
-                'name': member[1],
-                'phone': member[2],
-                'email': member[3],
-                'address': member[4],
-                'date_of_birth': member[5],
-                'registration_date': member[6]
-            })
+        member_list = [member_to_dict(member) for member in members]
         return jsonify({'success': True, 'data': member_list})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/members/login', methods=['POST'])
 def member_login():
-    """会员登录"""
+    """会员登录，成功时返回会话令牌（之后的会员请求带 Authorization: Bearer <token>）"""
     try:
         data = request.get_json()
         member = db.verify_member_login(data['email'], data['password'])
@@ -131,6 +261,18 @@ def member_login():
             return jsonify({'success': True, 'data': member})
         else:
             return jsonify({'success': False, 'error': '邮箱或密码错误'}), 401
+    except PasswordHasherBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/members/logout', methods=['POST'])
+def member_logout():
+    """会员登出：吊销请求所带的会话令牌"""
+    try:
+        if db.sessions.revoke(bearer_token(request.headers.get('Authorization'))):
+            return jsonify({'success': True})
+        return jsonify({'success': False, 'error': '令牌无效或已过期'}), 401
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -143,44 +285,98 @@ def create_order():
         # 如果没有提供客户ID，创建新客户
         customer_id = data.get('customer_id')
         if not customer_id:
-            customer_id = db.create_customer(
+            customer_id = db.writes.create_customer(
                 name=data['customer_name'],
                 phone=data.get('customer_phone', ''),
                 email=data.get('customer_email', ''),
                 address=data.get('customer_address', ''),
                 customer_type=data.get('customer_type', 'GUEST')
-            )
+            ).result()
         
-        order_id = db.create_order(
+        order_id = db.writes.create_order(
             customer_id=customer_id,
             payment_method=data['payment_method'],
             order_items=data['items'],
             status=data.get('status', 'PLACED')
-        )
+        ).result()
         
         return jsonify({'success': True, 'order_id': order_id})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/orders/bulk', methods=['POST'])
+def create_orders_bulk():
+    """批量创建订单（POS 离线同步）"""
+    try:
+        data = request.get_json()
+        orders = data.get('orders') if isinstance(data, dict) else None
+        if not isinstance(orders, list):
+            return jsonify({'success': False, 'error': '请求体需要包含 orders 数组'}), 400
+        if len(orders) > BULK_ORDER_LIMIT:
+            return jsonify({'success': False, 'error': f'单次最多提交 {BULK_ORDER_LIMIT} 个订单'}), 413
+        
+        results = db.create_orders_bulk(orders)
+        
+        summary = {
+            'created': sum(1 for r in results if r['success'] and not r['duplicate']),
+            'duplicates': sum(1 for r in results if r['duplicate']),
+            'failed': sum(1 for r in results if not r['success'])
+        }
+        return jsonify({'success': True, 'summary': summary, 'results': results})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    """获取订单历史"""
+    """获取订单历史（keyset 分页；stream 模式下导出全部匹配订单）"""
     try:
-        customer_id = request.args.get('customer_id')
-        orders = db.get_order_history(customer_id)
+        filters = {
+            'customer_id': request.args.get('customer_id'),
+            'status': request.args.get('status'),
+            'start_date': request.args.get('start_date'),
+            'end_date': request.args.get('end_date')
+        }
+        if filters['customer_id']:
+            # 按会员过滤即会员查看自己的订单，需要本人的会员令牌
+            denied = member_denied(filters['customer_id'])
+            if denied:
+                return denied
+        mode = stream_mode()
+        if mode:
+            rows = db.iter_order_history(limit=request.args.get('limit', type=int),
+                                         after=request.args.get('after'),
+                                         batch_size=STREAM_BATCH_SIZE, **filters)
+            return stream_rows(rows, order_to_dict, mode)
+        
+        limit = min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int) or DEFAULT_PAGE_SIZE,
+                    MAX_PAGE_SIZE)
+        orders, next_cursor = db.get_order_page(limit, after=request.args.get('after'), **filters)
+        # ?include=items：整页订单的订单项用一次 IN 查询取回，一并返回
+        items = db.get_order_items_many([order[0] for order in orders]) if include_items() else None
         
-        order_list = []
-        for order in orders:
-            order_list.append({
-                'order_id': order[0],
-                'customer_name': order[1],
-                'order_date': order[2],
-                'status': order[3],
-                'payment_method': order[4],
-                'total_amount': float(order[5])
-            })
+        with metrics.phase('convert'):
+            if items is None:
+                order_list = [order_to_dict(order) for order in orders]
+            else:
+                order_list = [order_with_items_to_dict((order, items[order[0]])) for order in orders]
         
-        return jsonify({'success': True, 'data': order_list})
+        return jsonify({'success': True, 'data': order_list, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/orders/details', methods=['GET'])
+def get_orders_details():
+    """批量获取订单及订单项：?ids=1,2,3（最多 MAX_PAGE_SIZE 个），按传入顺序返回，不存在的订单跳过"""
+    try:
+        order_ids = parse_id_list(request.args.get('ids'), MAX_PAGE_SIZE)
+        entries = db.get_order_details_many(order_ids)
+        with metrics.phase('convert'):
+            data = [order_with_items_to_dict(entry) for entry in entries]
+        return jsonify({'success': True, 'data': data})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -189,26 +385,76 @@ def update_order_status(order_id):
     """更新订单状态"""
     try:
         data = request.get_json()
-        db.update_order_status(order_id, data['status'])
+        db.writes.update_order_status(order_id, data['status']).result()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/orders/events', methods=['GET'])
+def order_events():
+    """订单事件流（SSE）：推送新订单和状态变更，支持 Last-Event-ID 断点续传"""
+    try:
+        feed = db.order_events
+        last_id = parse_last_event_id(request.headers.get('Last-Event-ID'),
+                                      request.args.get('last_event_id'))
+        if last_id is None:
+            last_id = feed.latest_id()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    release = acquire_sse_slot()
+    if release is None:
+        response = jsonify({'success': False, 'error': '订单事件流连接数已达上限，请稍后重试'})
+        response.headers['Retry-After'] = str(SSE_RETRY_MS // 1000)
+        return response, 503
+
+    def generate():
+        # 每个连接占用一个请求线程直到断开；客户端断开后下一次写出（最迟一个保活间隔）时结束
+        event_id = last_id
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while not feed.closed:
+            events = feed.wait(event_id, timeout=SSE_KEEPALIVE_SECONDS)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield sse_event(event)
+            event_id = events[-1][0]
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # 连接结束（包括生成器尚未开始就被关闭）时由 WSGI 服务器调用 close()，归还名额
+    response.call_on_close(release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # 关闭反向代理（nginx）的响应缓冲，事件才能即时送达
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/kitchen/queue', methods=['GET'])
+def get_kitchen_queue():
+    """后厨队列：未完成订单按进入队列先后排列，附带订单项；读取内存中的活跃订单索引
+
+    只含最近 kitchen_max_age_hours 内下单的订单；?limit= 取队列最前面的若干个（默认 DEFAULT_PAGE_SIZE，
+    最多 MAX_PAGE_SIZE），total 为队列中的订单总数。
+    返回的 event_id 可作为 /api/orders/events 的 last_event_id，之后只接收增量变化。
+    """
+    try:
+        limit = min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int) or DEFAULT_PAGE_SIZE,
+                    MAX_PAGE_SIZE)
+        entries, event_id, total = db.active_orders.orders(limit)
+        with metrics.phase('convert'):
+            data = [order_with_items_to_dict(entry) for entry in entries]
+        return jsonify({'success': True, 'data': data, 'event_id': event_id, 'total': total})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/orders/<int:order_id>/details', methods=['GET'])
 def get_order_details(order_id):
     """获取订单详情"""
     try:
         items = db.get_order_details(order_id)
-        
-        item_list = []
-        for item in items:
-            item_list.append({
-                'product_id': item[0],
-                'product_name': item[1],
-                'quantity': item[2],
-                'unit_price': float(item[3]),
-                'line_amount': float(item[4]) if item[4] else 0
-            })
+        item_list = [order_item_to_dict(item) for item in items]
         
         return jsonify({'success': True, 'data': item_list})
     except Exception as e:
@@ -223,36 +469,35 @@ def get_sales_report():
         
         report = db.get_sales_report(start_date, end_date)
         
-        report_data = []
-        for row in report:
-            report_data.append({
-                'date': row[0],
-                'order_count': row[1],
-                'total_sales': float(row[2]) if row[2] else 0,
-                'avg_order_value': float(row[3]) if row[3] else 0
-            })
+        report_data = [sales_row_to_dict(row) for row in report]
         
         return jsonify({'success': True, 'data': report_data})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/reports/products', methods=['GET'])
 def get_product_sales_report():
-    """获取产品销售报告"""
+    """获取产品销售报告（可选 start_date、end_date、top_n）"""
     try:
-        report = db.get_product_sales_report()
+        filters = {
+            'start_date': request.args.get('start_date'),
+            'end_date': request.args.get('end_date'),
+            'top_n': request.args.get('top_n', type=int)
+        }
+        mode = stream_mode()
+        if mode:
+            rows = db.iter_product_sales_report(batch_size=STREAM_BATCH_SIZE, **filters)
+            return stream_rows(rows, product_report_to_dict, mode)
         
-        report_data = []
-        for row in report:
-            report_data.append({
-                'product_name': row[0],
-                'category': row[1],
-                'total_quantity': row[2],
-                'total_revenue': float(row[3]) if row[3] else 0,
-                'order_count': row[4]
-            })
+        report = db.get_product_sales_report(**filters)
+        with metrics.phase('convert'):
+            report_data = [product_report_to_dict(row) for row in report]
         
         return jsonify({'success': True, 'data': report_data})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -260,18 +505,14 @@ def get_product_sales_report():
 def get_customer_report():
     """获取客户报告"""
     try:
-        report = db.get_customer_report()
+        mode = stream_mode()
+        if mode:
+            rows = db.iter_customer_report(batch_size=STREAM_BATCH_SIZE)
+            return stream_rows(rows, customer_report_to_dict, mode)
         
-        report_data = []
-        for row in report:
-            report_data.append({
-                'customer_name': row[0],
-                'customer_type': row[1],
-                'order_count': row[2] if row[2] else 0,
-                'total_spent': float(row[3]) if row[3] else 0,
-                'avg_order_value': float(row[4]) if row[4] else 0,
-                'last_order_date': row[5]
-            })
+        report = db.get_customer_report()
+        with metrics.phase('convert'):
+            report_data = [customer_report_to_dict(row) for row in report]
         
         return jsonify({'success': True, 'data': report_data})
     except Exception as e:
@@ -283,22 +524,67 @@ def database_status():
     """检查数据库状态"""
     try:
         # 检查各表的记录数
-        conn = db.db_manager.get_connection()
-        cursor = conn.cursor()
-        
         status = {}
         tables = ['customer', 'member_customers', 'category', 'product', 'orders', 'order_items']
         
-        for table in tables:
-            cursor.execute(f"SELECT COUNT(*) FROM {table}")
-            count = cursor.fetchone()[0]
-            status[table] = count
+        with db.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            for table in tables:
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                count = cursor.fetchone()[0]
+                status[table] = count
         
-        conn.close()
-        
-        return jsonify({'success': True, 'data': status})
+        return jsonify({'success': True, 'data': status, 'pool': db.db_manager.pool.stats(),
+                        'pragmas': db.db_manager.pragma_status()})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/admin/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """最慢的语句（按 SQL 指纹汇总），?sort=total|max|count&limit=N"""
+    try:
+        slow_queries = db.db_manager.slow_queries
+        if slow_queries is None:
+            return jsonify({'success': True, 'enabled': False, 'data': []})
+        limit = min(request.args.get('limit', 20, type=int) or 20, MAX_PAGE_SIZE)
+        data = slow_queries.worst(limit, request.args.get('sort', 'total'))
+        return jsonify({'success': True, 'enabled': True,
+                        'threshold_ms': db.db_manager.config.slow_query_ms, 'data': data})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+def reset_slow_queries():
+    """清空慢查询汇总（日志文件不受影响）"""
+    if db.db_manager.slow_queries is not None:
+        db.db_manager.slow_queries.reset()
+    return jsonify({'success': True})
+
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    """存活检查：进程能处理请求即可，不访问数据库"""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    """就绪检查：能从连接池借到连接、数据库可查询且迁移已全部应用，否则返回 503"""
+    try:
+        version = db.db_manager.schema_version()
+        latest = db.db_manager.latest_schema_version()
+        body = {'schema_version': version, 'pool': db.db_manager.pool.stats(), 'pid': os.getpid()}
+        if version < latest:
+            return jsonify(dict(body, status='migrating')), 503
+        return jsonify(dict(body, status='ready'))
+    except Exception as e:
+        return jsonify({'status': 'unavailable', 'error': str(e), 'pid': os.getpid()}), 503
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文本格式的运行指标（SQL、方法、连接池、HTTP 耗时直方图）"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 开发服务器；生产环境使用 ./start_jessdb.sh prod（gunicorn 多进程，见 gunicorn_jessdb.conf.py）
+    app.run(debug=os.environ.get('JESSDB_DEBUG', '1') == '1', host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,556 @@
+"""
+JessDB 咖啡店系统的异步服务（Quart）
+
+与 app_jessdb.py 提供相同的路由和响应格式。数据库调用通过 AsyncJessDBCoffeeShop 放到线程池执行，
+事件循环不被阻塞：慢报表只占用一个数据库线程，同一进程仍可继续处理菜单、下单等请求。
+
+可选依赖：pip install quart quart-cors hypercorn
+启动：
+    python app_jessdb_async.py
+    hypercorn app_jessdb_async:app --bind 0.0.0.0:5000
+"""
+
+import asyncio
+import json
+import os
+import time
+
+try:
+    from quart import Quart, Response, request, jsonify, render_template
+except ImportError as e:  # pragma: no cover - 可选依赖
+    raise ImportError("异步服务需要 Quart：pip install quart quart-cors hypercorn") from e
+
+try:
+    from quart_cors import cors
+except ImportError:  # pragma: no cover - 可选依赖
+    cors = None
+
+from database_jessdb import JessDBCoffeeShop
+from config_jessdb import JessDBConfig
+from async_jessdb import AsyncJessDBCoffeeShop
+from passwords_jessdb import PasswordHasherBusy
+import metrics_jessdb as metrics
+from api_common_jessdb import (BULK_ORDER_LIMIT, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SSE_KEEPALIVE_SECONDS,
+                               SSE_RETRY_MS, STREAM_BATCH_SIZE, StreamEncoder, bearer_token,
+                               category_to_dict, customer_report_to_dict, customer_to_dict,
+                               member_denial, member_to_dict, order_item_to_dict, order_to_dict,
+                               order_with_items_to_dict, parse_id_list, parse_last_event_id,
+                               parse_stream_mode, product_report_to_dict, product_to_dict,
+                               sales_row_to_dict, sse_event, stream_mimetype)
+
+app = Quart(__name__)
+if cors is not None:
+    app = cors(app, allow_origin='*')
+
+# 初始化数据库（连接池与 PRAGMA 配置可通过 JESSDB_* 环境变量调整）；
+# 数据库线程数与连接池大小一致
+db = AsyncJessDBCoffeeShop(JessDBCoffeeShop(config=JessDBConfig.from_env()))
+# 启动时预热后厨队列的活跃订单索引
+db.shop.active_orders.warm()
+
+metrics.REGISTRY.gauge('jessdb_pool_connections', '连接池连接数', ['state'], lambda: {
+    ('open',): db.db_manager.pool.stats()['open'],
+    ('idle',): db.db_manager.pool.stats()['idle'],
+})
+
+
+def json_response(payload, status=200):
+    """jsonify 并把序列化耗时计入 Server-Timing 的 json 阶段"""
+    with metrics.phase('json'):
+        response = jsonify(payload)
+    response.status_code = status
+    return response
+
+
+def error_response(e, status=500):
+    return json_response({'success': False, 'error': str(e)}, status)
+
+
+@app.before_request
+async def start_request_timing():
+    metrics.begin_request()
+
+
+@app.after_request
+async def add_server_timing(response):
+    """记录请求耗时并输出 Server-Timing（流式响应只统计到开始输出为止）"""
+    timings = metrics.end_request()
+    if timings is not None:
+        total = time.perf_counter() - timings.started
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_DURATION.observe(total, endpoint, request.method, str(response.status_code))
+        response.headers['Server-Timing'] = timings.server_timing(total)
+    return response
+
+
+@app.after_serving
+async def close_database():
+    db.close()
+
+
+def stream_mode():
+    return parse_stream_mode(request.args.get('stream'))
+
+
+def include_items():
+    """?include=items 时订单列表附带每个订单的订单项"""
+    return 'items' in request.args.get('include', '').split(',')
+
+
+def member_denied(customer_id):
+    """会员专属数据：校验 Authorization: Bearer 令牌（只查内存），未登录或非本人时返回错误响应"""
+    claims = db.shop.sessions.verify(bearer_token(request.headers.get('Authorization')))
+    denial = member_denial(claims, customer_id)
+    if denial is None:
+        return None
+    status, message = denial
+    return json_response({'success': False, 'error': message}, status)
+
+
+async def stream_rows(iter_method, to_dict, mode, *args, **kwargs):
+    """异步逐批输出 iter_* 方法的结果，格式与 app_jessdb.stream_rows 相同"""
+    batches = db.iter_batches(iter_method, *args, batch_size=STREAM_BATCH_SIZE, **kwargs)
+    # 先取第一批：查询本身出错时仍能返回正常的错误响应
+    try:
+        first_batch = await batches.__anext__()
+    except StopAsyncIteration:
+        first_batch = None
+
+    async def generate():
+        encoder = StreamEncoder(to_dict, mode)
+        try:
+            yield encoder.start()
+            if first_batch is not None:
+                yield encoder.batch(first_batch)
+                async for batch in batches:
+                    yield encoder.batch(batch)
+            yield encoder.end()
+        finally:
+            # 客户端断开时 Quart 会关闭响应体，这里随之结束后台读取、归还连接
+            await batches.aclose()
+
+    return Response(generate(), mimetype=stream_mimetype(mode))
+
+
+@app.route('/')
+async def index():
+    """主页"""
+    return await render_template('index.html')
+
+@app.route('/admin')
+async def admin():
+    """管理页面"""
+    return await render_template('admin.html')
+
+# API路由
+
+# 菜单接口序列化结果缓存：key -> (etag, JSON 文本)，ETag 不变时直接复用
+_menu_responses = {}
+
+
+async def menu_response(key, load_rows, to_dict):
+    """带 ETag 的菜单响应：If-None-Match 命中时返回 304，不查库也不重新序列化"""
+    etag = await db.menu_etag(key)
+    if request.if_none_match.contains(etag):
+        response = Response('', status=304)
+    else:
+        cached = _menu_responses.get(key)
+        if cached is None or cached[0] != etag:
+            data = [to_dict(row) for row in await load_rows()]
+            with metrics.phase('json'):
+                body = json.dumps({'success': True, 'data': data}, ensure_ascii=False)
+            cached = (etag, body)
+            _menu_responses[key] = cached
+        response = Response(cached[1], mimetype='application/json')
+    response.set_etag(etag)
+    # 允许浏览器缓存，但每次使用前都需带 If-None-Match 重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/products', methods=['GET'])
+async def get_products():
+    """获取所有产品"""
+    try:
+        return await menu_response('products', db.get_all_products, product_to_dict)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/categories', methods=['GET'])
+async def get_categories():
+    """获取所有分类"""
+    try:
+        return await menu_response('categories', db.get_categories, category_to_dict)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/customers', methods=['POST'])
+async def create_customer():
+    """创建客户"""
+    try:
+        data = await request.get_json()
+        customer_id = await db.create_customer(
+            name=data['name'],
+            phone=data.get('phone', ''),
+            email=data.get('email', ''),
+            address=data.get('address', ''),
+            customer_type=data.get('customer_type', 'GUEST')
+        )
+
+        # 如果是会员类型，创建会员记录
+        if data.get('customer_type') == 'MEMBER' and data.get('password'):
+            await db.create_member_customer(
+                customer_id=customer_id,
+                password=data['password'],
+                date_of_birth=data.get('date_of_birth')
+            )
+
+        return json_response({'success': True, 'customer_id': customer_id})
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/customers/<int:customer_id>', methods=['GET'])
+async def get_customer(customer_id):
+    """获取客户信息（仅限本人，需要会员令牌）"""
+    try:
+        denied = member_denied(customer_id)
+        if denied:
+            return denied
+        customer = await db.get_customer_by_id(customer_id)
+        if customer:
+            return json_response({'success': True, 'data': customer_to_dict(customer)})
+        return json_response({'success': False, 'error': '客户不存在'}, 404)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/members', methods=['GET'])
+async def get_members():
+    """获取会员列表"""
+    try:
+        members = await db.get_member_customers()
+        return json_response({'success': True, 'data': [member_to_dict(member) for member in members]})
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/members/login', methods=['POST'])
+async def member_login():
+    """会员登录，成功时返回会话令牌（之后的会员请求带 Authorization: Bearer <token>）"""
+    try:
+        data = await request.get_json()
+        member = await db.verify_member_login(data['email'], data['password'])
+        if member:
+            return json_response({'success': True, 'data': member})
+        return json_response({'success': False, 'error': '邮箱或密码错误'}, 401)
+    except PasswordHasherBusy as e:
+        return error_response(e, 503)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/members/logout', methods=['POST'])
+async def member_logout():
+    """会员登出：吊销请求所带的会话令牌"""
+    try:
+        if db.shop.sessions.revoke(bearer_token(request.headers.get('Authorization'))):
+            return json_response({'success': True})
+        return json_response({'success': False, 'error': '令牌无效或已过期'}, 401)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/orders', methods=['POST'])
+async def create_order():
+    """创建订单"""
+    try:
+        data = await request.get_json()
+
+        # 如果没有提供客户ID，创建新客户
+        customer_id = data.get('customer_id')
+        if not customer_id:
+            customer_id = await db.create_customer(
+                name=data['customer_name'],
+                phone=data.get('customer_phone', ''),
+                email=data.get('customer_email', ''),
+                address=data.get('customer_address', ''),
+                customer_type=data.get('customer_type', 'GUEST')
+            )
+
+        order_id = await db.create_order(
+            customer_id=customer_id,
+            payment_method=data['payment_method'],
+            order_items=data['items'],
+            status=data.get('status', 'PLACED')
+        )
+
+        return json_response({'success': True, 'order_id': order_id})
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/orders/bulk', methods=['POST'])
+async def create_orders_bulk():
+    """批量创建订单（POS 离线同步）"""
+    try:
+        data = await request.get_json()
+        orders = data.get('orders') if isinstance(data, dict) else None
+        if not isinstance(orders, list):
+            return json_response({'success': False, 'error': '请求体需要包含 orders 数组'}, 400)
+        if len(orders) > BULK_ORDER_LIMIT:
+            return json_response({'success': False, 'error': f'单次最多提交 {BULK_ORDER_LIMIT} 个订单'}, 413)
+
+        results = await db.create_orders_bulk(orders)
+
+        summary = {
+            'created': sum(1 for r in results if r['success'] and not r['duplicate']),
+            'duplicates': sum(1 for r in results if r['duplicate']),
+            'failed': sum(1 for r in results if not r['success'])
+        }
+        return json_response({'success': True, 'summary': summary, 'results': results})
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/orders', methods=['GET'])
+async def get_orders():
+    """获取订单历史（keyset 分页；stream 模式下导出全部匹配订单）"""
+    try:
+        filters = {
+            'customer_id': request.args.get('customer_id'),
+            'status': request.args.get('status'),
+            'start_date': request.args.get('start_date'),
+            'end_date': request.args.get('end_date')
+        }
+        if filters['customer_id']:
+            # 按会员过滤即会员查看自己的订单，需要本人的会员令牌
+            denied = member_denied(filters['customer_id'])
+            if denied:
+                return denied
+        mode = stream_mode()
+        if mode:
+            return await stream_rows(db.shop.iter_order_history, order_to_dict, mode,
+                                     limit=request.args.get('limit', type=int),
+                                     after=request.args.get('after'), **filters)
+
+        limit = min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int) or DEFAULT_PAGE_SIZE,
+                    MAX_PAGE_SIZE)
+        orders, next_cursor = await db.get_order_page(limit, after=request.args.get('after'), **filters)
+        items = await db.get_order_items_many([order[0] for order in orders]) if include_items() else None
+        with metrics.phase('convert'):
+            if items is None:
+                order_list = [order_to_dict(order) for order in orders]
+            else:
+                order_list = [order_with_items_to_dict((order, items[order[0]])) for order in orders]
+
+        return json_response({'success': True, 'data': order_list, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/orders/details', methods=['GET'])
+async def get_orders_details():
+    """批量获取订单及订单项：?ids=1,2,3（最多 MAX_PAGE_SIZE 个），按传入顺序返回，不存在的订单跳过"""
+    try:
+        entries = await db.get_order_details_many(parse_id_list(request.args.get('ids'), MAX_PAGE_SIZE))
+        with metrics.phase('convert'):
+            data = [order_with_items_to_dict(entry) for entry in entries]
+        return json_response({'success': True, 'data': data})
+    except ValueError as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/orders/<int:order_id>', methods=['PUT'])
+async def update_order_status(order_id):
+    """更新订单状态"""
+    try:
+        data = await request.get_json()
+        await db.update_order_status(order_id, data['status'])
+        return json_response({'success': True})
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/orders/events', methods=['GET'])
+async def order_events():
+    """订单事件流（SSE）：推送新订单和状态变更，支持 Last-Event-ID 断点续传"""
+    try:
+        feed = db.shop.order_events
+        last_id = parse_last_event_id(request.headers.get('Last-Event-ID'),
+                                      request.args.get('last_event_id'))
+        if last_id is None:
+            last_id = await db.run(feed.latest_id)
+        # 先补发断点之后的事件（可能需要读库），之后只在内存中检查新事件
+        backlog = await db.run(feed.events_after, last_id)
+    except ValueError as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e)
+
+    async def generate():
+        event_id = last_id
+        events = backlog
+        idle = 0.0
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while not feed.closed:
+            if events:
+                for event in events:
+                    yield sse_event(event)
+                event_id = events[-1][0]
+                idle = 0.0
+            elif idle >= SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                idle = 0.0
+            # 等待期间不占用数据库线程；有新事件时才到线程池里取（通常直接来自内存缓冲）
+            await asyncio.sleep(feed.poll_interval)
+            idle += feed.poll_interval
+            events = await db.run(feed.events_after, event_id) if feed.has_events_after(event_id) else []
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # 长连接，不受 Quart 默认响应超时限制
+    response.timeout = None
+    return response
+
+@app.route('/api/kitchen/queue', methods=['GET'])
+async def get_kitchen_queue():
+    """后厨队列：未完成订单按进入队列先后排列，附带订单项；读取内存中的活跃订单索引
+
+    只含最近 kitchen_max_age_hours 内下单的订单；?limit= 取队列最前面的若干个（默认 DEFAULT_PAGE_SIZE，
+    最多 MAX_PAGE_SIZE），total 为队列中的订单总数。
+    返回的 event_id 可作为 /api/orders/events 的 last_event_id，之后只接收增量变化。
+    """
+    try:
+        limit = min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int) or DEFAULT_PAGE_SIZE,
+                    MAX_PAGE_SIZE)
+        entries, event_id, total = await db.run(db.shop.active_orders.orders, limit)
+        with metrics.phase('convert'):
+            data = [order_with_items_to_dict(entry) for entry in entries]
+        return json_response({'success': True, 'data': data, 'event_id': event_id, 'total': total})
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/orders/<int:order_id>/details', methods=['GET'])
+async def get_order_details(order_id):
+    """获取订单详情"""
+    try:
+        items = await db.get_order_details(order_id)
+        return json_response({'success': True, 'data': [order_item_to_dict(item) for item in items]})
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/reports/sales', methods=['GET'])
+async def get_sales_report():
+    """获取销售报告"""
+    try:
+        report = await db.get_sales_report(request.args.get('start_date'), request.args.get('end_date'))
+        return json_response({'success': True, 'data': [sales_row_to_dict(row) for row in report]})
+    except ValueError as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/reports/products', methods=['GET'])
+async def get_product_sales_report():
+    """获取产品销售报告（可选 start_date、end_date、top_n）"""
+    try:
+        filters = {
+            'start_date': request.args.get('start_date'),
+            'end_date': request.args.get('end_date'),
+            'top_n': request.args.get('top_n', type=int)
+        }
+        mode = stream_mode()
+        if mode:
+            return await stream_rows(db.shop.iter_product_sales_report, product_report_to_dict, mode,
+                                     **filters)
+
+        report = await db.get_product_sales_report(**filters)
+        with metrics.phase('convert'):
+            report_data = [product_report_to_dict(row) for row in report]
+        return json_response({'success': True, 'data': report_data})
+    except ValueError as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/reports/customers', methods=['GET'])
+async def get_customer_report():
+    """获取客户报告"""
+    try:
+        mode = stream_mode()
+        if mode:
+            return await stream_rows(db.shop.iter_customer_report, customer_report_to_dict, mode)
+
+        report = await db.get_customer_report()
+        with metrics.phase('convert'):
+            report_data = [customer_report_to_dict(row) for row in report]
+        return json_response({'success': True, 'data': report_data})
+    except Exception as e:
+        return error_response(e)
+
+# 数据库状态检查
+@app.route('/api/database/status', methods=['GET'])
+async def database_status():
+    """检查数据库状态"""
+    try:
+        def table_counts():
+            status = {}
+            tables = ['customer', 'member_customers', 'category', 'product', 'orders', 'order_items']
+            with db.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                for table in tables:
+                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                    status[table] = cursor.fetchone()[0]
+            return status
+
+        status = await db.run(table_counts)
+        pragmas = await db.run(db.db_manager.pragma_status)
+        return json_response({'success': True, 'data': status, 'pool': db.db_manager.pool.stats(),
+                              'pragmas': pragmas, 'db_threads': db.max_workers})
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+async def get_slow_queries():
+    """最慢的语句（按 SQL 指纹汇总），?sort=total|max|count&limit=N"""
+    try:
+        slow_queries = db.db_manager.slow_queries
+        if slow_queries is None:
+            return json_response({'success': True, 'enabled': False, 'data': []})
+        limit = min(request.args.get('limit', 20, type=int) or 20, MAX_PAGE_SIZE)
+        data = slow_queries.worst(limit, request.args.get('sort', 'total'))
+        return json_response({'success': True, 'enabled': True,
+                              'threshold_ms': db.db_manager.config.slow_query_ms, 'data': data})
+    except ValueError as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+async def reset_slow_queries():
+    """清空慢查询汇总（日志文件不受影响）"""
+    if db.db_manager.slow_queries is not None:
+        db.db_manager.slow_queries.reset()
+    return json_response({'success': True})
+
+@app.route('/healthz', methods=['GET'])
+async def liveness():
+    """存活检查：进程能处理请求即可，不访问数据库"""
+    return json_response({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/readyz', methods=['GET'])
+async def readiness():
+    """就绪检查：能从连接池借到连接、数据库可查询且迁移已全部应用，否则返回 503"""
+    try:
+        version = await db.run(db.db_manager.schema_version)
+        latest = db.db_manager.latest_schema_version()
+        body = {'schema_version': version, 'pool': db.db_manager.pool.stats(), 'pid': os.getpid()}
+        if version < latest:
+            return json_response(dict(body, status='migrating'), 503)
+        return json_response(dict(body, status='ready'))
+    except Exception as e:
+        return json_response({'status': 'unavailable', 'error': str(e), 'pid': os.getpid()}, 503)
+
+@app.route('/api/metrics', methods=['GET'])
+async def get_metrics():
+    """Prometheus 文本格式的运行指标（SQL、方法、连接池、HTTP 耗时直方图）"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,127 @@
+"""
+JessDBCoffeeShop 的 asyncio 包装
+
+sqlite3 本身是阻塞的，这里把每次数据库调用放到专用线程池中执行，事件循环线程只负责调度，
+一个慢报表不会挡住同一进程里的其他请求。线程数默认等于连接池大小，多开线程只会在连接池上排队。
+
+    adb = AsyncJessDBCoffeeShop(JessDBCoffeeShop(config=...))
+    rows = await adb.get_order_history(customer_id=1)
+    order_id = await adb.create_order(...)       # 写操作经 shop.writes 的写线程执行
+    async for batch in adb.iter_batches(adb.shop.iter_customer_report, batch_size=500):
+        ...
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from itertools import islice
+
+from writer_jessdb import WRITE_METHODS
+
+
+class AsyncJessDBCoffeeShop:
+    """把 JessDBCoffeeShop 的公共方法包装成协程：await adb.method(...) 在线程池中执行 shop.method(...)"""
+
+    def __init__(self, shop, max_workers=None):
+        self.shop = shop
+        self.db_manager = shop.db_manager
+        self.max_workers = max_workers or shop.db_manager.config.pool_size
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                           thread_name_prefix='jessdb-db')
+
+    async def run(self, func, *args, **kwargs):
+        """在线程池中执行任意同步函数；复制当前上下文，请求计时等 ContextVar 在工作线程中同样可见"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    def __getattr__(self, name):
+        attr = getattr(self.shop, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        if name in WRITE_METHODS:
+            # 写操作交给 shop.writes 的写线程批量提交，不占用数据库线程池
+            # （需要密码哈希的先在密码哈希线程池中计算，同样不阻塞事件循环）
+            submit = getattr(self.shop.writes, name)
+
+            @functools.wraps(attr)
+            async def write(*args, **kwargs):
+                return await asyncio.wrap_future(submit(*args, **kwargs))
+            return write
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return method
+
+    async def create_orders_bulk(self, orders, chunk_size=500):
+        """批量写入订单：校验在事件循环中完成，各块依次交给写队列，等待期间不占用数据库线程"""
+        results, chunks = self.shop.prepare_orders_bulk(orders, chunk_size)
+        for valid in chunks:
+            for index, result in await asyncio.wrap_future(self.shop.writes.create_orders_chunk(valid)):
+                results[index] = result
+        return results
+
+    async def iter_batches(self, iter_method, *args, batch_size=500, queue_size=2, **kwargs):
+        """异步逐批读取 iter_* 方法的结果
+
+        iter_* 生成器在整个迭代期间持有一个池连接，而连接池按线程记录借出的连接，
+        所以生成器必须从头到尾在同一个线程里推进：这里占用一个工作线程跑完它，
+        通过有界队列把批次交给事件循环（消费慢时生产方阻塞）。
+        消费方提前退出（客户端断开）时通知工作线程，由它在自己的线程里关闭生成器、归还连接；
+        提前 break 的调用方应配合 contextlib.aclosing 使用，以便立即而不是等垃圾回收时收尾。
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not stop.is_set():
+                try:
+                    return future.result(timeout=0.5)
+                except FutureTimeoutError:
+                    continue
+            future.cancel()
+
+        def produce():
+            rows = None
+            try:
+                rows = iter_method(*args, batch_size=batch_size, **kwargs)
+                while not stop.is_set():
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    put(batch)
+                put(done)
+            except BaseException as e:
+                put(e)
+            finally:
+                if rows is not None:
+                    rows.close()
+
+        producer = asyncio.ensure_future(self.run(produce))
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # 清空队列，让可能阻塞在 put 上的工作线程尽快退出
+            while not queue.empty():
+                queue.get_nowait()
+            await producer
+
+    def close(self):
+        self.shop.writes.close()
+        self.executor.shutdown(wait=True)
+        self.shop.db_manager.close()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+日期范围查询基准
+
+生成大量订单（默认 100 万，分布在约三年内）后，对 30 天的销售统计比较三种写法：
+
+- legacy:   DATE(o.order_date) >= ? AND DATE(o.order_date) <= ?（列上套函数，只能全表扫描）
+- sargable: o.order_date >= ? AND o.order_date < ?（半开区间，走 idx_orders_date）
+- rollup:   get_sales_report() 读取 daily_sales 汇总表
+
+用法:
+    python benchmarks/bench_date_range.py --orders 1000000 --db /tmp/bench_1m.db
+已存在的 --db 文件会直接复用，不重复生成数据。
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_jessdb import JessDBConfig
+from database_jessdb import JessDBCoffeeShop, day_range
+
+LEGACY_QUERY = """
+    SELECT DATE(o.order_date), COUNT(o.order_id), SUM(o.total_amount), AVG(o.total_amount)
+    FROM orders o
+    WHERE DATE(o.order_date) >= ? AND DATE(o.order_date) <= ?
+    GROUP BY DATE(o.order_date) ORDER BY 1 DESC
+"""
+
+SARGABLE_QUERY = """
+    SELECT DATE(o.order_date), COUNT(o.order_id), SUM(o.total_amount), AVG(o.total_amount)
+    FROM orders o
+    WHERE o.order_date >= ? AND o.order_date < ?
+    GROUP BY DATE(o.order_date) ORDER BY 1 DESC
+"""
+
+
+def populate(shop, count, days, seed=42):
+    """按时间顺序写入 count 个订单，均匀分布在最近 days 天内"""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=days)
+    step = days * 86400 / count
+    batch = []
+    with shop.db_manager.transaction() as conn:
+        cursor = conn.cursor()
+        for i in range(count):
+            order_date = start + timedelta(seconds=i * step)
+            batch.append((rng.randint(1, 16), order_date.strftime('%Y-%m-%d %H:%M:%S'),
+                          'COMPLETED', 'CASH', rng.randint(20, 200)))
+            if len(batch) == 50000:
+                cursor.executemany(
+                    "INSERT INTO orders (customer_id, order_date, status, payment_method, total_amount) "
+                    "VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                "INSERT INTO orders (customer_id, order_date, status, payment_method, total_amount) "
+                "VALUES (?, ?, ?, ?, ?)", batch)
+        conn.execute("ANALYZE")
+
+
+def timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='30 天销售统计：DATE() 过滤 vs 半开区间 vs 汇总表')
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=1095, help='订单分布的天数')
+    parser.add_argument('--window', type=int, default=30, help='查询窗口天数')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', help='数据库文件，已存在则复用')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='jessdb-bench-'), 'date_range.db')
+    existed = os.path.exists(db_path)
+    shop = JessDBCoffeeShop(config=JessDBConfig(db_path=db_path))
+    if not existed:
+        started = time.perf_counter()
+        populate(shop, args.orders, args.days)
+        print(f"生成 {args.orders} 个订单用时 {time.perf_counter() - started:.1f}s -> {db_path}")
+
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=args.window - 1)
+    lower, upper = day_range(start.isoformat(), end.isoformat())
+
+    with shop.db_manager.connection() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        cases = [
+            ('legacy', LEGACY_QUERY, (start.isoformat(), end.isoformat())),
+            ('sargable', SARGABLE_QUERY, (lower, upper)),
+        ]
+        results = {}
+        print(f"orders={total}  window={start}..{end}")
+        for name, query, params in cases:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+            elapsed, rows = timed(lambda: conn.execute(query, params).fetchall(), args.repeat)
+            results[name] = rows
+            print(f"{name:9s} {elapsed * 1000:9.2f} ms  rows={len(rows)}  plan={'; '.join(plan)}")
+
+    elapsed, rows = timed(lambda: shop.get_sales_report(start.isoformat(), end.isoformat()), args.repeat)
+    print(f"{'rollup':9s} {elapsed * 1000:9.2f} ms  rows={len(rows)}  (daily_sales)")
+
+    if results['legacy'] != results['sargable']:
+        print("警告：legacy 与 sargable 结果不一致", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
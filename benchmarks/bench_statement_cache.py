@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+语句缓存微基准
+
+对 get_customer_by_id 和 get_order_details 比较三种方式的单次调用耗时：
+
+- per-call:   每次调用新开连接执行同一条 SQL（改造前的做法，每次都要打开文件并重新编译语句）
+- no-cache:   连接池连接，但 cached_statements=0，每次调用重新编译语句
+- cached:     连接池连接 + 命名语句 + cached_statements（默认配置）
+
+用法:
+    python benchmarks/bench_statement_cache.py --db /tmp/bench.db --calls 20000
+不指定 --db 时使用临时目录中的新库（只有示例数据）。
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_jessdb import JessDBConfig
+from database_jessdb import STATEMENTS, JessDBCoffeeShop
+
+
+def per_call(db_path, statement):
+    def call(key):
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute(STATEMENTS[statement], (key,)).fetchall()
+        finally:
+            conn.close()
+    return call
+
+
+def measure(fn, keys):
+    started = time.perf_counter()
+    for key in keys:
+        fn(key)
+    return (time.perf_counter() - started) / len(keys) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='命名语句 + cached_statements 微基准')
+    parser.add_argument('--db', help='数据库文件')
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--metrics', action='store_true', help='同时开启 SQL 指标（默认关闭以排除其开销）')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='jessdb-bench-'), 'statements.db')
+    cached = JessDBCoffeeShop(config=JessDBConfig(db_path=db_path, metrics_enabled=args.metrics))
+    uncached = JessDBCoffeeShop(config=JessDBConfig(db_path=db_path, metrics_enabled=args.metrics,
+                                                    statement_cache_size=0))
+
+    with cached.db_manager.connection() as conn:
+        max_customer = conn.execute("SELECT MAX(customer_id) FROM customer").fetchone()[0] or 1
+        max_order = conn.execute("SELECT MAX(order_id) FROM orders").fetchone()[0] or 1
+    rng = random.Random(args.seed)
+    customer_keys = [rng.randint(1, max_customer) for _ in range(args.calls)]
+    order_keys = [rng.randint(1, max_order) for _ in range(args.calls)]
+
+    cases = [
+        ('get_customer_by_id', 'customer_by_id', customer_keys,
+         lambda shop: shop.get_customer_by_id),
+        ('get_order_details', 'order_details', order_keys,
+         lambda shop: shop.get_order_details),
+    ]
+    print(f"db={db_path}  calls={args.calls}  metrics={'on' if args.metrics else 'off'}")
+    print(f"{'method':20s} {'per-call':>12s} {'no-cache':>12s} {'cached':>12s}   (us/call)")
+    for name, statement, keys, method in cases:
+        # 预热：每个池连接编译一次语句
+        for fn in (method(uncached), method(cached)):
+            measure(fn, keys[:100])
+        results = [
+            measure(per_call(db_path, statement), keys[:max(1, len(keys) // 10)]),
+            measure(method(uncached), keys),
+            measure(method(cached), keys),
+        ]
+        print(f"{name:20s} " + ' '.join(f"{value:12.1f}" for value in results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+WAL 并发读写基准
+
+在同一个数据库上运行一个持续下单的写线程和若干读线程，
+分别使用 SQLite 默认回滚日志配置和 JessDBConfig 默认（WAL）配置，
+对比读请求的延迟分布以及因锁等待而失败的次数。
+
+用法:
+    python benchmarks/bench_wal_concurrency.py --readers 8 --duration 5
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_jessdb import JessDBConfig
+from database_jessdb import JessDBCoffeeShop
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def preload_orders(shop, count):
+    """预先写入一批订单，让读查询有一定的数据量"""
+    with shop.db_manager.transaction() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT INTO orders (customer_id, status, payment_method, total_amount) VALUES (?, ?, ?, ?)",
+            [(random.randint(1, 10), 'COMPLETED', 'CASH', random.randint(20, 200)) for _ in range(count)]
+        )
+
+
+def run_profile(name, config, readers, duration, preload):
+    workdir = tempfile.mkdtemp(prefix='jessdb-bench-')
+    config.db_path = os.path.join(workdir, 'bench.db')
+    config.pool_size = readers + 2
+    shop = JessDBCoffeeShop(config=config)
+    preload_orders(shop, preload)
+
+    stop = threading.Event()
+    read_latencies = []
+    read_errors = [0]
+    writes = [0]
+    write_errors = [0]
+    lock = threading.Lock()
+
+    def writer():
+        while not stop.is_set():
+            items = [{'product_id': random.randint(1, 12), 'quantity': random.randint(1, 3)}
+                     for _ in range(random.randint(1, 5))]
+            try:
+                shop.create_order(random.randint(1, 10), 'cash', items)
+                writes[0] += 1
+            except sqlite3.OperationalError:
+                write_errors[0] += 1
+
+    def reader():
+        local = []
+        errors = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                if random.random() < 0.7:
+                    shop.get_order_history(random.randint(1, 10))
+                else:
+                    shop.get_sales_report()
+            except sqlite3.OperationalError:
+                errors += 1
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            read_latencies.extend(local)
+            read_errors[0] += errors
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    pragmas = shop.db_manager.pragma_status()
+    shop.db_manager.close()
+
+    read_latencies.sort()
+    return {
+        'profile': name,
+        'journal_mode': pragmas.get('journal_mode'),
+        'reads_per_sec': len(read_latencies) / duration,
+        'writes_per_sec': writes[0] / duration,
+        'read_p50_ms': percentile(read_latencies, 50) * 1000,
+        'read_p95_ms': percentile(read_latencies, 95) * 1000,
+        'read_p99_ms': percentile(read_latencies, 99) * 1000,
+        'read_max_ms': (read_latencies[-1] if read_latencies else 0) * 1000,
+        'read_lock_errors': read_errors[0],
+        'write_lock_errors': write_errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比回滚日志与 WAL 下的并发读写')
+    parser.add_argument('--readers', type=int, default=8, help='读线程数')
+    parser.add_argument('--duration', type=float, default=5.0, help='每种配置运行秒数')
+    parser.add_argument('--preload', type=int, default=20000, help='预置订单数')
+    parser.add_argument('--busy-timeout-ms', type=int, default=5000)
+    args = parser.parse_args()
+
+    profiles = [
+        ('rollback', JessDBConfig.legacy(busy_timeout_ms=args.busy_timeout_ms)),
+        ('wal', JessDBConfig(busy_timeout_ms=args.busy_timeout_ms)),
+    ]
+    results = [run_profile(name, config, args.readers, args.duration, args.preload)
+               for name, config in profiles]
+
+    columns = ['profile', 'journal_mode', 'reads_per_sec', 'writes_per_sec', 'read_p50_ms',
+               'read_p95_ms', 'read_p99_ms', 'read_max_ms', 'read_lock_errors', 'write_lock_errors']
+    print(' | '.join(columns))
+    for row in results:
+        print(' | '.join(f"{row[c]:.2f}" if isinstance(row[c], float) else str(row[c])
+                         for c in columns))
+
+
+if __name__ == '__main__':
+    main()
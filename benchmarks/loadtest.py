@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+JessDB API 负载测试
+
+对 app_jessdb.app 按预设的请求组合（read / write / report / mixed）施压，
+统计每个接口的吞吐量与 p50/p95/p99 延迟，并把结果保存为 JSON 以便前后对比。
+
+用法:
+    # 进程内通过 Flask test client 压测（JESSDB_PATH 指向的库，建议先用 demo_data_jessdb.py 生成数据）
+    python benchmarks/loadtest.py run --db /tmp/bench.db --mix mixed --threads 8 --duration 30 \\
+        --output results/mixed.json
+    # 压测已启动的服务
+    python benchmarks/loadtest.py run --url http://127.0.0.1:5000 --mix read
+    # 对比两次结果
+    python benchmarks/loadtest.py compare results/before.json results/after.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 请求组合：(接口名, 权重)。接口名对应 REQUESTS 中的构造函数
+MIXES = {
+    'read': [
+        ('GET /api/products', 50),
+        ('GET /api/categories', 10),
+        ('GET /api/orders', 20),
+        ('GET /api/orders?customer_id', 10),
+        ('GET /api/orders/<id>/details', 10),
+    ],
+    'write': [
+        ('POST /api/orders', 70),
+        ('PUT /api/orders/<id>', 25),
+        ('POST /api/orders/bulk', 5),
+    ],
+    'report': [
+        ('GET /api/reports/sales', 40),
+        ('GET /api/reports/products', 30),
+        ('GET /api/reports/customers', 30),
+    ],
+    'mixed': [
+        ('GET /api/products', 40),
+        ('GET /api/categories', 5),
+        ('GET /api/orders', 10),
+        ('GET /api/orders?customer_id', 10),
+        ('GET /api/orders/<id>/details', 10),
+        ('POST /api/orders', 15),
+        ('PUT /api/orders/<id>', 5),
+        ('GET /api/reports/sales', 3),
+        ('GET /api/reports/products', 1),
+        ('GET /api/reports/customers', 1),
+    ],
+}
+
+
+class Workload:
+    """根据数据库现有规模随机构造请求参数"""
+
+    def __init__(self, max_customer_id, max_order_id, product_ids, seed, sessions=None):
+        self.max_customer_id = max(1, max_customer_id)
+        self.max_order_id = max(1, max_order_id)
+        self.product_ids = product_ids or [1]
+        self.seed = seed
+        # 会员专属接口需要会话令牌：直接用同一数据库的签名密钥为每个客户签发一次
+        self.sessions = sessions
+        self._tokens = {}
+        self._local = threading.local()
+
+    @property
+    def rng(self):
+        rng = getattr(self._local, 'rng', None)
+        if rng is None:
+            rng = self._local.rng = random.Random(f"{self.seed}-{threading.get_ident()}")
+        return rng
+
+    def _member_headers(self, customer_id):
+        if self.sessions is None:
+            return None
+        token = self._tokens.get(customer_id)
+        if token is None:
+            token = self._tokens[customer_id] = self.sessions.issue(customer_id)[0]
+        return {'Authorization': f'Bearer {token}'}
+
+    def _items(self):
+        count = self.rng.randint(1, 4)
+        return [{'product_id': product_id, 'quantity': self.rng.randint(1, 3)}
+                for product_id in self.rng.sample(self.product_ids, min(count, len(self.product_ids)))]
+
+    def build(self, name):
+        """返回 (method, path, json_body, headers)"""
+        if name == 'GET /api/orders?customer_id':
+            customer_id = self.rng.randint(1, self.max_customer_id)
+            return ('GET', f'/api/orders?limit=50&customer_id={customer_id}', None,
+                    self._member_headers(customer_id))
+        return self._build(name) + (None,)
+
+    def _build(self, name):
+        rng = self.rng
+        if name == 'GET /api/products':
+            return 'GET', '/api/products', None
+        if name == 'GET /api/categories':
+            return 'GET', '/api/categories', None
+        if name == 'GET /api/orders':
+            return 'GET', '/api/orders?limit=50', None
+        if name == 'GET /api/orders/<id>/details':
+            return 'GET', f'/api/orders/{rng.randint(1, self.max_order_id)}/details', None
+        if name == 'POST /api/orders':
+            return 'POST', '/api/orders', {
+                'customer_id': rng.randint(1, self.max_customer_id),
+                'payment_method': rng.choice(['CASH', 'ALIPAY', 'CREDIT CARD']),
+                'items': self._items(),
+            }
+        if name == 'PUT /api/orders/<id>':
+            return 'PUT', f'/api/orders/{rng.randint(1, self.max_order_id)}', {
+                'status': rng.choice(['PLACED', 'COMPLETED'])}
+        if name == 'POST /api/orders/bulk':
+            return 'POST', '/api/orders/bulk', {'orders': [{
+                'idempotency_key': f'loadtest-{rng.getrandbits(64):x}',
+                'customer_id': rng.randint(1, self.max_customer_id),
+                'payment_method': 'CASH',
+                'items': self._items(),
+            } for _ in range(50)]}
+        if name == 'GET /api/reports/sales':
+            end = date.today()
+            start = end - timedelta(days=rng.choice([7, 30, 90]))
+            return 'GET', f'/api/reports/sales?start_date={start}&end_date={end}', None
+        if name == 'GET /api/reports/products':
+            return 'GET', '/api/reports/products', None
+        if name == 'GET /api/reports/customers':
+            return 'GET', '/api/reports/customers', None
+        raise KeyError(name)
+
+
+class FlaskClientTarget:
+    """进程内通过 Flask test client 发请求，每个线程一个 client"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers)
+        response.get_data()
+        return response.status_code
+
+
+class HTTPTarget:
+    """通过 HTTP 请求已启动的服务"""
+
+    def __init__(self, base_url, timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, body, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = dict(headers or {})
+        if data:
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def percentile(sorted_values, pct):
+    """最近秩法百分位"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, errors, elapsed):
+    endpoints = {}
+    for name in sorted(set(samples) | set(errors)):
+        latencies = sorted(samples.get(name, []))
+        count = len(latencies)
+        endpoints[name] = {
+            'requests': count,
+            'errors': errors.get(name, 0),
+            'throughput_rps': count / elapsed if elapsed else 0.0,
+            'mean_ms': (sum(latencies) / count * 1000) if count else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': (latencies[-1] * 1000) if count else 0.0,
+        }
+    total = sum(item['requests'] for item in endpoints.values())
+    return {
+        'total_requests': total,
+        'total_errors': sum(item['errors'] for item in endpoints.values()),
+        'throughput_rps': total / elapsed if elapsed else 0.0,
+        'endpoints': endpoints,
+    }
+
+
+def run_load(target, workload, mix, threads, duration, warmup=0.0):
+    names = [name for name, _ in MIXES[mix]]
+    weights = [weight for _, weight in MIXES[mix]]
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    measure_from = time.perf_counter() + warmup
+
+    def worker():
+        local_samples = {}
+        local_errors = {}
+        while not stop.is_set():
+            name = workload.rng.choices(names, weights)[0]
+            method, path, body, headers = workload.build(name)
+            started = time.perf_counter()
+            try:
+                status = target.request(method, path, body, headers)
+                ok = status < 400
+            except Exception:
+                ok = False
+            finished = time.perf_counter()
+            if started < measure_from:
+                continue
+            if ok:
+                local_samples.setdefault(name, []).append(finished - started)
+            else:
+                local_errors[name] = local_errors.get(name, 0) + 1
+        with lock:
+            for name, values in local_samples.items():
+                samples.setdefault(name, []).extend(values)
+            for name, value in local_errors.items():
+                errors[name] = errors.get(name, 0) + value
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    time.sleep(warmup + duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    return summarize(samples, errors, duration)
+
+
+def inspect_database(db):
+    with db.db_manager.connection() as conn:
+        max_customer_id = conn.execute("SELECT COALESCE(MAX(customer_id), 1) FROM customer").fetchone()[0]
+        max_order_id = conn.execute("SELECT COALESCE(MAX(order_id), 1) FROM orders").fetchone()[0]
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ('customer', 'orders', 'order_items')}
+    product_ids = [row[0] for row in db.get_all_products()]
+    return max_customer_id, max_order_id, product_ids, counts
+
+
+def command_run(args):
+    if args.url:
+        # 远程服务：直接打开同一个数据库文件读取规模信息
+        from config_jessdb import JessDBConfig
+        from database_jessdb import JessDBCoffeeShop
+        db = JessDBCoffeeShop(config=JessDBConfig.from_env(**({'db_path': args.db} if args.db else {})))
+        target = HTTPTarget(args.url)
+    else:
+        if args.db:
+            os.environ['JESSDB_PATH'] = args.db
+        import app_jessdb
+        db = app_jessdb.db
+        target = FlaskClientTarget(app_jessdb.app)
+
+    max_customer_id, max_order_id, product_ids, counts = inspect_database(db)
+    workload = Workload(max_customer_id, max_order_id, product_ids, args.seed, sessions=db.sessions)
+    mixes = list(MIXES) if args.mix == 'all' else [args.mix]
+
+    result = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'target': args.url or 'flask-test-client',
+        'database': db.db_manager.db_path,
+        'dataset': counts,
+        'threads': args.threads,
+        'duration_s': args.duration,
+        'seed': args.seed,
+        'mixes': {},
+    }
+    for mix in mixes:
+        summary = run_load(target, workload, mix, args.threads, args.duration, args.warmup)
+        result['mixes'][mix] = summary
+        print_summary(mix, summary)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+    return 0
+
+
+def print_summary(mix, summary):
+    print(f"\n== {mix}: {summary['total_requests']} 请求, {summary['throughput_rps']:.1f} req/s, "
+          f"{summary['total_errors']} 错误")
+    print(f"{'endpoint':34s} {'req/s':>9s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s} {'err':>5s}")
+    for name, item in summary['endpoints'].items():
+        print(f"{name:34s} {item['throughput_rps']:9.1f} {item['p50_ms']:8.2f} {item['p95_ms']:8.2f} "
+              f"{item['p99_ms']:8.2f} {item['max_ms']:8.2f} {item['errors']:5d}")
+
+
+def command_compare(args):
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+
+    for mix, new_summary in after['mixes'].items():
+        old_summary = before['mixes'].get(mix)
+        if not old_summary:
+            continue
+        print(f"\n== {mix}: {old_summary['throughput_rps']:.1f} -> {new_summary['throughput_rps']:.1f} req/s "
+              f"({change(old_summary['throughput_rps'], new_summary['throughput_rps'])})")
+        print(f"{'endpoint':34s} {'p50':>20s} {'p95':>20s} {'p99':>20s}")
+        for name, new in new_summary['endpoints'].items():
+            old = old_summary['endpoints'].get(name)
+            if not old:
+                continue
+            cells = [f"{old[key]:.1f}->{new[key]:.1f} {change(old[key], new[key]):>7s}"
+                     for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+            print(f"{name:34s} " + ' '.join(f"{cell:>20s}" for cell in cells))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='JessDB API 负载测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='运行负载测试')
+    run.add_argument('--db', help='数据库文件（进程内模式下设置 JESSDB_PATH）')
+    run.add_argument('--url', help='压测已启动的服务，例如 http://127.0.0.1:5000')
+    run.add_argument('--mix', choices=list(MIXES) + ['all'], default='mixed')
+    run.add_argument('--threads', type=int, default=8)
+    run.add_argument('--duration', type=float, default=10.0, help='每种组合的测量秒数')
+    run.add_argument('--warmup', type=float, default=1.0, help='预热秒数（不计入统计）')
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--output', help='结果 JSON 路径')
+
+    compare = subparsers.add_parser('compare', help='对比两次结果')
+    compare.add_argument('before')
+    compare.add_argument('after')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return command_run(args)
+    return command_compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import os
+
+
+def _env_bool(value):
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class JessDBConfig:
+    """JessDB 数据库配置
+
+    连接池大小和每个连接建立时执行的 PRAGMA 都在这里集中配置，
+    app_jessdb.py 通过 from_env() 读取环境变量覆盖默认值。
+    """
+
+    # 环境变量名 -> (属性名, 类型转换)
+    ENV_VARS = {
+        'JESSDB_PATH': ('db_path', str),
+        'JESSDB_POOL_SIZE': ('pool_size', int),
+        'JESSDB_POOL_TIMEOUT': ('pool_timeout', float),
+        'JESSDB_HEALTH_CHECK_INTERVAL': ('health_check_interval', float),
+        'JESSDB_JOURNAL_MODE': ('journal_mode', str),
+        'JESSDB_SYNCHRONOUS': ('synchronous', str),
+        'JESSDB_BUSY_TIMEOUT_MS': ('busy_timeout_ms', int),
+        'JESSDB_MMAP_SIZE': ('mmap_size', int),
+        'JESSDB_CACHE_SIZE': ('cache_size', int),
+        'JESSDB_TEMP_STORE': ('temp_store', str),
+        'JESSDB_FOREIGN_KEYS': ('foreign_keys', str),
+        'JESSDB_MENU_CACHE_TTL': ('menu_cache_ttl', float),
+        'JESSDB_STATEMENT_CACHE_SIZE': ('statement_cache_size', int),
+        'JESSDB_METRICS': ('metrics_enabled', _env_bool),
+        'JESSDB_SLOW_QUERY_MS': ('slow_query_ms', float),
+        'JESSDB_SLOW_QUERY_LOG': ('slow_query_log', str),
+        'JESSDB_WRITE_QUEUE': ('write_queue', _env_bool),
+        'JESSDB_WRITE_BATCH_SIZE': ('write_batch_size', int),
+        'JESSDB_WRITE_BATCH_WAIT_MS': ('write_batch_wait_ms', float),
+        'JESSDB_EVENT_POLL_MS': ('event_poll_ms', float),
+        'JESSDB_SSE_MAX_SUBSCRIBERS': ('sse_max_subscribers', int),
+        'JESSDB_KITCHEN_MAX_AGE_HOURS': ('kitchen_max_age_hours', float),
+        'JESSDB_SCRYPT_N': ('scrypt_n', int),
+        'JESSDB_SCRYPT_R': ('scrypt_r', int),
+        'JESSDB_SCRYPT_P': ('scrypt_p', int),
+        'JESSDB_PASSWORD_HASH_WORKERS': ('password_hash_workers', int),
+        'JESSDB_PASSWORD_HASH_MAX_PENDING': ('password_hash_max_pending', int),
+        'JESSDB_LOGIN_CACHE_SIZE': ('login_cache_size', int),
+        'JESSDB_LOGIN_CACHE_TTL': ('login_cache_ttl', float),
+        'JESSDB_SESSION_SECRET': ('session_secret', str),
+        'JESSDB_SESSION_TTL': ('session_ttl', float),
+        'JESSDB_SESSION_REVOCATION_POLL_MS': ('session_revocation_poll_ms', float),
+    }
+
+    def __init__(self, db_path='jessdb.db', pool_size=8, pool_timeout=5.0,
+                 health_check_interval=30.0, journal_mode='WAL', synchronous='NORMAL',
+                 busy_timeout_ms=5000, mmap_size=256 * 1024 * 1024, cache_size=-16000,
+                 temp_store='MEMORY', foreign_keys='ON', menu_cache_ttl=60.0,
+                 statement_cache_size=256, metrics_enabled=True, slow_query_ms=100.0,
+                 slow_query_log='logs/jessdb_slow_queries.log', write_queue=True,
+                 write_batch_size=64, write_batch_wait_ms=0.0, event_poll_ms=500.0,
+                 sse_max_subscribers=None, kitchen_max_age_hours=24.0, scrypt_n=2 ** 14, scrypt_r=8,
+                 scrypt_p=1, password_hash_workers=2, password_hash_max_pending=64, login_cache_size=10000,
+                 login_cache_ttl=300.0, session_secret=None, session_ttl=86400.0,
+                 session_revocation_poll_ms=5000.0):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.health_check_interval = health_check_interval
+        # 以下为连接初始化 PRAGMA，设为 None 表示保持 SQLite 默认值
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size  # 负数表示以 KiB 为单位
+        self.temp_store = temp_store
+        # 外键约束（含 ON DELETE CASCADE）按连接生效，每个连接都要显式打开
+        self.foreign_keys = foreign_keys
+        # 菜单（产品/分类）缓存的复查间隔，秒
+        self.menu_cache_ttl = menu_cache_ttl
+        # 每个连接缓存的已编译语句数（sqlite3 的 cached_statements，默认只有 128）
+        self.statement_cache_size = statement_cache_size
+        # 是否记录 SQL 与方法耗时（metrics_jessdb）
+        self.metrics_enabled = metrics_enabled
+        # 慢查询阈值（毫秒，None 关闭）与轮转日志路径（None 只在内存中汇总）；需要 metrics_enabled
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log = slow_query_log
+        # 写入串行化（writer_jessdb）：是否经单个写线程提交、每批最多合并的操作数、
+        # 凑批时额外等待的毫秒数（0 表示只合并已在排队的操作）
+        self.write_queue = write_queue
+        self.write_batch_size = write_batch_size
+        self.write_batch_wait_ms = write_batch_wait_ms
+        # 订单事件推送轮询 order_events 的间隔（毫秒）；本进程的写入提交后会立即推送
+        self.event_poll_ms = event_poll_ms
+        # 同步应用（app_jessdb）每个进程同时保持的订单事件流（SSE）连接上限：每个连接独占一个请求线程，
+        # 超出时返回 503。上限取决于服务器的线程数，由启动方给出（gunicorn_jessdb.conf.py 取线程数的一半）；
+        # 默认 None 不限制，Flask 开发服务器每个请求一个新线程，不会被占满。异步应用不占线程，不受此限制
+        self.sse_max_subscribers = sse_max_subscribers
+        # 后厨队列（活跃订单索引）只收最近多少小时内下单的未完成订单，更早的视为遗留数据；None 不限制
+        self.kitchen_max_age_hours = kitchen_max_age_hours
+        # 会员密码（passwords_jessdb）：scrypt 参数（改动后旧哈希在下次登录时升级）、
+        # 哈希线程池大小与排队上限、已验证凭据缓存的条数和有效期（秒，0 关闭）
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.password_hash_workers = password_hash_workers
+        self.password_hash_max_pending = password_hash_max_pending
+        self.login_cache_size = login_cache_size
+        self.login_cache_ttl = login_cache_ttl
+        # 会员会话令牌（sessions_jessdb）：签名密钥（None 使用数据库中生成的密钥，多进程共用）、
+        # 有效期（秒）、读取其他进程吊销记录的间隔（毫秒）
+        self.session_secret = session_secret
+        self.session_ttl = session_ttl
+        self.session_revocation_poll_ms = session_revocation_poll_ms
+
+    @classmethod
+    def from_env(cls, environ=None, **overrides):
+        """从环境变量构造配置"""
+        environ = os.environ if environ is None else environ
+        config = cls(**overrides)
+        for var, (attr, convert) in cls.ENV_VARS.items():
+            value = environ.get(var)
+            if value is None or value == '':
+                continue
+            if value.lower() in ('none', 'default'):
+                setattr(config, attr, None)
+            else:
+                setattr(config, attr, convert(value))
+        return config
+
+    @classmethod
+    def legacy(cls, **overrides):
+        """SQLite 默认配置（回滚日志），用于基准对比"""
+        params = dict(journal_mode='DELETE', synchronous='FULL', mmap_size=None,
+                      cache_size=None, temp_store=None)
+        params.update(overrides)
+        return cls(**params)
+
+    def pragmas(self):
+        """返回连接建立时需要执行的 (名称, 值) 列表"""
+        # journal_mode 放在最前：切换 WAL 需要在其他设置之前完成
+        items = [
+            ('journal_mode', self.journal_mode),
+            ('busy_timeout', self.busy_timeout_ms),
+            ('synchronous', self.synchronous),
+            ('mmap_size', self.mmap_size),
+            ('cache_size', self.cache_size),
+            ('temp_store', self.temp_store),
+            ('foreign_keys', self.foreign_keys),
+        ]
+        return [(name, value) for name, value in items if value is not None]
@@ -1,46 +1,897 @@
 import sqlite3
 import hashlib
-from datetime import datetime, date
+import base64
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta, timezone
 import os
+import re
+import secrets
+
+from config_jessdb import JessDBConfig
+from metrics_jessdb import (CONNECTIONS_OPENED, POOL_WAIT, InstrumentedConnection, SlowQueryLog,
+                            instrument_methods)
+from writer_jessdb import WriteQueue
+from events_jessdb import ActiveOrderIndex, OrderEventFeed
+from passwords_jessdb import PasswordHasher, PasswordHasherBusy, is_password_hash, scrypt_hash
+from sessions_jessdb import SessionTokens
+
+SCHEMA_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jessdb_sqlite_fixed.sql')
+
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+# 尚未完成、需要后厨处理的订单状态（活跃订单索引、后厨队列）
+ACTIVE_ORDER_STATUSES = ('PLACED', 'PENDING', 'PROCESSING')
+
+def day_range(start_date=None, end_date=None):
+    """把闭区间日期 [start_date, end_date] 转成半开区间 [lower, upper)
+
+    所有按日期过滤的查询都直接比较原始列（order_date >= lower AND order_date < upper），
+    不要在列上套 DATE()，否则无法使用索引。日期格式不合法时抛出 ValueError。
+    """
+    lower = date.fromisoformat(start_date).isoformat() if start_date else None
+    upper = None
+    if end_date:
+        upper = (date.fromisoformat(end_date) + timedelta(days=1)).isoformat()
+    return lower, upper
+
+
+def encode_order_cursor(order_date, order_id):
+    """订单分页游标：对 (order_date, order_id) 做 URL 安全的 base64 编码"""
+    raw = json.dumps([order_date, order_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_order_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        order_date, order_id = json.loads(raw)
+        return str(order_date), int(order_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def _hash_plaintext_member_passwords(conn):
+    """早期种子数据把明文（hashed_password_1、pw_liwei 等）直接写进了 password_hash：按原值计算 scrypt 哈希
+
+    早期的 SHA-256 哈希保持不变，由 verify_member_login 在登录成功时升级。
+    """
+    rows = conn.execute(
+        "SELECT customer_id, password_hash FROM member_customers WHERE password_hash IS NOT NULL").fetchall()
+    for customer_id, value in rows:
+        if not is_password_hash(value):
+            conn.execute("UPDATE member_customers SET password_hash = ? WHERE customer_id = ?",
+                         (scrypt_hash(value), customer_id))
+
+
+def _create_member_email_index(conn):
+    """会员邮箱唯一索引：未填邮箱（NULL 或空串）的会员可以有多个
+
+    已有重复的会员邮箱时建索引会失败：先查出来，在错误信息里列出，处理后重新执行迁移。
+    """
+    duplicates = conn.execute("""
+        SELECT email, GROUP_CONCAT(customer_id, ',')
+        FROM customer
+        WHERE customer_type = 'MEMBER' AND email IS NOT NULL AND email <> ''
+        GROUP BY email
+        HAVING COUNT(*) > 1
+        ORDER BY email
+    """).fetchall()
+    if duplicates:
+        listing = '; '.join(f"{email}（customer_id {ids}）" for email, ids in duplicates[:20])
+        if len(duplicates) > 20:
+            listing += f" 等共 {len(duplicates)} 个邮箱"
+        raise MigrationError(
+            f"无法建立会员邮箱唯一索引 ux_customer_member_email，以下会员邮箱重复，"
+            f"请合并或修改这些会员后重新启动: {listing}")
+    conn.execute("DROP INDEX IF EXISTS ux_customer_member_email")
+    conn.execute("""CREATE UNIQUE INDEX ux_customer_member_email
+                    ON customer(email)
+                    WHERE customer_type = 'MEMBER' AND email IS NOT NULL AND email <> ''""")
+
+
+def _generate_session_secret(conn):
+    """会话令牌的签名密钥：随机生成一次，同一数据库的所有进程共用"""
+    conn.execute("INSERT OR IGNORE INTO app_secrets (name, value) VALUES ('session', ?)",
+                 (secrets.token_hex(32),))
+
+
+# 版本化迁移：(版本号, 说明, 步骤)，按 PRAGMA user_version 顺序执行，只追加不修改。
+# 步骤为 SQL 语句，或以连接为参数的函数（需要在 Python 中计算的数据迁移）
+MIGRATIONS = [
+    (1, '订单、订单明细与会员邮箱的二级索引', [
+        # get_order_history(customer_id)：按客户过滤、按下单时间排序，覆盖列表所需的全部列
+        """CREATE INDEX IF NOT EXISTS idx_orders_customer_date
+           ON orders(customer_id, order_date, status, payment_method, total_amount)""",
+        # get_order_details(order_id)：覆盖索引，无需回表
+        """CREATE INDEX IF NOT EXISTS idx_order_items_order
+           ON order_items(order_id, product_id, quantity, unit_price, line_amount)""",
+        # verify_member_login：会员邮箱唯一（游客邮箱、会员的空邮箱不在约束范围内）。
+        # 最初的索引也约束了空邮箱，已执行过本迁移的数据库由迁移 14 重建
+        _create_member_email_index,
+        # get_sales_report 的日期范围过滤使用 DATE(order_date)
+        """CREATE INDEX IF NOT EXISTS idx_orders_order_day
+           ON orders(DATE(order_date), total_amount)""",
+    ]),
+    (2, '订单项写入时已带 line_amount，触发器只补算缺失值', [
+        "DROP TRIGGER IF EXISTS trg_order_items_line_amount_insert",
+        """CREATE TRIGGER trg_order_items_line_amount_insert
+           AFTER INSERT ON order_items
+           FOR EACH ROW
+           WHEN NEW.line_amount IS NULL
+           BEGIN
+             UPDATE order_items
+             SET line_amount = NEW.quantity * NEW.unit_price
+             WHERE order_item_id = NEW.order_item_id;
+           END""",
+    ]),
+    (3, 'POS 离线同步的幂等键', [
+        """CREATE TABLE IF NOT EXISTS order_idempotency (
+             idempotency_key  VARCHAR(128) PRIMARY KEY,
+             order_id         INTEGER NOT NULL,
+             created_at       DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+             FOREIGN KEY (order_id) REFERENCES orders(order_id) ON DELETE CASCADE
+           )""",
+    ]),
+    (4, '订单列表 keyset 分页：按 (order_date, order_id) 排序的索引', [
+        "DROP INDEX IF EXISTS idx_orders_customer_date",
+        """CREATE INDEX idx_orders_customer_date
+           ON orders(customer_id, order_date, order_id, status, payment_method, total_amount)""",
+        "CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(order_date)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_date ON orders(status, order_date)",
+    ]),
+    (5, '按日、按状态汇总的销售额物化表，由触发器增量维护', [
+        """CREATE TABLE IF NOT EXISTS daily_sales (
+             sale_date    DATE          NOT NULL,
+             status       VARCHAR(20)   NOT NULL,
+             order_count  INTEGER       DEFAULT 0 NOT NULL,
+             total_sales  DECIMAL(14,2) DEFAULT 0 NOT NULL,
+             PRIMARY KEY (sale_date, status)
+           ) WITHOUT ROWID""",
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_daily_sales_insert
+           AFTER INSERT ON orders
+           FOR EACH ROW
+           BEGIN
+             INSERT INTO daily_sales (sale_date, status, order_count, total_sales)
+             VALUES (DATE(NEW.order_date), NEW.status, 1, NEW.total_amount)
+             ON CONFLICT (sale_date, status) DO UPDATE SET
+               order_count = order_count + 1,
+               total_sales = total_sales + excluded.total_sales;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_daily_sales_update
+           AFTER UPDATE OF order_date, status, total_amount ON orders
+           FOR EACH ROW
+           BEGIN
+             UPDATE daily_sales
+             SET order_count = order_count - 1,
+                 total_sales = total_sales - OLD.total_amount
+             WHERE sale_date = DATE(OLD.order_date) AND status = OLD.status;
+             DELETE FROM daily_sales
+             WHERE sale_date = DATE(OLD.order_date) AND status = OLD.status AND order_count <= 0;
+             INSERT INTO daily_sales (sale_date, status, order_count, total_sales)
+             VALUES (DATE(NEW.order_date), NEW.status, 1, NEW.total_amount)
+             ON CONFLICT (sale_date, status) DO UPDATE SET
+               order_count = order_count + 1,
+               total_sales = total_sales + excluded.total_sales;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_daily_sales_delete
+           AFTER DELETE ON orders
+           FOR EACH ROW
+           BEGIN
+             UPDATE daily_sales
+             SET order_count = order_count - 1,
+                 total_sales = total_sales - OLD.total_amount
+             WHERE sale_date = DATE(OLD.order_date) AND status = OLD.status;
+             DELETE FROM daily_sales
+             WHERE sale_date = DATE(OLD.order_date) AND status = OLD.status AND order_count <= 0;
+           END""",
+        "DELETE FROM daily_sales",
+        """INSERT INTO daily_sales (sale_date, status, order_count, total_sales)
+           SELECT DATE(order_date), status, COUNT(*), SUM(total_amount)
+           FROM orders
+           GROUP BY DATE(order_date), status""",
+    ]),
+    (6, '日期范围过滤改为 order_date 上的半开区间，删除不再使用的 DATE() 表达式索引', [
+        "DROP INDEX IF EXISTS idx_orders_order_day",
+    ]),
+    (7, '菜单缓存版本号：product/category 变更时由触发器递增', [
+        """CREATE TABLE IF NOT EXISTS cache_versions (
+             name     VARCHAR(40) PRIMARY KEY,
+             version  INTEGER DEFAULT 0 NOT NULL
+           )""",
+        "INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('menu', 0)",
+    ] + [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_menu_version_{event.lower()}
+            AFTER {event} ON {table}
+            FOR EACH ROW
+            BEGIN
+              UPDATE cache_versions SET version = version + 1 WHERE name = 'menu';
+            END"""
+        for table in ('product', 'category')
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    (8, '客户累计消费汇总表 customer_stats，由触发器增量维护（客户报告直接读取）', [
+        # 每个客户一行（没有订单时为 0），金额按分取整避免浮点累计误差
+        """CREATE TABLE IF NOT EXISTS customer_stats (
+             customer_id      INTEGER PRIMARY KEY,
+             order_count      INTEGER       DEFAULT 0 NOT NULL,
+             total_spent      DECIMAL(14,2) DEFAULT 0 NOT NULL,
+             last_order_date  DATETIME
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_customer_stats_spent ON customer_stats(total_spent)",
+        """CREATE TRIGGER IF NOT EXISTS trg_customer_stats_customer_insert
+           AFTER INSERT ON customer
+           FOR EACH ROW
+           BEGIN
+             INSERT OR IGNORE INTO customer_stats (customer_id) VALUES (NEW.customer_id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_customer_stats_customer_delete
+           AFTER DELETE ON customer
+           FOR EACH ROW
+           BEGIN
+             DELETE FROM customer_stats WHERE customer_id = OLD.customer_id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_customer_stats_insert
+           AFTER INSERT ON orders
+           FOR EACH ROW
+           BEGIN
+             INSERT INTO customer_stats (customer_id, order_count, total_spent, last_order_date)
+             VALUES (NEW.customer_id, 1, NEW.total_amount, NEW.order_date)
+             ON CONFLICT (customer_id) DO UPDATE SET
+               order_count = order_count + 1,
+               total_spent = ROUND(total_spent + excluded.total_spent, 2),
+               last_order_date = CASE
+                 WHEN last_order_date IS NULL OR excluded.last_order_date > last_order_date
+                 THEN excluded.last_order_date ELSE last_order_date END;
+           END""",
+        # 改状态不影响累计值，只有改客户、金额或日期时才需要维护
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_customer_stats_update
+           AFTER UPDATE OF customer_id, total_amount, order_date ON orders
+           FOR EACH ROW
+           BEGIN
+             UPDATE customer_stats
+             SET order_count = order_count - 1,
+                 total_spent = ROUND(total_spent - OLD.total_amount, 2)
+             WHERE customer_id = OLD.customer_id;
+             INSERT INTO customer_stats (customer_id, order_count, total_spent)
+             VALUES (NEW.customer_id, 1, NEW.total_amount)
+             ON CONFLICT (customer_id) DO UPDATE SET
+               order_count = order_count + 1,
+               total_spent = ROUND(total_spent + excluded.total_spent, 2);
+             UPDATE customer_stats
+             SET last_order_date = (SELECT MAX(order_date) FROM orders
+                                    WHERE customer_id = customer_stats.customer_id)
+             WHERE customer_id IN (OLD.customer_id, NEW.customer_id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_customer_stats_delete
+           AFTER DELETE ON orders
+           FOR EACH ROW
+           BEGIN
+             UPDATE customer_stats
+             SET order_count = order_count - 1,
+                 total_spent = ROUND(total_spent - OLD.total_amount, 2),
+                 last_order_date = (SELECT MAX(order_date) FROM orders
+                                    WHERE customer_id = OLD.customer_id)
+             WHERE customer_id = OLD.customer_id;
+           END""",
+        "DELETE FROM customer_stats",
+        """INSERT INTO customer_stats (customer_id, order_count, total_spent, last_order_date)
+           SELECT c.customer_id, COUNT(o.order_id), ROUND(COALESCE(SUM(o.total_amount), 0), 2),
+                  MAX(o.order_date)
+           FROM customer c
+           LEFT JOIN orders o ON o.customer_id = c.customer_id
+           GROUP BY c.customer_id""",
+    ]),
+    (9, '按日、按产品汇总的销量表 product_sales_daily，由订单项触发器增量维护', [
+        # order_count 为含该产品的订单数：同一订单里同一产品有多行时只计一次
+        """CREATE TABLE IF NOT EXISTS product_sales_daily (
+             sale_date    DATE          NOT NULL,
+             product_id   INTEGER       NOT NULL,
+             quantity     INTEGER       DEFAULT 0 NOT NULL,
+             revenue      DECIMAL(14,2) DEFAULT 0 NOT NULL,
+             order_count  INTEGER       DEFAULT 0 NOT NULL,
+             PRIMARY KEY (sale_date, product_id)
+           ) WITHOUT ROWID""",
+        # line_amount 为空时由 trg_order_items_line_amount_insert 随后补写，这里先按数量 × 单价计
+        """CREATE TRIGGER IF NOT EXISTS trg_order_items_product_sales_insert
+           AFTER INSERT ON order_items
+           FOR EACH ROW
+           BEGIN
+             INSERT INTO product_sales_daily (sale_date, product_id, quantity, revenue, order_count)
+             SELECT DATE(o.order_date), NEW.product_id, NEW.quantity,
+                    COALESCE(NEW.line_amount, NEW.quantity * NEW.unit_price),
+                    NOT EXISTS (SELECT 1 FROM order_items
+                                WHERE order_id = NEW.order_id AND product_id = NEW.product_id
+                                  AND order_item_id != NEW.order_item_id)
+             FROM orders o WHERE o.order_id = NEW.order_id
+             ON CONFLICT (sale_date, product_id) DO UPDATE SET
+               quantity = quantity + excluded.quantity,
+               revenue = ROUND(revenue + excluded.revenue, 2),
+               order_count = order_count + excluded.order_count;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_order_items_product_sales_update
+           AFTER UPDATE OF order_id, product_id, quantity, unit_price, line_amount ON order_items
+           FOR EACH ROW
+           BEGIN
+             UPDATE product_sales_daily
+             SET quantity = quantity - OLD.quantity,
+                 revenue = ROUND(revenue - COALESCE(OLD.line_amount, OLD.quantity * OLD.unit_price), 2),
+                 order_count = order_count - NOT EXISTS (
+                   SELECT 1 FROM order_items
+                   WHERE order_id = OLD.order_id AND product_id = OLD.product_id
+                     AND order_item_id != OLD.order_item_id)
+             WHERE product_id = OLD.product_id
+               AND sale_date = (SELECT DATE(order_date) FROM orders WHERE order_id = OLD.order_id);
+             INSERT INTO product_sales_daily (sale_date, product_id, quantity, revenue, order_count)
+             SELECT DATE(o.order_date), NEW.product_id, NEW.quantity,
+                    COALESCE(NEW.line_amount, NEW.quantity * NEW.unit_price),
+                    NOT EXISTS (SELECT 1 FROM order_items
+                                WHERE order_id = NEW.order_id AND product_id = NEW.product_id
+                                  AND order_item_id != NEW.order_item_id)
+             FROM orders o WHERE o.order_id = NEW.order_id
+             ON CONFLICT (sale_date, product_id) DO UPDATE SET
+               quantity = quantity + excluded.quantity,
+               revenue = ROUND(revenue + excluded.revenue, 2),
+               order_count = order_count + excluded.order_count;
+             DELETE FROM product_sales_daily
+             WHERE product_id = OLD.product_id AND order_count <= 0
+               AND sale_date = (SELECT DATE(order_date) FROM orders WHERE order_id = OLD.order_id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_order_items_product_sales_delete
+           AFTER DELETE ON order_items
+           FOR EACH ROW
+           BEGIN
+             UPDATE product_sales_daily
+             SET quantity = quantity - OLD.quantity,
+                 revenue = ROUND(revenue - COALESCE(OLD.line_amount, OLD.quantity * OLD.unit_price), 2),
+                 order_count = order_count - NOT EXISTS (
+                   SELECT 1 FROM order_items
+                   WHERE order_id = OLD.order_id AND product_id = OLD.product_id)
+             WHERE product_id = OLD.product_id
+               AND sale_date = (SELECT DATE(order_date) FROM orders WHERE order_id = OLD.order_id);
+             DELETE FROM product_sales_daily
+             WHERE product_id = OLD.product_id AND order_count <= 0
+               AND sale_date = (SELECT DATE(order_date) FROM orders WHERE order_id = OLD.order_id);
+           END""",
+        # 订单改日期：把该订单的各产品从原来那天挪到新的一天
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_product_sales_redate
+           AFTER UPDATE OF order_date ON orders
+           FOR EACH ROW
+           WHEN DATE(OLD.order_date) IS NOT DATE(NEW.order_date)
+           BEGIN
+             UPDATE product_sales_daily
+             SET quantity = quantity - (SELECT SUM(quantity) FROM order_items
+                                        WHERE order_id = OLD.order_id
+                                          AND product_id = product_sales_daily.product_id),
+                 revenue = ROUND(revenue - (SELECT SUM(COALESCE(line_amount, quantity * unit_price))
+                                            FROM order_items
+                                            WHERE order_id = OLD.order_id
+                                              AND product_id = product_sales_daily.product_id), 2),
+                 order_count = order_count - 1
+             WHERE sale_date = DATE(OLD.order_date)
+               AND product_id IN (SELECT product_id FROM order_items WHERE order_id = OLD.order_id);
+             DELETE FROM product_sales_daily
+             WHERE sale_date = DATE(OLD.order_date) AND order_count <= 0;
+             INSERT INTO product_sales_daily (sale_date, product_id, quantity, revenue, order_count)
+             SELECT DATE(NEW.order_date), product_id, SUM(quantity),
+                    SUM(COALESCE(line_amount, quantity * unit_price)), 1
+             FROM order_items WHERE order_id = NEW.order_id
+             GROUP BY product_id
+             ON CONFLICT (sale_date, product_id) DO UPDATE SET
+               quantity = quantity + excluded.quantity,
+               revenue = ROUND(revenue + excluded.revenue, 2),
+               order_count = order_count + excluded.order_count;
+           END""",
+        # 先删订单、后删订单项时，订单项触发器已找不到下单日期，在这里一并扣除
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_product_sales_delete
+           AFTER DELETE ON orders
+           FOR EACH ROW
+           BEGIN
+             UPDATE product_sales_daily
+             SET quantity = quantity - (SELECT SUM(quantity) FROM order_items
+                                        WHERE order_id = OLD.order_id
+                                          AND product_id = product_sales_daily.product_id),
+                 revenue = ROUND(revenue - (SELECT SUM(COALESCE(line_amount, quantity * unit_price))
+                                            FROM order_items
+                                            WHERE order_id = OLD.order_id
+                                              AND product_id = product_sales_daily.product_id), 2),
+                 order_count = order_count - 1
+             WHERE sale_date = DATE(OLD.order_date)
+               AND product_id IN (SELECT product_id FROM order_items WHERE order_id = OLD.order_id);
+             DELETE FROM product_sales_daily
+             WHERE sale_date = DATE(OLD.order_date) AND order_count <= 0;
+           END""",
+        "DELETE FROM product_sales_daily",
+        """INSERT INTO product_sales_daily (sale_date, product_id, quantity, revenue, order_count)
+           SELECT DATE(o.order_date), oi.product_id, SUM(oi.quantity),
+                  ROUND(SUM(COALESCE(oi.line_amount, oi.quantity * oi.unit_price)), 2),
+                  COUNT(DISTINCT oi.order_id)
+           FROM order_items oi
+           JOIN orders o ON o.order_id = oi.order_id
+           GROUP BY DATE(o.order_date), oi.product_id""",
+    ]),
+    (10, '订单事件流 order_events：新订单与状态变更由触发器写入，供 SSE 推送和断点续传', [
+        """CREATE TABLE IF NOT EXISTS order_events (
+             event_id    INTEGER PRIMARY KEY AUTOINCREMENT,
+             order_id    INTEGER     NOT NULL,
+             event_type  VARCHAR(20) NOT NULL CHECK (event_type IN ('created', 'status')),
+             old_status  VARCHAR(20),
+             new_status  VARCHAR(20) NOT NULL,
+             created_at  DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_order_events_created ON order_events(created_at)",
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_event_insert
+           AFTER INSERT ON orders
+           FOR EACH ROW
+           BEGIN
+             INSERT INTO order_events (order_id, event_type, new_status)
+             VALUES (NEW.order_id, 'created', NEW.status);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_orders_event_status
+           AFTER UPDATE OF status ON orders
+           FOR EACH ROW
+           WHEN OLD.status IS NOT NEW.status
+           BEGIN
+             INSERT INTO order_events (order_id, event_type, old_status, new_status)
+             VALUES (NEW.order_id, 'status', OLD.status, NEW.status);
+           END""",
+    ]),
+    (11, '会员密码：明文种子值改为 scrypt 哈希', [
+        _hash_plaintext_member_passwords,
+    ]),
+    (12, '会员会话令牌：签名密钥与吊销记录', [
+        """CREATE TABLE IF NOT EXISTS app_secrets (
+             name   VARCHAR(40) PRIMARY KEY,
+             value  TEXT        NOT NULL
+           )""",
+        _generate_session_secret,
+        """CREATE TABLE IF NOT EXISTS session_revocations (
+             revocation_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+             token_id       VARCHAR(32) NOT NULL UNIQUE,
+             expires_at     INTEGER     NOT NULL,
+             revoked_at     DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_session_revocations_expires ON session_revocations(expires_at)",
+    ]),
+    (13, 'product_sales_daily：删除订单时在级联删除订单项之前扣减', [
+        # 级联删除订单项时订单行已不在，订单项触发器查不到下单日期；原先的 AFTER DELETE ON orders
+        # 又已找不到订单项，两边都没有扣减。改为删除订单前按订单项扣减，订单项触发器只处理订单仍存在的情况
+        "DROP TRIGGER IF EXISTS trg_orders_product_sales_delete",
+        """CREATE TRIGGER trg_orders_product_sales_delete
+           BEFORE DELETE ON orders
+           FOR EACH ROW
+           BEGIN
+             UPDATE product_sales_daily
+             SET quantity = quantity - (SELECT SUM(quantity) FROM order_items
+                                        WHERE order_id = OLD.order_id
+                                          AND product_id = product_sales_daily.product_id),
+                 revenue = ROUND(revenue - (SELECT SUM(COALESCE(line_amount, quantity * unit_price))
+                                            FROM order_items
+                                            WHERE order_id = OLD.order_id
+                                              AND product_id = product_sales_daily.product_id), 2),
+                 order_count = order_count - 1
+             WHERE sale_date = DATE(OLD.order_date)
+               AND product_id IN (SELECT product_id FROM order_items WHERE order_id = OLD.order_id);
+             DELETE FROM product_sales_daily
+             WHERE sale_date = DATE(OLD.order_date) AND order_count <= 0;
+           END""",
+        "DROP TRIGGER IF EXISTS trg_order_items_product_sales_delete",
+        """CREATE TRIGGER trg_order_items_product_sales_delete
+           AFTER DELETE ON order_items
+           FOR EACH ROW
+           WHEN EXISTS (SELECT 1 FROM orders WHERE order_id = OLD.order_id)
+           BEGIN
+             UPDATE product_sales_daily
+             SET quantity = quantity - OLD.quantity,
+                 revenue = ROUND(revenue - COALESCE(OLD.line_amount, OLD.quantity * OLD.unit_price), 2),
+                 order_count = order_count - NOT EXISTS (
+                   SELECT 1 FROM order_items
+                   WHERE order_id = OLD.order_id AND product_id = OLD.product_id)
+             WHERE product_id = OLD.product_id
+               AND sale_date = (SELECT DATE(order_date) FROM orders WHERE order_id = OLD.order_id);
+             DELETE FROM product_sales_daily
+             WHERE product_id = OLD.product_id AND order_count <= 0
+               AND sale_date = (SELECT DATE(order_date) FROM orders WHERE order_id = OLD.order_id);
+           END""",
+        # 修正此前删除订单留下的偏差
+        "DELETE FROM product_sales_daily",
+        """INSERT INTO product_sales_daily (sale_date, product_id, quantity, revenue, order_count)
+           SELECT DATE(o.order_date), oi.product_id, SUM(oi.quantity),
+                  ROUND(SUM(COALESCE(oi.line_amount, oi.quantity * oi.unit_price)), 2),
+                  COUNT(DISTINCT oi.order_id)
+           FROM order_items oi
+           JOIN orders o ON o.order_id = oi.order_id
+           GROUP BY DATE(o.order_date), oi.product_id""",
+    ]),
+    (14, '会员邮箱唯一索引不再约束空邮箱（未填邮箱的会员可以有多个）', [
+        _create_member_email_index,
+    ]),
+    (15, 'daily_sales：与 customer_stats、product_sales_daily 一样按分取整，避免浮点累计误差', [
+        "DROP TRIGGER IF EXISTS trg_orders_daily_sales_insert",
+        """CREATE TRIGGER trg_orders_daily_sales_insert
+           AFTER INSERT ON orders
+           FOR EACH ROW
+           BEGIN
+             INSERT INTO daily_sales (sale_date, status, order_count, total_sales)
+             VALUES (DATE(NEW.order_date), NEW.status, 1, NEW.total_amount)
+             ON CONFLICT (sale_date, status) DO UPDATE SET
+               order_count = order_count + 1,
+               total_sales = ROUND(total_sales + excluded.total_sales, 2);
+           END""",
+        "DROP TRIGGER IF EXISTS trg_orders_daily_sales_update",
+        """CREATE TRIGGER trg_orders_daily_sales_update
+           AFTER UPDATE OF order_date, status, total_amount ON orders
+           FOR EACH ROW
+           BEGIN
+             UPDATE daily_sales
+             SET order_count = order_count - 1,
+                 total_sales = ROUND(total_sales - OLD.total_amount, 2)
+             WHERE sale_date = DATE(OLD.order_date) AND status = OLD.status;
+             DELETE FROM daily_sales
+             WHERE sale_date = DATE(OLD.order_date) AND status = OLD.status AND order_count <= 0;
+             INSERT INTO daily_sales (sale_date, status, order_count, total_sales)
+             VALUES (DATE(NEW.order_date), NEW.status, 1, NEW.total_amount)
+             ON CONFLICT (sale_date, status) DO UPDATE SET
+               order_count = order_count + 1,
+               total_sales = ROUND(total_sales + excluded.total_sales, 2);
+           END""",
+        "DROP TRIGGER IF EXISTS trg_orders_daily_sales_delete",
+        """CREATE TRIGGER trg_orders_daily_sales_delete
+           AFTER DELETE ON orders
+           FOR EACH ROW
+           BEGIN
+             UPDATE daily_sales
+             SET order_count = order_count - 1,
+                 total_sales = ROUND(total_sales - OLD.total_amount, 2)
+             WHERE sale_date = DATE(OLD.order_date) AND status = OLD.status;
+             DELETE FROM daily_sales
+             WHERE sale_date = DATE(OLD.order_date) AND status = OLD.status AND order_count <= 0;
+           END""",
+        # 修正此前累计的误差
+        "DELETE FROM daily_sales",
+        """INSERT INTO daily_sales (sale_date, status, order_count, total_sales)
+           SELECT DATE(order_date), status, COUNT(*), ROUND(SUM(total_amount), 2)
+           FROM orders
+           GROUP BY DATE(order_date), status""",
+    ]),
+]
+
+
+class MigrationError(RuntimeError):
+    """迁移无法执行（例如现有数据违反新约束），需要人工处理"""
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """等待空闲连接超时"""
+
+
+class ConnectionPool:
+    """SQLite 连接池
+
+    同一线程内的嵌套调用复用同一个连接；线程用完后连接归还到空闲队列，
+    供后续请求（可能在其他线程）继续使用，避免每次查询都重新打开数据库。
+    """
+
+    def __init__(self, connect, max_size=8, timeout=5.0, health_check_interval=30.0,
+                 on_checkout=None):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # 借出连接后回调，参数为等待秒数（用于指标统计）
+        self.on_checkout = on_checkout
+        self._idle = deque()  # (conn, 最后使用时间)
+        self._created = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._abandoned = []
+
+    def _checkout(self):
+        """从空闲队列取出连接，必要时新建；池满时等待"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._idle and self._created >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"等待数据库连接超时（连接池大小 {self.max_size}）")
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._created += 1
+
+        if conn is not None and time.monotonic() - last_used >= self.health_check_interval:
+            if not self._is_healthy(conn):
+                # 新建的连接沿用被丢弃连接的名额，_created 不变
+                self._discard(conn)
+                conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def _checkin(self, conn):
+        """归还连接；残留的未提交事务一律回滚"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @staticmethod
+    def _is_healthy(conn):
+        """健康检查：执行一条最简单的语句"""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def depth(self):
+        """当前线程持有连接的嵌套层数"""
+        return getattr(self._local, 'depth', 0)
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，退出时归还；同一线程内可嵌套使用"""
+        if self._pid != os.getpid():
+            self.reset_after_fork()
+        local = self._local
+        if getattr(local, 'depth', 0) == 0:
+            started = time.perf_counter()
+            local.conn = self._checkout()
+            if self.on_checkout:
+                self.on_checkout(time.perf_counter() - started)
+        local.depth = getattr(local, 'depth', 0) + 1
+        conn = local.conn
+        try:
+            yield conn
+        except BaseException:
+            if local.depth == 1 and conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            local.depth -= 1
+            if local.depth == 0:
+                local.conn = None
+                self._checkin(conn)
+
+    def reset_after_fork(self):
+        """fork 出的子进程中调用：丢弃从父进程继承的连接，之后按需重新建立
+
+        SQLite 连接不能跨 fork 使用，也不能在子进程里关闭（可能影响父进程持有的锁），
+        所以只是放弃引用并保留到进程结束。connection() 发现进程号变化时也会自动调用。
+        """
+        self._abandoned.extend(conn for conn, _ in self._idle)
+        local_conn = getattr(self._local, 'conn', None)
+        if local_conn is not None:
+            self._abandoned.append(local_conn)
+        self._idle = deque()
+        self._created = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return {'max_size': self.max_size, 'open': self._created, 'idle': len(self._idle)}
+
 
 class JessDBManager:
-    def __init__(self, db_path='jessdb.db'):
-        self.db_path = db_path
+    def __init__(self, db_path=None, config=None):
+        self.config = config or JessDBConfig()
+        self.db_path = db_path or self.config.db_path
+        self.slow_queries = None
+        if self.config.metrics_enabled and self.config.slow_query_ms is not None:
+            self.slow_queries = SlowQueryLog(self.db_path, self.config.slow_query_ms,
+                                             self.config.slow_query_log)
+        self.pool = ConnectionPool(self._open_connection, max_size=self.config.pool_size,
+                                   timeout=self.config.pool_timeout,
+                                   health_check_interval=self.config.health_check_interval,
+                                   on_checkout=POOL_WAIT.observe if self.config.metrics_enabled else None)
+        # 当前线程是否处在 transaction() 中（决定由哪一层提交）
+        self._transactions = threading.local()
+        # scrypt 在独立的有界线程池中计算，见 passwords_jessdb.py
+        self.passwords = PasswordHasher(n=self.config.scrypt_n, r=self.config.scrypt_r,
+                                        p=self.config.scrypt_p,
+                                        workers=self.config.password_hash_workers,
+                                        max_pending=self.config.password_hash_max_pending,
+                                        cache_size=self.config.login_cache_size,
+                                        cache_ttl=self.config.login_cache_ttl)
         self.init_database()
     
+    def _configure_connection(self, conn):
+        """按配置执行连接初始化 PRAGMA（WAL、synchronous、缓存等）"""
+        for name, value in self.config.pragmas():
+            if not _PRAGMA_VALUE.match(str(value)):
+                raise ValueError(f"非法的 PRAGMA 取值: {name}={value!r}")
+            conn.execute(f"PRAGMA {name} = {value}")
+        if isinstance(conn, InstrumentedConnection):
+            conn.slow_query_log = self.slow_queries
+        return conn
+
+    def _open_connection(self):
+        """连接池使用的连接：会在线程之间传递，因此关闭同线程检查"""
+        conn = sqlite3.connect(self.db_path, timeout=self._busy_timeout_seconds(),
+                               check_same_thread=False, factory=self._connection_factory('pooled'),
+                               cached_statements=self._statement_cache_size())
+        return self._configure_connection(conn)
+
+    def _connection_factory(self, kind):
+        """启用指标时使用 InstrumentedConnection，记录每条 SQL 的耗时和行数"""
+        if not self.config.metrics_enabled:
+            return sqlite3.Connection
+        CONNECTIONS_OPENED.inc(1, kind)
+        return InstrumentedConnection
+
+    def _statement_cache_size(self):
+        if self.config.statement_cache_size is None:
+            return 128  # sqlite3 默认值
+        return self.config.statement_cache_size
+
+    def _busy_timeout_seconds(self):
+        if self.config.busy_timeout_ms is None:
+            return 5.0
+        return self.config.busy_timeout_ms / 1000.0
+
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """打开一个独立（不入池）的连接，调用方负责关闭"""
+        conn = sqlite3.connect(self.db_path, timeout=self._busy_timeout_seconds(),
+                               factory=self._connection_factory('direct'),
+                               cached_statements=self._statement_cache_size())
+        return self._configure_connection(conn)
+
+    def connection(self):
+        """从连接池借用连接的上下文管理器"""
+        return self.pool.connection()
+
+    @contextmanager
+    def transaction(self):
+        """借用连接并在最外层 transaction() 正常退出时提交，异常时回滚
+
+        外层只有 connection()（没有 transaction()）时同样在这里提交，否则写入会在连接归还时被回滚；
+        嵌套在另一个 transaction() 里时不提交，由外层一起提交。
+        """
+        local = self._transactions
+        outermost = not getattr(local, 'active', False)
+        with self.pool.connection() as conn:
+            if not outermost:
+                yield conn
+                return
+            local.active = True
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                local.active = False
+
+    def pragma_status(self):
+        """读取当前连接上生效的 PRAGMA 值"""
+        with self.connection() as conn:
+            return {name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+                    for name, _ in self.config.pragmas()}
+
+    def after_fork(self):
+        """预加载应用后 fork 出的工作进程中调用，放弃继承自父进程的所有连接"""
+        self.pool.reset_after_fork()
+        self._transactions = threading.local()
+        if self.slow_queries:
+            self.slow_queries.reset_after_fork()
+
+    def close(self):
+        self.pool.close_all()
+        self.passwords.close()
+        if self.slow_queries:
+            self.slow_queries.close()
     
     def init_database(self):
-        """使用 jessdb_sqlite.sql 初始化数据库"""
-        # 如果数据库文件已存在且有数据，跳过初始化
-        if os.path.exists(self.db_path):
-            conn = self.get_connection()
+        """使用 jessdb_sqlite.sql 初始化数据库，并执行未应用的迁移"""
+        if not self._has_schema():
+            self._create_schema()
+        self.apply_migrations()
+
+    def _has_schema(self):
+        """数据库文件已存在且已建表时跳过脚本初始化"""
+        if not os.path.exists(self.db_path):
+            return False
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='customer'")
-            if cursor.fetchone():
-                conn.close()
-                return
-            conn.close()
-        
+            return cursor.fetchone() is not None
+
+    def _create_schema(self):
         # 读取并执行 SQL 脚本
-        with open('jessdb_sqlite_fixed.sql', 'r', encoding='utf-8') as f:
+        with open(SCHEMA_SQL_PATH, 'r', encoding='utf-8') as f:
             sql_script = f.read()
         
+        # 脚本里的 PRAGMA（如 foreign_keys）会改变连接状态：用独立连接执行，用完关闭，不放回连接池
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 使用 executescript 执行整个脚本
         try:
-            cursor.executescript(sql_script)
-        except sqlite3.Error as e:
-            print(f"执行 SQL 脚本时出错: {e}")
-            # 如果脚本执行失败，尝试手动创建基本结构
-            self._create_basic_structure(cursor)
-        
-        conn.commit()
-        conn.close()
-    
+            cursor = conn.cursor()
+            
+            # 使用 executescript 执行整个脚本
+            try:
+                cursor.executescript(sql_script)
+            except sqlite3.Error as e:
+                print(f"执行 SQL 脚本时出错: {e}")
+                # 如果脚本执行失败，尝试手动创建基本结构
+                self._create_basic_structure(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def latest_schema_version(self):
+        return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+    def schema_version(self):
+        with self.connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def apply_migrations(self):
+        """按 PRAGMA user_version 依次执行 MIGRATIONS 中尚未应用的迁移"""
+        applied = []
+        with self.connection() as conn:
+            for version, description, statements in MIGRATIONS:
+                # BEGIN IMMEDIATE 先拿写锁再读版本号，多个进程同时启动时只有一个会执行迁移
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    current = conn.execute("PRAGMA user_version").fetchone()[0]
+                    if current >= version:
+                        conn.rollback()
+                        continue
+                    for statement in statements:
+                        if callable(statement):
+                            statement(conn)
+                        else:
+                            conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {int(version)}")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append((version, description))
+        return applied
+
     def _create_basic_structure(self, cursor):
         """手动创建基本数据库结构"""
         # 清理
@@ -183,287 +1034,924 @@ class JessDBManager:
         cursor.execute("INSERT INTO order_items (order_id, product_id, quantity, unit_price, line_amount) VALUES (2, 4, 1, 45, 45)")
     
     def hash_password(self, password):
-        """密码哈希"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """密码哈希（scrypt，在密码哈希线程池中计算）"""
+        return self.passwords.hash(password)
     
     def verify_password(self, password, hash_value):
-        """验证密码"""
-        return self.hash_password(password) == hash_value
+        """验证密码（兼容早期的 SHA-256 哈希）"""
+        return self.passwords.verify(password, hash_value)[0]
+
+# 读取触发器维护的 product_sales_daily，开销只与天数 × 产品数相关；日期过滤和 top_n 由
+# get_product_sales_report 追加
+PRODUCT_SALES_REPORT_SQL = """
+    SELECT
+        p.name as product_name,
+        c.category_name,
+        SUM(s.quantity) as total_quantity,
+        ROUND(SUM(s.revenue), 2) as total_revenue,
+        SUM(s.order_count) as order_count
+    FROM product_sales_daily s
+    JOIN product p ON s.product_id = p.product_id
+    JOIN category c ON p.category_id = c.category_id
+    WHERE 1=1
+"""
+
+# 读取触发器维护的 customer_stats，按 total_spent 索引倒序扫描，不再关联全部订单分组排序
+CUSTOMER_REPORT_SQL = """
+    SELECT
+        c.name as customer_name,
+        c.customer_type,
+        s.order_count,
+        s.total_spent,
+        s.total_spent * 1.0 / NULLIF(s.order_count, 0) as avg_order_value,
+        s.last_order_date
+    FROM customer_stats s
+    JOIN customer c ON c.customer_id = s.customer_id
+    ORDER BY s.total_spent DESC
+"""
+
+# 从订单表重新计算每个客户的累计值（迁移 8 初始化及 rebuild_customer_stats 使用同一口径）
+CUSTOMER_STATS_SOURCE_SQL = """
+    SELECT c.customer_id,
+           COUNT(o.order_id) AS order_count,
+           ROUND(COALESCE(SUM(o.total_amount), 0), 2) AS total_spent,
+           MAX(o.order_date) AS last_order_date
+    FROM customer c
+    LEFT JOIN orders o ON o.customer_id = c.customer_id
+    GROUP BY c.customer_id
+"""
+
+# 命名 SQL 语句。sqlite3 按 SQL 文本缓存每个连接上编译好的语句（cached_statements），
+# 固定文本的语句只在每个池连接上编译一次；方法统一通过名字取用，不在调用处拼写 SQL。
+# 含 {placeholders} 的是 IN 列表模板，经 in_list_statement 补齐占位符后使用，每个模板最多产生十来种文本。
+# 按可选过滤条件拼接 WHERE 的查询（订单历史、销售/产品报告及其重建）仍在各自方法中由固定片段组合：
+# 每个条件只有“有/无”两种，文本种类有限（不超过 2^条件数），同样能留在语句缓存里
+STATEMENTS = {
+    'menu_version': "SELECT version FROM cache_versions WHERE name = 'menu'",
+    'products': """
+        SELECT p.product_id, p.name, p.price, p.is_active, c.category_name
+        FROM product p
+        LEFT JOIN category c ON p.category_id = c.category_id
+        WHERE p.is_active = 'Y'
+        ORDER BY c.category_name, p.name
+    """,
+    'categories': "SELECT category_id, category_name, description FROM category ORDER BY category_name",
+    'customer_insert': """
+        INSERT INTO customer (name, phone, email, address, customer_type)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    'customer_set_member': "UPDATE customer SET customer_type = 'MEMBER' WHERE customer_id = ?",
+    'member_insert': """
+        INSERT INTO member_customers (customer_id, password_hash, date_of_birth)
+        VALUES (?, ?, ?)
+    """,
+    'order_insert': """
+        INSERT INTO orders (customer_id, status, payment_method, total_amount)
+        VALUES (?, ?, ?, ?)
+    """,
+    'order_insert_dated': """
+        INSERT INTO orders (customer_id, order_date, status, payment_method, total_amount)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    'order_items_insert': """
+        INSERT INTO order_items (order_id, product_id, quantity, unit_price, line_amount)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    'idempotency_insert': "INSERT INTO order_idempotency (idempotency_key, order_id) VALUES (?, ?)",
+    'order_details': """
+        SELECT oi.product_id, p.name, oi.quantity, oi.unit_price, oi.line_amount
+        FROM order_items oi
+        JOIN product p ON oi.product_id = p.product_id
+        WHERE oi.order_id = ?
+    """,
+    'customer_report': CUSTOMER_REPORT_SQL,
+    'customer_stats_rebuild_delete': "DELETE FROM customer_stats",
+    'customer_stats_rebuild_insert': f"""
+        INSERT INTO customer_stats (customer_id, order_count, total_spent, last_order_date)
+        {CUSTOMER_STATS_SOURCE_SQL}
+    """,
+    # 与订单表实算值不一致的客户，以及客户已删除但仍残留的汇总行
+    'customer_stats_check': f"""
+        SELECT a.customer_id, s.order_count, s.total_spent, s.last_order_date,
+               a.order_count, a.total_spent, a.last_order_date
+        FROM ({CUSTOMER_STATS_SOURCE_SQL}) AS a
+        LEFT JOIN customer_stats s ON s.customer_id = a.customer_id
+        WHERE s.customer_id IS NULL
+           OR s.order_count != a.order_count
+           OR ABS(s.total_spent - a.total_spent) >= 0.005
+           OR s.last_order_date IS NOT a.last_order_date
+        UNION ALL
+        SELECT s.customer_id, s.order_count, s.total_spent, s.last_order_date, NULL, NULL, NULL
+        FROM customer_stats s
+        WHERE NOT EXISTS (SELECT 1 FROM customer c WHERE c.customer_id = s.customer_id)
+    """,
+    'member_customers': """
+        SELECT c.customer_id, c.name, c.phone, c.email, c.address,
+               m.date_of_birth, m.registration_date
+        FROM customer c
+        JOIN member_customers m ON c.customer_id = m.customer_id
+        ORDER BY m.registration_date DESC
+    """,
+    'member_login': """
+        SELECT c.customer_id, c.name, m.password_hash
+        FROM customer c
+        JOIN member_customers m ON c.customer_id = m.customer_id
+        WHERE c.email = ? AND c.email <> '' AND c.customer_type = 'MEMBER'
+    """,
+    # 只在存储值仍是校验时读到的旧哈希时更新，不会覆盖期间修改过的密码
+    'member_password_rehash': """
+        UPDATE member_customers SET password_hash = ?
+        WHERE customer_id = ? AND password_hash = ?
+    """,
+    'order_status_update': "UPDATE orders SET status = ? WHERE order_id = ?",
+    'session_secret': "SELECT value FROM app_secrets WHERE name = 'session'",
+    'session_revocations_after': """
+        SELECT revocation_id, token_id, expires_at FROM session_revocations
+        WHERE revocation_id > ? ORDER BY revocation_id
+    """,
+    'session_revocation_insert': """
+        INSERT OR IGNORE INTO session_revocations (token_id, expires_at) VALUES (?, ?)
+    """,
+    'session_revocations_prune': "DELETE FROM session_revocations WHERE expires_at <= ?",
+    'order_events_after': """
+        SELECT e.event_id, e.event_type, e.order_id, e.old_status, e.new_status, e.created_at,
+               c.name, o.order_date, o.payment_method, o.total_amount
+        FROM order_events e
+        LEFT JOIN orders o ON o.order_id = e.order_id
+        LEFT JOIN customer c ON c.customer_id = o.customer_id
+        WHERE e.event_id > ?
+        ORDER BY e.event_id
+        LIMIT ?
+    """,
+    'order_events_latest': "SELECT COALESCE(MAX(event_id), 0) FROM order_events",
+    'order_events_prune': "DELETE FROM order_events WHERE created_at < ?",
+    'customer_by_id': """
+        SELECT customer_id, name, phone, email, address, customer_type
+        FROM customer
+        WHERE customer_id = ?
+    """,
+    'product_prices_in': "SELECT product_id, price FROM product WHERE product_id IN ({placeholders})",
+    'idempotency_keys_in': """
+        SELECT idempotency_key, order_id FROM order_idempotency
+        WHERE idempotency_key IN ({placeholders})
+    """,
+    'orders_in': """
+        SELECT o.order_id, c.name, o.order_date, o.status, o.payment_method, o.total_amount
+        FROM orders o
+        JOIN customer c ON o.customer_id = c.customer_id
+        WHERE o.order_id IN ({placeholders})
+    """,
+    'order_items_in': """
+        SELECT oi.order_id, oi.product_id, p.name, oi.quantity, oi.unit_price, oi.line_amount
+        FROM order_items oi
+        JOIN product p ON oi.product_id = p.product_id
+        WHERE oi.order_id IN ({placeholders})
+    """,
+    # 按下单先后，走 idx_orders_status_date；参数依次为各状态和最早下单时间
+    'orders_by_status_in': """
+        SELECT o.order_id, c.name, o.order_date, o.status, o.payment_method, o.total_amount
+        FROM orders o
+        JOIN customer c ON o.customer_id = c.customer_id
+        WHERE o.status IN ({placeholders}) AND o.order_date >= ?
+        ORDER BY o.order_date, o.order_id
+    """,
+}
+
+
+def padded_in_params(values):
+    """IN 列表的占位符和参数，长度向上补齐到 2 的幂（重复最后一个值）
+
+    这样 IN 查询只会产生少数几种 SQL 文本，不会因为列表长度各异把语句缓存挤满。
+    """
+    size = 1
+    while size < len(values):
+        size *= 2
+    params = list(values) + [values[-1]] * (size - len(values))
+    return ','.join('?' * size), params
+
+
+def in_list_statement(name, values):
+    """取出 IN 列表模板 STATEMENTS[name]，填入补齐后的占位符，返回 (SQL, 参数)"""
+    placeholders, params = padded_in_params(values)
+    return STATEMENTS[name].format(placeholders=placeholders), params
+
+
+class MenuCache:
+    """菜单数据的进程内缓存
+
+    条目在 ttl 秒内直接返回；过期后先读取 cache_versions 中的版本号，
+    版本未变只刷新检查时间，变了才重新查询。invalidate() 用于本进程内的显式失效。
+    每个条目带一个由内容计算的 etag，供 HTTP 层做条件请求。
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._entries = {}  # key -> {'value', 'etag', 'version', 'checked_at'}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader, version_reader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['checked_at'] < self.ttl:
+                return entry
+
+        version = version_reader()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['version'] == version:
+                entry['checked_at'] = now
+                return entry
+
+        value = tuple(loader())
+        digest = hashlib.sha1(repr((key, value)).encode('utf-8')).hexdigest()
+        entry = {'value': value, 'etag': f"{key}-{digest[:16]}", 'version': version, 'checked_at': now}
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
 
 # 数据库操作类 - 适配 jessdb 表结构
+@instrument_methods
 class JessDBCoffeeShop:
-    def __init__(self):
-        self.db_manager = JessDBManager()
+    def __init__(self, db_path=None, config=None):
+        self.db_manager = JessDBManager(db_path, config=config)
+        self.menu_cache = MenuCache(ttl=self.db_manager.config.menu_cache_ttl)
+        config = self.db_manager.config
+        # 请求处理中的写操作经 self.writes 排队到单个写线程批量提交，见 writer_jessdb.py
+        self.writes = WriteQueue(self, batch_size=config.write_batch_size,
+                                 batch_wait_ms=config.write_batch_wait_ms, enabled=config.write_queue)
+        # 新订单/状态变更的事件推送（SSE），见 events_jessdb.py
+        self.order_events = OrderEventFeed(self, poll_interval=config.event_poll_ms / 1000.0)
+        self.writes.on_commit = self.order_events.notify
+        # 后厨队列使用的活跃订单内存索引，由订单事件增量维护
+        self.active_orders = ActiveOrderIndex(
+            self, self.order_events, ACTIVE_ORDER_STATUSES,
+            max_age=config.kitchen_max_age_hours * 3600.0 if config.kitchen_max_age_hours else None)
+        # 会员会话令牌（签名 + 吊销集合），校验不访问数据库，见 sessions_jessdb.py
+        self.sessions = SessionTokens(self, secret=config.session_secret, ttl=config.session_ttl,
+                                      revocation_poll=config.session_revocation_poll_ms / 1000.0)
     
     def get_all_products(self):
-        """获取所有产品"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.product_id, p.name, p.price, p.is_active, c.category_name
-            FROM product p
-            LEFT JOIN category c ON p.category_id = c.category_id
-            WHERE p.is_active = 'Y'
-            ORDER BY c.category_name, p.name
-        """)
-        products = cursor.fetchall()
-        conn.close()
-        return products
+        """获取所有产品（菜单缓存）"""
+        return list(self._menu_entry('products')['value'])
     
     def get_categories(self):
-        """获取所有分类"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT category_id, category_name, description FROM category ORDER BY category_name")
-        categories = cursor.fetchall()
-        conn.close()
-        return categories
+        """获取所有分类（菜单缓存）"""
+        return list(self._menu_entry('categories')['value'])
+
+    def menu_etag(self, key):
+        """菜单缓存条目（'products' 或 'categories'）当前的 ETag"""
+        return self._menu_entry(key)['etag']
+
+    def invalidate_menu_cache(self):
+        """产品或分类有改动时调用，下次读取会重新查询数据库"""
+        self.menu_cache.invalidate()
+
+    def _menu_entry(self, key):
+        loaders = {'products': self._load_products, 'categories': self._load_categories}
+        return self.menu_cache.get(key, loaders[key], self._menu_version)
+
+    def _menu_version(self):
+        with self.db_manager.connection() as conn:
+            row = conn.execute(STATEMENTS['menu_version']).fetchone()
+            return row[0] if row else None
+
+    def _load_products(self):
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['products'])
+            return cursor.fetchall()
+
+    def _load_categories(self):
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['categories'])
+            return cursor.fetchall()
     
     def create_customer(self, name, phone, email, address, customer_type='GUEST'):
         """创建客户"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO customer (name, phone, email, address, customer_type)
-            VALUES (?, ?, ?, ?, ?)
-        """, (name, phone, email, address, customer_type))
-        customer_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return customer_id
-    
-    def create_member_customer(self, customer_id, password, date_of_birth=None):
-        """为现有客户创建会员记录"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # 首先确保客户类型是 MEMBER
-        cursor.execute("UPDATE customer SET customer_type = 'MEMBER' WHERE customer_id = ?", (customer_id,))
-        
-        password_hash = self.db_manager.hash_password(password)
-        cursor.execute("""
-            INSERT INTO member_customers (customer_id, password_hash, date_of_birth)
-            VALUES (?, ?, ?)
-        """, (customer_id, password_hash, date_of_birth))
-        
-        conn.commit()
-        conn.close()
+        with self.db_manager.transaction() as conn:
+            return self._insert_customer(conn.cursor(), name, phone, email, address, customer_type)
+
+    def _insert_customer(self, cursor, name, phone, email, address, customer_type='GUEST'):
+        cursor.execute(STATEMENTS['customer_insert'], (name, phone, email, address, customer_type))
+        return cursor.lastrowid
     
-    def create_order(self, customer_id, payment_method, order_items, status='PLACED'):
-        """创建订单"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # 计算总金额
-            total_amount = 0
-            for item in order_items:
-                cursor.execute("SELECT price FROM product WHERE product_id = ?", (item['product_id'],))
-                price = cursor.fetchone()[0]
-                total_amount += price * item['quantity']
-            
-            # 创建订单
-            cursor.execute("""
-                INSERT INTO orders (customer_id, status, payment_method, total_amount)
-                VALUES (?, ?, ?, ?)
-            """, (customer_id, status.upper(), payment_method.upper(), total_amount))
-            
-            order_id = cursor.lastrowid
-            
-            # 添加订单项
-            for item in order_items:
-                cursor.execute("SELECT price FROM product WHERE product_id = ?", (item['product_id'],))
-                unit_price = cursor.fetchone()[0]
-                
-                cursor.execute("""
-                    INSERT INTO order_items (order_id, product_id, quantity, unit_price)
-                    VALUES (?, ?, ?, ?)
-                """, (order_id, item['product_id'], item['quantity'], unit_price))
+    def create_member_customer(self, customer_id, password=None, date_of_birth=None, password_hash=None):
+        """为现有客户创建会员记录
+
+        可直接传入已计算好的 password_hash（写队列在进入写事务前先算好哈希），此时忽略 password。
+        """
+        if password_hash is None:
+            password_hash = self.db_manager.hash_password(password)
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
             
-            conn.commit()
-            return order_id
+            # 首先确保客户类型是 MEMBER
+            cursor.execute(STATEMENTS['customer_set_member'], (customer_id,))
             
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+            cursor.execute(STATEMENTS['member_insert'], (customer_id, password_hash, date_of_birth))
     
-    def get_order_history(self, customer_id=None):
-        """获取订单历史"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
+    def create_order(self, customer_id, payment_method, order_items, status='PLACED'):
+        """创建订单"""
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            prices = self._fetch_prices(cursor, [item['product_id'] for item in order_items])
+            return self._insert_order(cursor, customer_id, payment_method, order_items, status, prices)
+
+    def _lookup_prices(self, cursor, product_ids):
+        """用 IN 查询取回产品单价，返回 {product_id: price}，不存在的产品不出现在结果中"""
+        ids = list(dict.fromkeys(int(pid) for pid in product_ids))
+        prices = {}
+        # SQLite 单条语句的绑定参数个数有限，超长列表分批查询
+        for start in range(0, len(ids), 500):
+            cursor.execute(*in_list_statement('product_prices_in', ids[start:start + 500]))
+            prices.update(cursor.fetchall())
+        return prices
+
+    def _fetch_prices(self, cursor, product_ids):
+        """同 _lookup_prices，但有产品不存在时抛出 ValueError"""
+        prices = self._lookup_prices(cursor, product_ids)
+        missing = [pid for pid in dict.fromkeys(int(pid) for pid in product_ids) if pid not in prices]
+        if missing:
+            raise ValueError(f"产品不存在: {missing}")
+        return prices
+
+    def _insert_order(self, cursor, customer_id, payment_method, order_items, status, prices,
+                      order_date=None):
+        """在当前事务中写入订单及订单项（不提交），返回订单ID"""
+        lines = []
+        total_amount = 0
+        for item in order_items:
+            product_id = int(item['product_id'])
+            quantity = item['quantity']
+            unit_price = prices[product_id]
+            line_amount = unit_price * quantity
+            total_amount += line_amount
+            lines.append((product_id, quantity, unit_price, line_amount))
         
-        if customer_id:
-            cursor.execute("""
-                SELECT o.order_id, c.name, o.order_date, o.status, o.payment_method, o.total_amount
-                FROM orders o
-                JOIN customer c ON o.customer_id = c.customer_id
-                WHERE o.customer_id = ?
-                ORDER BY o.order_date DESC
-            """, (customer_id,))
+        # 创建订单；离线补录的订单带有原始下单时间
+        if order_date is None:
+            cursor.execute(STATEMENTS['order_insert'],
+                           (customer_id, status.upper(), payment_method.upper(), total_amount))
         else:
-            cursor.execute("""
-                SELECT o.order_id, c.name, o.order_date, o.status, o.payment_method, o.total_amount
-                FROM orders o
-                JOIN customer c ON o.customer_id = c.customer_id
-                ORDER BY o.order_date DESC
-            """)
+            cursor.execute(STATEMENTS['order_insert_dated'],
+                           (customer_id, order_date, status.upper(), payment_method.upper(), total_amount))
         
-        orders = cursor.fetchall()
-        conn.close()
-        return orders
+        order_id = cursor.lastrowid
+        
+        # 添加订单项：line_amount 在写入时直接给出，触发器不再补写
+        cursor.executemany(STATEMENTS['order_items_insert'], [(order_id,) + line for line in lines])
+        
+        return order_id
+    
+    def create_orders_bulk(self, orders, chunk_size=500):
+        """批量写入订单（POS 离线同步）
+
+        每 chunk_size 个订单作为一个写操作交给写队列（create_orders_chunk），与其他写操作一样由写线程提交，
+        不在请求线程里另开写事务争抢写锁；分块依次提交，其间排队的普通写操作不必等整批写完。
+        单个订单失败只回滚该订单自身（SAVEPOINT）。带 idempotency_key 的订单重复提交时不会重复创建，
+        直接返回已有订单ID。返回与输入顺序一致的结果列表。
+        """
+        results, chunks = self.prepare_orders_bulk(orders, chunk_size)
+        for valid in chunks:
+            for index, result in self.writes.create_orders_chunk(valid).result():
+                results[index] = result
+        return results
+
+    def prepare_orders_bulk(self, orders, chunk_size=500):
+        """校验批量订单并分块，返回 (结果列表, 待写入的块列表)
+
+        结果列表中已填好校验失败的订单，其余位置为 None；每块为 create_orders_chunk 的参数。
+        """
+        results = [None] * len(orders)
+        chunks = []
+        for start in range(0, len(orders), chunk_size):
+            valid = []
+            for index, order in enumerate(orders[start:start + chunk_size], start):
+                key = order.get('idempotency_key') if isinstance(order, dict) else None
+                try:
+                    valid.append((index, key, self._normalize_bulk_order(order)))
+                except (TypeError, ValueError, KeyError) as e:
+                    results[index] = self._bulk_result(index, key, error=str(e))
+            if valid:
+                chunks.append(valid)
+        return results, chunks
+
+    def create_orders_chunk(self, valid):
+        """在一个事务中写入一块已校验的批量订单，返回 [(下标, 结果), ...]
+
+        valid 为 [(下标, idempotency_key, 整理后的订单), ...]。经写线程执行时处在写线程的事务中；
+        直接调用（关闭写队列）时自己开 BEGIN IMMEDIATE 事务。
+        """
+        results = []
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            if not conn.in_transaction:
+                # 先拿写锁再查幂等键，避免并发请求同时写入同一个键
+                cursor.execute("BEGIN IMMEDIATE")
+            prices = self._lookup_prices(
+                cursor, [item['product_id'] for _, _, order in valid for item in order['items']])
+            existing = self._lookup_idempotency_keys(cursor, [key for _, key, _ in valid if key])
+
+            for index, key, order in valid:
+                if key and key in existing:
+                    results.append((index, self._bulk_result(index, key, order_id=existing[key],
+                                                              duplicate=True)))
+                    continue
+                missing = sorted({item['product_id'] for item in order['items']} - prices.keys())
+                if missing:
+                    results.append((index, self._bulk_result(index, key, error=f"产品不存在: {missing}")))
+                    continue
+
+                cursor.execute("SAVEPOINT bulk_order")
+                try:
+                    customer_id = order['customer_id']
+                    if not customer_id:
+                        customer = order['customer']
+                        customer_id = self._insert_customer(
+                            cursor, customer['name'], customer.get('phone', ''),
+                            customer.get('email', ''), customer.get('address', ''),
+                            customer.get('customer_type', 'GUEST'))
+                    order_id = self._insert_order(cursor, customer_id, order['payment_method'],
+                                                  order['items'], order['status'], prices,
+                                                  order_date=order['order_date'])
+                    if key:
+                        cursor.execute(STATEMENTS['idempotency_insert'], (key, order_id))
+                    cursor.execute("RELEASE bulk_order")
+                except sqlite3.Error as e:
+                    cursor.execute("ROLLBACK TO bulk_order")
+                    cursor.execute("RELEASE bulk_order")
+                    results.append((index, self._bulk_result(index, key, error=str(e))))
+                    continue
+
+                if key:
+                    # 同一批次中重复出现的键也视为重复提交
+                    existing[key] = order_id
+                results.append((index, self._bulk_result(index, key, order_id=order_id)))
+        return results
+
+    def _lookup_idempotency_keys(self, cursor, keys):
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), 500):
+            cursor.execute(*in_list_statement('idempotency_keys_in', keys[start:start + 500]))
+            found.update(cursor.fetchall())
+        return found
+
+    @staticmethod
+    def _normalize_bulk_order(order):
+        """校验单个批量订单并整理成统一结构，不合法时抛出 ValueError"""
+        if not isinstance(order, dict):
+            raise ValueError("订单必须是对象")
+        key = order.get('idempotency_key')
+        if key is not None and (not isinstance(key, str) or not key or len(key) > 128):
+            raise ValueError("idempotency_key 必须是 1-128 个字符的字符串")
+        if not order.get('payment_method'):
+            raise ValueError("缺少 payment_method")
+        items = order.get('items')
+        if not items or not isinstance(items, list):
+            raise ValueError("订单至少需要一个商品")
+        normalized_items = []
+        for item in items:
+            quantity = int(item['quantity'])
+            if quantity <= 0:
+                raise ValueError("商品数量必须大于 0")
+            normalized_items.append({'product_id': int(item['product_id']), 'quantity': quantity})
+
+        customer_id = order.get('customer_id')
+        customer = None
+        if not customer_id:
+            if not order.get('customer_name'):
+                raise ValueError("缺少 customer_id 或 customer_name")
+            customer = {
+                'name': order['customer_name'],
+                'phone': order.get('customer_phone', ''),
+                'email': order.get('customer_email', ''),
+                'address': order.get('customer_address', ''),
+                'customer_type': order.get('customer_type', 'GUEST'),
+            }
+
+        order_date = order.get('order_date')
+        if order_date:
+            # 统一成 SQLite CURRENT_TIMESTAMP 的格式（UTC）
+            parsed = datetime.fromisoformat(str(order_date).replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+            order_date = parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+        return {
+            'customer_id': int(customer_id) if customer_id else None,
+            'customer': customer,
+            'payment_method': str(order['payment_method']),
+            'items': normalized_items,
+            'status': str(order.get('status', 'PLACED')),
+            'order_date': order_date or None,
+        }
+
+    @staticmethod
+    def _bulk_result(index, key, order_id=None, duplicate=False, error=None):
+        return {
+            'index': index,
+            'idempotency_key': key,
+            'success': error is None,
+            'order_id': order_id,
+            'duplicate': duplicate,
+            'error': error,
+        }
+    
+    def get_order_history(self, customer_id=None, limit=None, after=None, status=None,
+                          start_date=None, end_date=None):
+        """获取订单历史
+
+        按 (order_date, order_id) 倒序。after 为上一页返回的游标（见 encode_order_cursor），
+        配合 limit 做 keyset 分页；start_date/end_date 为闭区间日期（YYYY-MM-DD）。
+        """
+        query, params = self._order_history_query(customer_id, limit, after, status,
+                                                  start_date, end_date)
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def iter_order_history(self, customer_id=None, limit=None, after=None, status=None,
+                           start_date=None, end_date=None, batch_size=500):
+        """逐批读取订单历史（流式输出用），参数同 get_order_history"""
+        query, params = self._order_history_query(customer_id, limit, after, status,
+                                                  start_date, end_date)
+        return self._iter_query(query, params, batch_size)
+
+    def _order_history_query(self, customer_id, limit, after, status, start_date, end_date):
+        query = """
+            SELECT o.order_id, c.name, o.order_date, o.status, o.payment_method, o.total_amount
+            FROM orders o
+            JOIN customer c ON o.customer_id = c.customer_id
+            WHERE 1=1
+        """
+        params = []
+        if customer_id:
+            query += " AND o.customer_id = ?"
+            params.append(customer_id)
+        if status:
+            query += " AND o.status = ?"
+            params.append(status.upper())
+        lower, upper = day_range(start_date, end_date)
+        if lower:
+            query += " AND o.order_date >= ?"
+            params.append(lower)
+        if upper:
+            query += " AND o.order_date < ?"
+            params.append(upper)
+        if after:
+            query += " AND (o.order_date, o.order_id) < (?, ?)"
+            params.extend(decode_order_cursor(after))
+        query += " ORDER BY o.order_date DESC, o.order_id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return query, params
+
+    def get_order_page(self, limit, after=None, **filters):
+        """取一页订单，返回 (订单列表, 下一页游标)；没有下一页时游标为 None"""
+        rows = self.get_order_history(limit=limit + 1, after=after, **filters)
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, encode_order_cursor(last[2], last[0])
     
     def get_order_details(self, order_id):
         """获取订单详情"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT oi.product_id, p.name, oi.quantity, oi.unit_price, oi.line_amount
-            FROM order_items oi
-            JOIN product p ON oi.product_id = p.product_id
-            WHERE oi.order_id = ?
-        """, (order_id,))
-        
-        items = cursor.fetchall()
-        conn.close()
-        return items
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['order_details'], (order_id,))
+            return cursor.fetchall()
     
+    def get_order_details_many(self, order_ids):
+        """批量读取订单及其订单项：订单与订单项各一次 IN 查询，共用一个连接
+
+        返回 [(订单行, 订单项行列表), ...]，按 order_ids 的顺序，不存在的订单跳过；
+        订单行结构同 get_order_history，订单项行同 get_order_details。
+        """
+        ids = list(dict.fromkeys(int(order_id) for order_id in order_ids))
+        if not ids:
+            return []
+        orders = {}
+        items = {order_id: [] for order_id in ids}
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), 500):
+                cursor.execute(*in_list_statement('orders_in', ids[start:start + 500]))
+                orders.update((row[0], row) for row in cursor)
+            self._fetch_order_items(cursor, [order_id for order_id in ids if order_id in orders], items)
+        return [(orders[order_id], items[order_id]) for order_id in ids if order_id in orders]
+
+    def get_order_items_many(self, order_ids):
+        """用 IN 查询批量读取多个订单的订单项，返回 {order_id: [订单项行, ...]}（行结构同 get_order_details）"""
+        items = {int(order_id): [] for order_id in order_ids}
+        if not items:
+            return items
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            self._fetch_order_items(cursor, list(items), items)
+        return items
+
+    def _fetch_order_items(self, cursor, order_ids, items):
+        for start in range(0, len(order_ids), 500):
+            cursor.execute(*in_list_statement('order_items_in', order_ids[start:start + 500]))
+            for row in cursor:
+                items[row[0]].append(row[1:])
+
+    def get_active_orders_snapshot(self, statuses=ACTIVE_ORDER_STATUSES, since=None):
+        """活跃订单索引的预热数据：在同一个读事务里取最新 event_id、状态属于 statuses 且在 since
+        （'YYYY-MM-DD HH:MM:SS'，None 不限制）之后下单的订单（按下单时间先后，走 idx_orders_status_date）
+        及其订单项，返回 (event_id, orders, items)
+        """
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            # 显式读事务：三次查询看到同一个快照，之后从 event_id 开始增量更新不会漏也不会重
+            cursor.execute("BEGIN")
+            try:
+                event_id = cursor.execute(STATEMENTS['order_events_latest']).fetchone()[0]
+                query, params = in_list_statement('orders_by_status_in', list(statuses))
+                # 空串早于任何下单时间，不限制时同样使用这一条语句
+                cursor.execute(query, params + [since or ''])
+                orders = cursor.fetchall()
+                items = {order[0]: [] for order in orders}
+                self._fetch_order_items(cursor, list(items), items)
+            finally:
+                conn.rollback()
+        return event_id, orders, items
+
     def get_sales_report(self, start_date=None, end_date=None):
-        """获取销售报告"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
+        """获取销售报告（读取按日汇总表 daily_sales，开销只与天数相关）"""
         base_query = """
             SELECT 
-                DATE(o.order_date) as order_date,
-                COUNT(o.order_id) as order_count,
-                SUM(o.total_amount) as total_sales,
-                AVG(o.total_amount) as avg_order_value
-            FROM orders o
+                sale_date as order_date,
+                SUM(order_count) as order_count,
+                SUM(total_sales) as total_sales,
+                SUM(total_sales) * 1.0 / SUM(order_count) as avg_order_value
+            FROM daily_sales
             WHERE 1=1
         """
         
         params = []
-        if start_date:
-            base_query += " AND DATE(o.order_date) >= ?"
-            params.append(start_date)
-        if end_date:
-            base_query += " AND DATE(o.order_date) <= ?"
-            params.append(end_date)
+        lower, upper = day_range(start_date, end_date)
+        if lower:
+            base_query += " AND sale_date >= ?"
+            params.append(lower)
+        if upper:
+            base_query += " AND sale_date < ?"
+            params.append(upper)
             
-        base_query += " GROUP BY DATE(o.order_date) ORDER BY order_date DESC"
+        base_query += " GROUP BY sale_date HAVING SUM(order_count) > 0 ORDER BY sale_date DESC"
         
-        cursor.execute(base_query, params)
-        report = cursor.fetchall()
-        conn.close()
-        return report
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(base_query, params)
+            return cursor.fetchall()
+
+    def rebuild_daily_sales(self, start_date=None, end_date=None):
+        """从 orders 重新计算 daily_sales（补数或修复），可限定日期范围，返回重建的行数"""
+        lower, upper = day_range(start_date, end_date)
+        delete_query = "DELETE FROM daily_sales WHERE 1=1"
+        insert_query = """
+            INSERT INTO daily_sales (sale_date, status, order_count, total_sales)
+            SELECT DATE(order_date), status, COUNT(*), ROUND(SUM(total_amount), 2)
+            FROM orders
+            WHERE 1=1
+        """
+        delete_params = []
+        insert_params = []
+        if lower:
+            delete_query += " AND sale_date >= ?"
+            delete_params.append(lower)
+            insert_query += " AND order_date >= ?"
+            insert_params.append(lower)
+        if upper:
+            delete_query += " AND sale_date < ?"
+            delete_params.append(upper)
+            insert_query += " AND order_date < ?"
+            insert_params.append(upper)
+        insert_query += " GROUP BY DATE(order_date), status"
+
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(delete_query, delete_params)
+            cursor.execute(insert_query, insert_params)
+            return cursor.rowcount
     
-    def get_product_sales_report(self):
-        """获取产品销售报告"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                p.name as product_name,
-                c.category_name,
-                SUM(oi.quantity) as total_quantity,
-                SUM(oi.line_amount) as total_revenue,
-                COUNT(DISTINCT oi.order_id) as order_count
-            FROM order_items oi
-            JOIN product p ON oi.product_id = p.product_id
-            JOIN category c ON p.category_id = c.category_id
-            GROUP BY p.product_id, p.name, c.category_name
-            ORDER BY total_revenue DESC
-        """)
-        
-        report = cursor.fetchall()
-        conn.close()
-        return report
+    def get_product_sales_report(self, start_date=None, end_date=None, top_n=None):
+        """获取产品销售报告（按销售额排序，可限定日期范围和只取前 top_n 个产品）"""
+        query, params = self._product_sales_query(start_date, end_date, top_n)
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def iter_product_sales_report(self, start_date=None, end_date=None, top_n=None, batch_size=500):
+        """逐批读取产品销售报告（流式输出用）"""
+        query, params = self._product_sales_query(start_date, end_date, top_n)
+        return self._iter_query(query, params, batch_size)
+
+    @staticmethod
+    def _product_sales_query(start_date, end_date, top_n):
+        if top_n is not None and int(top_n) <= 0:
+            raise ValueError("top_n 必须是正整数")
+        query = PRODUCT_SALES_REPORT_SQL
+        params = []
+        lower, upper = day_range(start_date, end_date)
+        if lower:
+            query += " AND s.sale_date >= ?"
+            params.append(lower)
+        if upper:
+            query += " AND s.sale_date < ?"
+            params.append(upper)
+        query += " GROUP BY s.product_id ORDER BY total_revenue DESC"
+        if top_n is not None:
+            query += " LIMIT ?"
+            params.append(int(top_n))
+        return query, params
+
+    def rebuild_product_sales(self, start_date=None, end_date=None):
+        """从 orders/order_items 重新计算 product_sales_daily，可限定日期范围，返回重建的行数"""
+        lower, upper = day_range(start_date, end_date)
+        delete_query = "DELETE FROM product_sales_daily WHERE 1=1"
+        insert_query = """
+            INSERT INTO product_sales_daily (sale_date, product_id, quantity, revenue, order_count)
+            SELECT DATE(o.order_date), oi.product_id, SUM(oi.quantity),
+                   ROUND(SUM(COALESCE(oi.line_amount, oi.quantity * oi.unit_price)), 2),
+                   COUNT(DISTINCT oi.order_id)
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.order_id
+            WHERE 1=1
+        """
+        delete_params = []
+        insert_params = []
+        if lower:
+            delete_query += " AND sale_date >= ?"
+            delete_params.append(lower)
+            insert_query += " AND o.order_date >= ?"
+            insert_params.append(lower)
+        if upper:
+            delete_query += " AND sale_date < ?"
+            delete_params.append(upper)
+            insert_query += " AND o.order_date < ?"
+            insert_params.append(upper)
+        insert_query += " GROUP BY DATE(o.order_date), oi.product_id"
+
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(delete_query, delete_params)
+            cursor.execute(insert_query, insert_params)
+            return cursor.rowcount
     
     def get_customer_report(self):
         """获取客户报告"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                c.name as customer_name,
-                c.customer_type,
-                COUNT(o.order_id) as order_count,
-                SUM(o.total_amount) as total_spent,
-                AVG(o.total_amount) as avg_order_value,
-                MAX(o.order_date) as last_order_date
-            FROM customer c
-            LEFT JOIN orders o ON c.customer_id = o.customer_id
-            GROUP BY c.customer_id, c.name, c.customer_type
-            ORDER BY total_spent DESC
-        """)
-        
-        report = cursor.fetchall()
-        conn.close()
-        return report
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['customer_report'])
+            return cursor.fetchall()
+
+    def iter_customer_report(self, batch_size=500):
+        """逐批读取客户报告（流式输出用）"""
+        return self._iter_query(STATEMENTS['customer_report'], (), batch_size)
+
+    def rebuild_customer_stats(self):
+        """从 orders 重新计算 customer_stats（修复或批量导入后使用），返回重建的行数"""
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['customer_stats_rebuild_delete'])
+            cursor.execute(STATEMENTS['customer_stats_rebuild_insert'])
+            return cursor.rowcount
+
+    def check_customer_stats(self):
+        """对比 customer_stats 与订单表实算值，返回不一致的客户列表（空列表表示一致）"""
+        with self.db_manager.connection() as conn:
+            rows = conn.execute(STATEMENTS['customer_stats_check']).fetchall()
+        return [{
+            'customer_id': row[0],
+            'stored': None if row[1] is None else
+                {'order_count': row[1], 'total_spent': row[2], 'last_order_date': row[3]},
+            'expected': None if row[4] is None else
+                {'order_count': row[4], 'total_spent': row[5], 'last_order_date': row[6]},
+        } for row in rows]
+
+    def _iter_query(self, query, params, batch_size):
+        """以 fetchmany 分批读取结果的生成器，迭代结束（或被关闭）时归还连接"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
     
     def get_member_customers(self):
         """获取会员客户信息"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT c.customer_id, c.name, c.phone, c.email, c.address,
-                   m.date_of_birth, m.registration_date
-            FROM customer c
-            JOIN member_customers m ON c.customer_id = m.customer_id
-            ORDER BY m.registration_date DESC
-        """)
-        
-        members = cursor.fetchall()
-        conn.close()
-        return members
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['member_customers'])
+            return cursor.fetchall()
     
     def verify_member_login(self, email, password):
-        """验证会员登录"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT c.customer_id, c.name, m.password_hash
-            FROM customer c
-            JOIN member_customers m ON c.customer_id = m.customer_id
-            WHERE c.email = ? AND c.customer_type = 'MEMBER'
-        """, (email,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result and self.db_manager.verify_password(password, result[2]):
-            return {'customer_id': result[0], 'name': result[1]}
-        return None
+        """验证会员登录
+
+        按会员邮箱唯一索引（ux_customer_member_email）取出存储的哈希；最近验证过的同一密码直接命中
+        已验证凭据缓存，否则在密码哈希线程池中校验。早期 SHA-256 或参数过时的哈希在校验成功后
+        按当前参数重新计算，经写队列异步写回，不增加本次登录的耗时。
+        排队的哈希任务过多时抛出 PasswordHasherBusy。
+
+        成功时返回会员信息及新签发的会话令牌 token（expires_at 为过期时间戳）。
+        """
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['member_login'], (email,))
+            result = cursor.fetchone()
+        if not result:
+            return None
+
+        customer_id, name, stored = result
+        passwords = self.db_manager.passwords
+        if not passwords.cached(customer_id, stored, password):
+            ok, needs_rehash = passwords.verify(password, stored)
+            if not ok:
+                return None
+            passwords.remember(customer_id, stored, password)
+            if needs_rehash:
+                try:
+                    self.writes.rehash_member_password(customer_id, stored, password)
+                except PasswordHasherBusy:
+                    pass  # 下次登录再升级
+        token, expires_at = self.sessions.issue(customer_id)
+        return {'customer_id': customer_id, 'name': name, 'token': token, 'expires_at': expires_at}
+
+    def update_member_password_hash(self, customer_id, old_hash, new_hash):
+        """把会员的密码哈希从 old_hash 换成 new_hash（登录时升级哈希用），返回是否更新"""
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['member_password_rehash'], (new_hash, customer_id, old_hash))
+            return cursor.rowcount == 1
     
+    def get_session_secret(self):
+        """会话令牌签名密钥（迁移 12 生成）"""
+        with self.db_manager.connection() as conn:
+            row = conn.execute(STATEMENTS['session_secret']).fetchone()
+        if row is None:
+            raise RuntimeError("缺少会话签名密钥，请先执行 python manage_jessdb.py migrate")
+        return row[0]
+
+    def get_session_revocations(self, after_id=0):
+        """revocation_id 大于 after_id 的吊销记录 [(revocation_id, token_id, expires_at), ...]"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['session_revocations_after'], (after_id,))
+            return cursor.fetchall()
+
+    def revoke_session_token(self, token_id, expires_at):
+        """记录吊销的令牌，并清理已过期的吊销记录"""
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['session_revocation_insert'], (token_id, expires_at))
+            cursor.execute(STATEMENTS['session_revocations_prune'], (int(time.time()),))
+
     def update_order_status(self, order_id, status):
         """更新订单状态"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("UPDATE orders SET status = ? WHERE order_id = ?", 
-                      (status.upper(), order_id))
-        
-        conn.commit()
-        conn.close()
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['order_status_update'], (status.upper(), order_id))
         
+    def get_order_events(self, after_id=0, limit=500):
+        """读取 event_id 大于 after_id 的订单事件（按 event_id 升序），附带订单当前的概要信息"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['order_events_after'], (after_id, limit))
+            return cursor.fetchall()
+
+    def latest_order_event_id(self):
+        with self.db_manager.connection() as conn:
+            return conn.execute(STATEMENTS['order_events_latest']).fetchone()[0]
+
+    def prune_order_events(self, days=7):
+        """删除 days 天前的订单事件，返回删除的行数；更早的断点无法再续传，客户端需重新加载列表"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        with self.db_manager.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['order_events_prune'], (cutoff,))
+            return cursor.rowcount
+
     def get_customer_by_id(self, customer_id):
         """根据ID获取客户信息"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT customer_id, name, phone, email, address, customer_type
-            FROM customer
-            WHERE customer_id = ?
-        """, (customer_id,))
-        
-        customer = cursor.fetchone()
-        conn.close()
-        return customer
\ No newline at end of file
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS['customer_by_id'], (customer_id,))
+            return cursor.fetchone()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+JessDB 演示/测试数据批量生成脚本
+
+在一个事务内用 executemany 批量写入客户、会员、订单和订单项，主键预先分配，
+订单金额和 line_amount 在写入前算好，不再逐单调用 create_order。
+相同的 --seed 和 --end-date 生成完全相同的数据。
+
+用法:
+    python demo_data_jessdb.py                                   # 演示规模
+    python demo_data_jessdb.py --db /tmp/bench.db --customers 20000 --orders 1000000
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from config_jessdb import JessDBConfig
+from database_jessdb import JessDBCoffeeShop
+
+PAYMENT_METHODS = ['CASH', 'CREDIT CARD', 'ALIPAY', 'WECHAT']
+# 订单状态分布：只有最后 --open-hours 小时内的订单可能仍在处理（PLACED/PENDING/PROCESSING），
+# 更早的订单都已完成或取消。否则多年前的订单永远挂在后厨队列、活跃订单索引和事件流里
+RECENT_STATUS_WEIGHTS = [('PLACED', 35), ('PENDING', 15), ('PROCESSING', 25), ('COMPLETED', 22),
+                         ('CANCELLED', 3)]
+HISTORY_STATUS_WEIGHTS = [('COMPLETED', 95), ('CANCELLED', 5)]
+# 批量写入期间临时移除的派生数据触发器，写完后统一重算
+SUSPENDED_TRIGGERS = ['trg_orders_daily_sales_insert', 'trg_orders_customer_stats_insert',
+                      'trg_order_items_product_sales_insert',
+                      # 历史订单不是实时事件，不写入 order_events
+                      'trg_orders_event_insert']
+
+
+def _suspend_triggers(conn, names):
+    """在当前事务中删除触发器，返回其建表语句用于恢复（事务回滚时触发器也随之恢复）"""
+    saved = []
+    for name in names:
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?",
+                           (name,)).fetchone()
+        if row:
+            conn.execute(f"DROP TRIGGER {name}")
+            saved.append(row[0])
+    return saved
+
+
+def generate_customers(cursor, count, member_ratio, rng, password_hash):
+    """写入 count 个客户（约 member_ratio 为会员），返回新客户ID列表"""
+    start_id = cursor.execute("SELECT COALESCE(MAX(customer_id), 0) FROM customer").fetchone()[0] + 1
+    customers = []
+    members = []
+    for customer_id in range(start_id, start_id + count):
+        is_member = rng.random() < member_ratio
+        customers.append((customer_id, f'Customer {customer_id}', f'+852{rng.randint(50000000, 99999999)}',
+                          f'customer{customer_id}@demo.example' if is_member else None, None,
+                          'MEMBER' if is_member else 'GUEST'))
+        if is_member:
+            members.append((customer_id, password_hash,
+                            f'{rng.randint(1960, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'))
+    cursor.executemany("""
+        INSERT INTO customer (customer_id, name, phone, email, address, customer_type)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, customers)
+    cursor.executemany("""
+        INSERT INTO member_customers (customer_id, password_hash, date_of_birth)
+        VALUES (?, ?, ?)
+    """, members)
+    return list(range(start_id, start_id + count))
+
+
+def generate_orders(cursor, customer_ids, count, start, end, rng, batch_size=50000, progress=None,
+                    open_after=None):
+    """写入 count 个订单及订单项，下单时间按时间顺序均匀分布在 [start, end) 内
+
+    open_after 之后下单的订单按 RECENT_STATUS_WEIGHTS 取状态，之前的按 HISTORY_STATUS_WEIGHTS；
+    open_after 为空时全部按历史订单处理。
+    """
+    products = cursor.execute("SELECT product_id, price FROM product WHERE is_active = 'Y'").fetchall()
+    if not products or not customer_ids:
+        raise ValueError("需要至少一个在售产品和一个客户")
+    recent_statuses, recent_weights = zip(*RECENT_STATUS_WEIGHTS)
+    history_statuses, history_weights = zip(*HISTORY_STATUS_WEIGHTS)
+    step = (end - start).total_seconds() / max(count, 1)
+    max_lines = min(5, len(products))
+
+    order_id = cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders").fetchone()[0]
+    item_id = cursor.execute("SELECT COALESCE(MAX(order_item_id), 0) FROM order_items").fetchone()[0]
+    orders = []
+    items = []
+    for i in range(count):
+        order_id += 1
+        total_amount = 0
+        for product_id, price in rng.sample(products, rng.randint(1, max_lines)):
+            item_id += 1
+            quantity = rng.randint(1, 3)
+            line_amount = quantity * price
+            total_amount += line_amount
+            items.append((item_id, order_id, product_id, quantity, price, line_amount))
+        ordered_at = start + timedelta(seconds=i * step)
+        if open_after is not None and ordered_at >= open_after:
+            status = rng.choices(recent_statuses, recent_weights)[0]
+        else:
+            status = rng.choices(history_statuses, history_weights)[0]
+        orders.append((order_id, rng.choice(customer_ids), ordered_at.strftime('%Y-%m-%d %H:%M:%S'),
+                       status, rng.choice(PAYMENT_METHODS), total_amount))
+
+        if len(orders) >= batch_size or i == count - 1:
+            cursor.executemany("""
+                INSERT INTO orders (order_id, customer_id, order_date, status, payment_method, total_amount)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, orders)
+            cursor.executemany("""
+                INSERT INTO order_items (order_item_id, order_id, product_id, quantity, unit_price, line_amount)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, items)
+            orders = []
+            items = []
+            if progress:
+                progress(i + 1, count)
+
+
+def generate_dataset(shop, customers=200, orders=2000, days=90, member_ratio=0.3, seed=42,
+                     end_date=None, batch_size=50000, progress=None, open_hours=2.0):
+    """在一个事务内生成完整数据集，返回 (客户数, 订单数)
+
+    只有最后 open_hours 小时内的订单可能处于未完成状态（后厨队列的规模随之与订单速率相当）。
+
+    订单写入期间暂停 daily_sales、customer_stats、product_sales_daily 的逐行触发器，写完后重算汇总
+    （按日汇总只重算涉及的日期范围）。
+    """
+    rng = random.Random(seed)
+    end_day = date.fromisoformat(end_date) if end_date else date.today()
+    end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    start = end - timedelta(days=days)
+    open_after = end - timedelta(hours=open_hours)
+    password_hash = shop.db_manager.hash_password('password')
+
+    with shop.db_manager.transaction() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        customer_ids = generate_customers(cursor, customers, member_ratio, rng, password_hash)
+        if not customer_ids:
+            customer_ids = [row[0] for row in cursor.execute("SELECT customer_id FROM customer")]
+        saved_triggers = _suspend_triggers(conn, SUSPENDED_TRIGGERS)
+        generate_orders(cursor, customer_ids, orders, start, end, rng, batch_size, progress, open_after)
+        for sql in saved_triggers:
+            conn.execute(sql)
+        shop.rebuild_daily_sales(start.date().isoformat(), end_day.isoformat())
+        shop.rebuild_product_sales(start.date().isoformat(), end_day.isoformat())
+        shop.rebuild_customer_stats()
+    shop.invalidate_menu_cache()
+    return customers, orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量生成 JessDB 演示/测试数据')
+    parser.add_argument('--db', help='数据库文件，默认读取 JESSDB_PATH（不存在时自动建库）')
+    parser.add_argument('--customers', type=int, default=200)
+    parser.add_argument('--member-ratio', type=float, default=0.3)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=90, help='订单分布的天数')
+    parser.add_argument('--end-date', help='最后一天（含），YYYY-MM-DD，默认今天')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=50000, help='每次 executemany 的订单数')
+    parser.add_argument('--open-hours', type=float, default=2.0,
+                        help='最后多少小时内的订单可能仍未完成，更早的订单都已完成或取消')
+    args = parser.parse_args()
+
+    config = JessDBConfig.from_env()
+    if args.db:
+        config.db_path = args.db
+    shop = JessDBCoffeeShop(config=config)
+
+    started = time.perf_counter()
+
+    def progress(done, total):
+        elapsed = time.perf_counter() - started
+        print(f"\r订单: {done}/{total}  {done / elapsed:,.0f} 单/秒", end='', flush=True)
+
+    customers, orders = generate_dataset(shop, args.customers, args.orders, args.days, args.member_ratio,
+                                         args.seed, args.end_date, args.batch_size, progress, args.open_hours)
+    elapsed = time.perf_counter() - started
+    with shop.db_manager.connection() as conn:
+        items = conn.execute("SELECT COUNT(*) FROM order_items").fetchone()[0]
+    print(f"\n完成：{customers} 个客户、{orders} 个订单，用时 {elapsed:.1f}s -> {config.db_path}"
+          f"（order_items 共 {items} 行）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+订单事件推送：order_events 表 -> 进程内缓冲 -> SSE 客户端
+
+order_events 由 orders 上的触发器写入（新订单、状态变更），所以无论哪个进程、哪条路径写入的订单
+都会出现在事件流里。每个进程只有一个轮询线程按 event_id 增量读取新事件，放进内存环形缓冲并唤醒
+等待中的订阅者；连接的客户端再多，数据库上也只有这一条轮询查询。本进程写线程提交后会立即唤醒
+轮询线程，其他进程写入的事件最迟一个轮询间隔后送达。
+
+    events = feed.wait(last_event_id, timeout=15)   # 同步（Flask 请求线程）
+    if feed.has_events_after(last_event_id):        # 只查内存，异步服务轮询用
+        events = feed.events_after(last_event_id)
+
+断点续传：客户端带上最后收到的 event_id，缓冲里还有就直接返回，更早的从数据库补读。
+
+ActiveOrderIndex 是事件流的另一个消费者：内存中的活跃订单（含订单项）索引，供后厨队列使用。
+"""
+
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from metrics_jessdb import REGISTRY
+
+
+class OrderEventFeed:
+    """订单事件的进程内分发
+
+    事件为 get_order_events 返回的行，第一列是 event_id。
+    """
+
+    def __init__(self, shop, poll_interval=0.5, buffer_size=1000, batch_size=500):
+        self.shop = shop
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._wakeup = threading.Event()
+        self._latest_id = None
+        self._thread = None
+        self.closed = False
+        self._pid = os.getpid()
+
+    def latest_id(self):
+        """当前最新的 event_id；新订阅者从这里开始只接收之后的事件"""
+        self._ensure_thread()
+        with self._cond:
+            return self._latest_id
+
+    def events_after(self, event_id, limit=None):
+        """event_id 之后的事件（不阻塞）；超出内存缓冲的部分从数据库读取"""
+        self._ensure_thread()
+        limit = limit or self.batch_size
+        with self._cond:
+            if event_id >= self._latest_id:
+                return []
+            if self._buffer and event_id >= self._buffer[0][0] - 1:
+                return [event for event in self._buffer if event[0] > event_id][:limit]
+        return self.shop.get_order_events(event_id, limit)
+
+    def has_events_after(self, event_id):
+        """是否已有 event_id 之后的事件（只读内存，不访问数据库）"""
+        self._ensure_thread()
+        return self._latest_id > event_id
+
+    def wait(self, event_id, timeout=None):
+        """阻塞到有 event_id 之后的事件或超时，返回事件列表（超时为空列表）"""
+        self._ensure_thread()
+        with self._cond:
+            self._cond.wait_for(lambda: self._latest_id > event_id or self.closed, timeout)
+        return self.events_after(event_id)
+
+    def notify(self):
+        """有新写入时调用（WriteQueue.on_commit），让轮询线程立即读取"""
+        self._wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self._wakeup.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _ensure_thread(self):
+        # 轮询线程不会随 fork 复制到子进程：进程号变化时丢弃继承来的状态（包括可能被锁住的条件变量），重新启动
+        if self._pid != os.getpid():
+            self._cond = threading.Condition()
+            self._wakeup = threading.Event()
+            self._buffer = deque(maxlen=self._buffer.maxlen)
+            self._thread = None
+            self._latest_id = None
+            self._pid = os.getpid()
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._latest_id = self.shop.latest_order_event_id()
+                self._thread = threading.Thread(target=self._run, name='jessdb-order-events', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self.closed:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"读取订单事件失败: {e}")
+
+    def _poll(self):
+        while True:
+            with self._cond:
+                after = self._latest_id
+            events = self.shop.get_order_events(after, self.batch_size)
+            if not events:
+                return
+            with self._cond:
+                self._buffer.extend(events)
+                self._latest_id = events[-1][0]
+                self._cond.notify_all()
+            if len(events) < self.batch_size:
+                return
+
+
+class ActiveOrderIndex:
+    """活跃订单（ACTIVE_ORDER_STATUSES）的内存索引，后厨队列直接读取
+
+    首次使用时从 get_active_orders_snapshot 预热（走 orders.status 索引），之后每次读取前
+    从 OrderEventFeed 取预热快照之后的事件增量更新：新订单或状态变为活跃的订单补读订单项加入，
+    变为非活跃的移除。读取只与活跃订单数有关，与 orders 表大小无关；条目按进入队列的先后排列。
+    每个条目为 (订单行, 订单项行列表)，行结构与 get_order_history / get_order_details 相同。
+
+    max_age（秒）为下单时间的上限：更早的订单即使状态仍未完成也不进入索引，已在索引中的到期后移除，
+    遗留的陈旧订单不会让后厨队列无限增长（仍可通过 /api/orders?status= 查到）。None 不限制。
+    """
+
+    def __init__(self, shop, feed, statuses, max_age=None):
+        self.shop = shop
+        self.feed = feed
+        self.statuses = frozenset(statuses)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._orders = None  # order_id -> (order, items)，插入顺序即队列顺序
+        self._event_id = 0
+        REGISTRY.gauge('jessdb_active_orders', '内存索引中的活跃订单数', (),
+                       lambda: {(): len(self._orders or ())})
+
+    def warm(self):
+        """（重新）从数据库加载活跃订单"""
+        event_id, orders, items = self.shop.get_active_orders_snapshot(tuple(sorted(self.statuses)),
+                                                                       since=self._cutoff())
+        with self._lock:
+            self._orders = {order[0]: (order, items[order[0]]) for order in orders}
+            self._event_id = event_id
+
+    def orders(self, limit=None):
+        """返回 (队列最前面的 limit 个活跃订单 [(订单行, 订单项行列表), ...], 对应的 event_id, 活跃订单总数)"""
+        if self._orders is None:
+            self.warm()
+        with self._lock:
+            self._catch_up()
+            self._expire()
+            entries = self._orders.values()
+            selected = list(entries if limit is None else islice(entries, limit))
+            return selected, self._event_id, len(self._orders)
+
+    def _cutoff(self):
+        """最早纳入索引的下单时间（UTC，与 order_date 同格式）；不限制时为 None"""
+        if self.max_age is None:
+            return None
+        return (datetime.now(timezone.utc) - timedelta(seconds=self.max_age)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def _expire(self):
+        cutoff = self._cutoff()
+        if cutoff is None:
+            return
+        for order_id in [order_id for order_id, (order, _) in self._orders.items() if order[2] < cutoff]:
+            del self._orders[order_id]
+
+    def _catch_up(self):
+        cutoff = self._cutoff()
+        while self.feed.has_events_after(self._event_id):
+            events = self.feed.events_after(self._event_id)
+            if not events:
+                return
+            added = {}
+            for event in events:
+                order_id, status = event[2], event[4]
+                if status not in self.statuses or event[7] is None:
+                    # 变为非活跃，或订单已被删除
+                    self._orders.pop(order_id, None)
+                    added.pop(order_id, None)
+                elif order_id in self._orders:
+                    order, items = self._orders[order_id]
+                    self._orders[order_id] = (order[:3] + (status,) + order[4:], items)
+                elif cutoff is not None and event[7] < cutoff:
+                    # 陈旧订单重新变为活跃（或补录的早期订单）不进入后厨队列
+                    continue
+                else:
+                    # 订单行结构同 get_order_history：(order_id, 客户名, 下单时间, 状态, 支付方式, 金额)
+                    added[order_id] = (order_id, event[6], event[7], status, event[8], event[9])
+            if added:
+                items = self.shop.get_order_items_many(list(added))
+                for order_id, order in added.items():
+                    self._orders[order_id] = (order, items[order_id])
+            self._event_id = events[-1][0]
@@ -0,0 +1,59 @@
+"""
+gunicorn 生产配置：多进程 × 多线程运行 app_jessdb.app
+
+    gunicorn -c gunicorn_jessdb.conf.py app_jessdb:app
+    ./start_jessdb.sh prod
+
+环境变量:
+    JESSDB_BIND       监听地址，默认 0.0.0.0:5000
+    JESSDB_WORKERS    工作进程数，默认 CPU 核数
+    JESSDB_THREADS    每个进程的线程数，默认 4（不应超过 JESSDB_POOL_SIZE）
+    JESSDB_TIMEOUT    单个请求超时秒数，默认 60
+    JESSDB_PRELOAD    1 时在主进程预加载应用（迁移只执行一次、fork 更快），
+                      但 HUP 重载不会载入新代码；默认 0
+    JESSDB_PIDFILE    主进程 pid 文件，默认 jessdb_gunicorn.pid
+    JESSDB_SSE_MAX_SUBSCRIBERS
+                      每个进程同时保持的订单事件流（/api/orders/events）连接数，默认 JESSDB_THREADS 的一半
+
+订单事件流是长连接，在 gthread 下每个连接独占一个线程直到断开。JESSDB_SSE_MAX_SUBSCRIBERS 给每个进程
+留出其余线程处理普通请求，超出的订阅返回 503（带 Retry-After），浏览器稍后自动重连。整个服务能同时
+推送的客户端数为 JESSDB_WORKERS × JESSDB_SSE_MAX_SUBSCRIBERS；页面只在管理后台的仪表盘/订单管理、
+顾客的订单历史标签页可见时订阅。需要更多实时客户端时，用异步应用（app_jessdb_async，hypercorn）单独提供事件流，
+它的事件流只是协程，不占线程，也不受这个上限约束。
+
+平滑重载：kill -HUP $(cat jessdb_gunicorn.pid)（或 ./start_jessdb.sh reload），
+主进程重新读取配置并启动新工作进程，旧进程处理完手头请求后退出。
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('JESSDB_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('JESSDB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('JESSDB_THREADS', 4))
+# 工作进程导入应用时读取（JessDBConfig.from_env），这里按线程数给出默认值
+os.environ.setdefault('JESSDB_SSE_MAX_SUBSCRIBERS', str(max(1, threads // 2)))
+timeout = int(os.environ.get('JESSDB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# 定期回收工作进程，避免长时间运行的内存增长；加抖动避免同时重启
+max_requests = 10000
+max_requests_jitter = 1000
+preload_app = os.environ.get('JESSDB_PRELOAD', '0') == '1'
+pidfile = os.environ.get('JESSDB_PIDFILE', 'jessdb_gunicorn.pid')
+accesslog = '-'
+errorlog = '-'
+proc_name = 'jessdb'
+
+
+def post_fork(server, worker):
+    """预加载时子进程继承了主进程打开的 SQLite 连接，不能跨 fork 使用，在这里全部丢弃"""
+    if preload_app:
+        from app_jessdb import db
+        db.db_manager.after_fork()
+
+
+def when_ready(server):
+    server.log.info("jessdb: %s workers x %s threads on %s (max %s event streams per worker)",
+                    workers, threads, bind, os.environ['JESSDB_SSE_MAX_SUBSCRIBERS'])
@@ -66,6 +66,8 @@ CREATE TABLE order_items (
   FOREIGN KEY (product_id) REFERENCES product(product_id)
 );
 
+-- 二级索引不在此脚本中创建，统一由 database_jessdb.py 的 MIGRATIONS 按版本维护
+
 -- 触发器
 CREATE TRIGGER trg_mc_insupd
 BEFORE INSERT ON member_customers
@@ -87,6 +89,7 @@ END;
 CREATE TRIGGER trg_order_items_line_amount_insert
 AFTER INSERT ON order_items
 FOR EACH ROW
+WHEN NEW.line_amount IS NULL
 BEGIN
   UPDATE order_items 
   SET line_amount = NEW.quantity * NEW.unit_price 
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+JessDB 维护命令
+
+用法:
+    python manage_jessdb.py migrate        执行尚未应用的数据库迁移
+    python manage_jessdb.py check-plans    检查热点查询的执行计划，出现全表扫描时返回非零退出码
+    python manage_jessdb.py rebuild-rollups [--start-date D] [--end-date D]
+                                           从订单表重建 daily_sales、product_sales_daily 汇总
+    python manage_jessdb.py check-customer-stats [--rebuild]
+                                           核对 customer_stats 与订单表，不一致时返回非零退出码；
+                                           --rebuild 直接全量重算
+    python manage_jessdb.py prune-events [--days N]
+                                           删除 N 天（默认 7）前的订单事件
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+from config_jessdb import JessDBConfig
+from database_jessdb import JessDBCoffeeShop, MigrationError, encode_order_cursor
+from metrics_jessdb import find_full_scans
+
+# 热点查询：(名称, 调用方式)。check-plans 会执行这些方法并对其中的每条 SELECT 做 EXPLAIN QUERY PLAN
+HOT_QUERIES = [
+    ('get_order_history(customer_id)', lambda shop: shop.get_order_history(1)),
+    ('get_order_history(after cursor)',
+     lambda shop: shop.get_order_history(limit=50, after=encode_order_cursor('2025-01-01 00:00:00', 1))),
+    ('get_order_history(status, date range)',
+     lambda shop: shop.get_order_history(limit=50, status='PLACED', start_date='2025-01-01',
+                                         end_date='2025-01-31')),
+    ('get_order_details(order_id)', lambda shop: shop.get_order_details(1)),
+    ('verify_member_login(email)', lambda shop: shop.verify_member_login('wei.zhang@email.com', 'x')),
+    ('get_sales_report(start, end)', lambda shop: shop.get_sales_report('2025-01-01', '2025-01-31')),
+    ('get_product_sales_report(start, end)',
+     lambda shop: shop.get_product_sales_report('2025-01-01', '2025-01-31', top_n=10)),
+    ('get_customer_by_id(customer_id)', lambda shop: shop.get_customer_by_id(1)),
+    ('get_active_orders_snapshot(statuses, since)',
+     lambda shop: shop.get_active_orders_snapshot(
+         since=(datetime.now(timezone.utc) - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S'))),
+]
+
+
+def capture_statements(shop, call):
+    """执行一次调用并记录其在连接上执行的全部 SQL（参数已展开）"""
+    statements = []
+    with shop.db_manager.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            call(shop)
+        finally:
+            conn.set_trace_callback(None)
+    return statements
+
+
+def explain(shop, sql):
+    with shop.db_manager.connection() as conn:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def check_plans(shop, out=sys.stdout):
+    failures = 0
+    for name, call in HOT_QUERIES:
+        for sql in capture_statements(shop, call):
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = explain(shop, sql)
+            scans = find_full_scans(plan)
+            status = 'SCAN' if scans else 'OK'
+            print(f"[{status}] {name}", file=out)
+            for detail in plan:
+                print(f"    {detail}", file=out)
+            if scans:
+                failures += 1
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='JessDB 维护命令')
+    parser.add_argument('--db', help='数据库文件，默认读取 JESSDB_PATH')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('migrate', help='执行尚未应用的迁移')
+    subparsers.add_parser('check-plans', help='检查热点查询是否走索引')
+    rebuild = subparsers.add_parser('rebuild-rollups', help='重建销售汇总表')
+    rebuild.add_argument('--start-date', help='起始日期（含），YYYY-MM-DD')
+    rebuild.add_argument('--end-date', help='结束日期（含），YYYY-MM-DD')
+    customer_stats = subparsers.add_parser('check-customer-stats', help='核对/重建客户累计汇总表')
+    customer_stats.add_argument('--rebuild', action='store_true', help='从订单表全量重算')
+    prune_events = subparsers.add_parser('prune-events', help='清理过期的订单事件')
+    prune_events.add_argument('--days', type=int, default=7, help='保留最近几天的事件')
+    args = parser.parse_args(argv)
+
+    config = JessDBConfig.from_env()
+    if args.db:
+        config.db_path = args.db
+    # JessDBManager 初始化时会自动执行迁移
+    try:
+        shop = JessDBCoffeeShop(config=config)
+    except MigrationError as e:
+        print(f"迁移失败: {e}", file=sys.stderr)
+        return 1
+
+    if args.command == 'migrate':
+        print(f"当前数据库版本: {shop.db_manager.schema_version()}")
+        return 0
+    if args.command == 'check-plans':
+        failures = check_plans(shop)
+        if failures:
+            print(f"{failures} 条热点查询出现全表扫描", file=sys.stderr)
+            return 1
+        print("所有热点查询均使用索引")
+        return 0
+    if args.command == 'rebuild-rollups':
+        rows = shop.rebuild_daily_sales(args.start_date, args.end_date)
+        print(f"daily_sales 已重建 {rows} 行")
+        rows = shop.rebuild_product_sales(args.start_date, args.end_date)
+        print(f"product_sales_daily 已重建 {rows} 行")
+        return 0
+    if args.command == 'check-customer-stats':
+        if args.rebuild:
+            rows = shop.rebuild_customer_stats()
+            print(f"customer_stats 已重建 {rows} 行")
+            return 0
+        mismatches = shop.check_customer_stats()
+        for item in mismatches[:20]:
+            print(f"customer_id={item['customer_id']}  存储值={item['stored']}  实算值={item['expected']}")
+        if mismatches:
+            print(f"{len(mismatches)} 个客户的汇总不一致，可用 --rebuild 重算", file=sys.stderr)
+            return 1
+        print("customer_stats 与订单表一致")
+        return 0
+    if args.command == 'prune-events':
+        rows = shop.prune_order_events(args.days)
+        print(f"已删除 {rows} 条 {args.days} 天前的订单事件")
+        return 0
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
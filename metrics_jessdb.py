@@ -0,0 +1,548 @@
+"""
+JessDB 运行指标
+
+- SQL 级：InstrumentedConnection / InstrumentedCursor 记录每条语句的耗时（execute + fetch）、
+  返回行数和 SQL 指纹（字面量替换为 ?）
+- 方法级：instrument_methods 给 JessDBCoffeeShop 的公共方法计时
+- 请求级：begin_request()/end_request() 汇总单个请求内的 SQL 耗时和各阶段耗时，
+  app_jessdb.py 据此输出 Server-Timing 响应头
+
+所有指标登记在模块级 REGISTRY 中，render() 输出 Prometheus 文本格式。
+"""
+
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [各桶计数, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """返回 {labels: (累计桶计数列表, sum, count)}"""
+        with self._lock:
+            items = [(labels, list(series[0]), series[1], series[2]) for labels, series in self._series.items()]
+        result = {}
+        for labels, counts, total, count in items:
+            cumulative = []
+            running = 0
+            for value in counts:
+                running += value
+                cumulative.append(running)
+            result[labels] = (cumulative, total, count)
+        return result
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (cumulative, total, count) in sorted(self.snapshot().items()):
+            for bound, value in zip(self.buckets, cumulative):
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, ("le", bound))} {value}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, ("le", "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Gauge:
+    """取值时调用回调函数，回调返回 {labels 元组: 数值}"""
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        for labels, value in sorted(self.callback().items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames, callback):
+        """登记回调型 gauge；同名 gauge 以最后一次登记的回调为准"""
+        gauge = Gauge(name, documentation, labelnames, callback)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def render(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+SQL_DURATION = REGISTRY.histogram(
+    'jessdb_sql_query_duration_seconds', 'SQL 语句耗时（execute + fetch）', ['query'])
+SQL_ROWS = REGISTRY.counter('jessdb_sql_rows_total', 'SQL 语句返回的行数', ['query'])
+METHOD_DURATION = REGISTRY.histogram(
+    'jessdb_method_duration_seconds', 'JessDBCoffeeShop 方法耗时', ['method'])
+METHOD_ERRORS = REGISTRY.counter('jessdb_method_errors_total', 'JessDBCoffeeShop 方法抛出异常次数', ['method'])
+POOL_WAIT = REGISTRY.histogram('jessdb_pool_wait_seconds', '从连接池借出连接的等待时间')
+CONNECTIONS_OPENED = REGISTRY.counter('jessdb_connections_opened_total', '新建数据库连接数', ['kind'])
+WRITE_BATCH_SIZE = REGISTRY.histogram(
+    'jessdb_write_batch_size', '写线程每个事务合并提交的操作数', buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+WRITE_QUEUE_WAIT = REGISTRY.histogram('jessdb_write_queue_wait_seconds', '写操作从提交到开始执行的排队时间')
+PASSWORD_HASH_DURATION = REGISTRY.histogram(
+    'jessdb_password_hash_duration_seconds', '密码哈希线程池中每次 scrypt 计算的耗时', ['kind'])
+LOGIN_CACHE = REGISTRY.counter('jessdb_login_cache_total', '已验证凭据缓存的命中/未命中次数', ['result'])
+HTTP_DURATION = REGISTRY.histogram(
+    'jessdb_http_request_duration_seconds', 'HTTP 请求耗时（不含流式响应的输出过程）',
+    ['endpoint', 'method', 'status'])
+
+# 指纹 -> SQL 文本，供 jessdb_sql_query_info 输出
+_fingerprints = {}
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint_sql(sql):
+    """归一化 SQL：压缩空白、字面量替换为 ?、IN 列表折叠为 (?...)，返回 (指纹ID, 归一化文本)"""
+    text = _WHITESPACE.sub(' ', sql).strip()
+    text = _LITERALS.sub('?', text)
+    text = _IN_LIST.sub('(?...)', text)
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+    _fingerprints.setdefault(digest, text)
+    return digest, text
+
+
+REGISTRY.gauge('jessdb_sql_query_info', 'SQL 指纹对应的归一化语句', ['query', 'statement'],
+               lambda: {(digest, text): 1 for digest, text in list(_fingerprints.items())})
+
+
+# ---- 请求级汇总 ----
+
+# 用 ContextVar 而不是 threading.local：同步应用里每个请求线程各有一份，
+# 异步应用里每个请求任务各有一份，提交到线程池执行的数据库调用复制上下文后同样能记到所属请求上
+_request = contextvars.ContextVar('jessdb_request_timings', default=None)
+
+
+class RequestTimings:
+    """单个请求内的累计耗时"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_seconds = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.phases = {}
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self, total=None):
+        """生成 Server-Timing 头：sql、各阶段、其余应用代码（app）与总耗时"""
+        if total is None:
+            total = time.perf_counter() - self.started
+        entries = [f'sql;dur={self.sql_seconds * 1000:.3f};desc="{self.queries} queries, {self.rows} rows"']
+        for name, seconds in self.phases.items():
+            entries.append(f'{name};dur={seconds * 1000:.3f}')
+        other = max(0.0, total - self.sql_seconds - sum(self.phases.values()))
+        entries.append(f'app;dur={other * 1000:.3f}')
+        entries.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(entries)
+
+
+def begin_request():
+    timings = RequestTimings()
+    _request.set(timings)
+    return timings
+
+
+def end_request():
+    timings = _request.get()
+    _request.set(None)
+    return timings
+
+
+def current_request():
+    return _request.get()
+
+
+@contextmanager
+def phase(name):
+    """把代码块耗时计入当前请求的某个阶段（不在请求内时只是普通代码块）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = current_request()
+        if timings is not None:
+            timings.add_phase(name, time.perf_counter() - started)
+
+
+def record_query(sql, seconds, rows):
+    digest, _ = fingerprint_sql(sql)
+    SQL_DURATION.observe(seconds, digest)
+    if rows:
+        SQL_ROWS.inc(rows, digest)
+    timings = current_request()
+    if timings is not None:
+        timings.sql_seconds += seconds
+        timings.queries += 1
+        timings.rows += rows
+
+
+# ---- SQL 计时 ----
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录每条语句从 execute 到取完结果的累计耗时和行数
+
+    结果集读完（fetchall、fetchone 返回 None、fetchmany 不足一批、迭代结束）、
+    再次 execute、close 或游标被回收时提交一次记录；不返回结果的语句执行完立即记录。
+    """
+
+    _statement = None
+    _params = ()
+    _many = False
+    _elapsed = 0.0
+    _rows = 0
+
+    def _start(self, sql, params, many, elapsed):
+        self._finish()
+        self._statement = sql
+        self._params = params
+        self._many = many
+        self._elapsed = elapsed
+        self._rows = 0
+        if self.description is None:
+            self._finish()
+
+    def _fetched(self, elapsed, rows, done):
+        if self._statement is None:
+            return
+        self._elapsed += elapsed
+        self._rows += rows
+        if done:
+            self._finish()
+
+    def _finish(self):
+        if self._statement is not None:
+            sql, self._statement = self._statement, None
+            record_query(sql, self._elapsed, self._rows)
+            slow_log = getattr(self.connection, 'slow_query_log', None)
+            if slow_log is not None and self._elapsed >= slow_log.threshold:
+                slow_log.record(sql, self._params, self._elapsed, self._rows, many=self._many)
+            self._params = ()
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        result = super().execute(sql, parameters)
+        self._start(sql, parameters, False, time.perf_counter() - started)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        self._start(sql, seq_of_parameters, True, time.perf_counter() - started)
+        return result
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - started, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(time.perf_counter() - started, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(time.perf_counter() - started, 0, True)
+            raise
+        self._fetched(time.perf_counter() - started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3.connect(factory=...) 使用的连接类，conn.execute 等快捷方法同样经过 InstrumentedCursor"""
+
+    # 由 JessDBManager 设置；为 None 时不记录慢查询
+    slow_query_log = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+# ---- 慢查询日志 ----
+
+def find_full_scans(plan):
+    """执行计划中以 SCAN 开头的步骤即为全表（或全索引）扫描"""
+    return [detail for detail in plan if detail.startswith('SCAN ')]
+
+
+def _value_type(value):
+    return 'null' if value is None else type(value).__name__
+
+
+def param_shape(params, many=False):
+    """绑定参数的类型概要（不含取值），连续相同类型合并，如 "(int, str*3)"；executemany 为 "N x (...)" """
+    if many:
+        if not isinstance(params, (list, tuple)):
+            return 'iterable'
+        return f"{len(params)} x {param_shape(params[0]) if params else '()'}"
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {_value_type(value)}' for key, value in params.items()) + '}'
+    runs = []
+    for value in params:
+        name = _value_type(value)
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return '(' + ', '.join(name if count == 1 else f'{name}*{count}' for name, count in runs) + ')'
+
+
+_slow_loggers = {}
+_slow_loggers_lock = threading.Lock()
+
+
+def _slow_query_logger(path, max_bytes, backup_count):
+    """同一日志文件只挂一个 RotatingFileHandler，多个数据库管理器共用"""
+    path = os.path.abspath(path)
+    with _slow_loggers_lock:
+        logger = _slow_loggers.get(path)
+        if logger is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            logger = logging.getLogger(f'jessdb.slow_query.{len(_slow_loggers)}')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes,
+                                                           backupCount=backup_count, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            _slow_loggers[path] = logger
+        return logger
+
+
+class SlowQueryLog:
+    """记录超过阈值的语句：写入轮转日志（每行一个 JSON），并按 SQL 指纹汇总最慢的语句
+
+    执行计划通过单独的只读连接做 EXPLAIN QUERY PLAN 获取，不占用业务连接。
+    """
+
+    def __init__(self, db_path, threshold_ms=100.0, log_path=None, max_bytes=10 * 1024 * 1024,
+                 backup_count=5):
+        self.db_path = db_path
+        self.threshold = threshold_ms / 1000.0
+        self.logger = _slow_query_logger(log_path, max_bytes, backup_count) if log_path else None
+        self._stats = {}  # 指纹 -> 汇总
+        self._lock = threading.Lock()
+        self._explain_conn = None
+        self._explain_lock = threading.Lock()
+
+    def explain(self, sql, params, many=False):
+        """返回执行计划步骤列表；语句无法 EXPLAIN（如 BEGIN、PRAGMA）时返回空列表"""
+        if many:
+            if not isinstance(params, (list, tuple)) or not params:
+                return []
+            params = params[0]
+        with self._explain_lock:
+            try:
+                if self._explain_conn is None:
+                    # 超时设得很短：写事务持锁时宁可放弃执行计划，也不拖慢业务线程
+                    self._explain_conn = sqlite3.connect(self.db_path, timeout=0.1,
+                                                         check_same_thread=False)
+                return [row[3] for row in self._explain_conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+            except sqlite3.Error:
+                return []
+
+    def record(self, sql, params, seconds, rows, many=False):
+        digest, text = fingerprint_sql(sql)
+        shape = param_shape(params, many)
+        plan = self.explain(sql, params, many)
+        full_scans = find_full_scans(plan)
+        entry = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'query': digest,
+            'duration_ms': round(seconds * 1000, 3),
+            'rows': rows,
+            'params': shape,
+            'full_scan': bool(full_scans),
+            'plan': plan,
+            'sql': text,
+        }
+        if self.logger:
+            self.logger.info(json.dumps(entry, ensure_ascii=False))
+        with self._lock:
+            stats = self._stats.get(digest)
+            if stats is None:
+                stats = self._stats[digest] = {'query': digest, 'sql': text, 'count': 0, 'total_ms': 0.0,
+                                               'max_ms': 0.0}
+            stats['count'] += 1
+            stats['total_ms'] += entry['duration_ms']
+            if entry['duration_ms'] >= stats['max_ms']:
+                stats['max_ms'] = entry['duration_ms']
+            stats.update(last_seen=entry['time'], rows=rows, params=shape, plan=plan,
+                         full_scan=entry['full_scan'])
+
+    def worst(self, limit=20, order_by='total'):
+        """按累计耗时（total）、单次最大耗时（max）或次数（count）排序的最慢语句"""
+        key = {'total': 'total_ms', 'max': 'max_ms', 'count': 'count'}.get(order_by)
+        if key is None:
+            raise ValueError(f"不支持的排序方式: {order_by}")
+        with self._lock:
+            items = [dict(stats) for stats in self._stats.values()]
+        for item in items:
+            item['total_ms'] = round(item['total_ms'], 3)
+            item['avg_ms'] = round(item['total_ms'] / item['count'], 3)
+        items.sort(key=lambda item: item[key], reverse=True)
+        return items[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def reset_after_fork(self):
+        """子进程中放弃继承的 EXPLAIN 连接（不关闭）"""
+        self._abandoned_conn = self._explain_conn
+        self._explain_conn = None
+        self._explain_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._explain_lock:
+            if self._explain_conn is not None:
+                self._explain_conn.close()
+                self._explain_conn = None
+
+
+def instrument_methods(cls):
+    """类装饰器：为公共方法（iter_* 生成器除外）记录耗时和异常次数"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_') or name.startswith('iter_') or not inspect.isfunction(attr):
+            continue
+        setattr(cls, name, _timed_method(f'{cls.__name__}.{name}', attr))
+    return cls
+
+
+def _timed_method(label, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            METHOD_ERRORS.inc(1, label)
+            raise
+        finally:
+            METHOD_DURATION.observe(time.perf_counter() - started, label)
+    return wrapper
@@ -0,0 +1,211 @@
+"""
+会员密码：scrypt 哈希 + 有界哈希线程池 + 已验证凭据缓存
+
+scrypt 是内存困难的哈希（n=2^14、r=8 时每次约 16 MiB、数十毫秒），不能像 SHA-256 那样在请求线程里随手计算：
+并发登录一多就会占满 CPU 和内存。这里所有哈希/校验都交给固定大小的线程池（hashlib.scrypt 计算时释放 GIL），
+排队的任务超过上限时直接拒绝（PasswordHasherBusy），不让登录高峰拖垮其他接口。
+
+存储格式：scrypt$n$r$p$salt$key（salt、key 为不带填充的 base64），参数随哈希保存，调整配置后旧哈希仍可校验，
+并在下次登录成功时按新参数重新计算。早期版本的裸 SHA-256（64 位十六进制）同样在登录成功时升级。
+
+    ok, needs_rehash = hasher.verify(password, stored)
+    password_hash = hasher.hash(password)
+    future = hasher.submit_hash(password)     # 不阻塞，写队列据此在哈希完成后再排入写事务
+
+登录成功后把 (customer_id, 存储的哈希, HMAC(进程密钥, 密码)) 放进内存缓存，同一会员在有效期内再次登录
+只做一次 HMAC 比较；存储的哈希一变（改密码、升级哈希）缓存自然失效。缓存只在本进程内、不落盘。
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics_jessdb import LOGIN_CACHE, PASSWORD_HASH_DURATION, REGISTRY
+
+SCRYPT_PREFIX = 'scrypt'
+DEFAULT_SCRYPT_N = 2 ** 14
+DEFAULT_SCRYPT_R = 8
+DEFAULT_SCRYPT_P = 1
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+
+# 早期 JessDBManager.hash_password 的输出：SHA-256 十六进制
+_LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class PasswordHasherBusy(RuntimeError):
+    """排队等待哈希的任务已达上限"""
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL 默认只允许 32 MiB，n 调大时按实际需要放宽
+    maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=_KEY_BYTES)
+
+
+def scrypt_hash(password, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P):
+    """计算 scrypt$n$r$p$salt$key 格式的密码哈希（在调用线程中计算）"""
+    salt = os.urandom(_SALT_BYTES)
+    return '$'.join((SCRYPT_PREFIX, str(n), str(r), str(p), _b64encode(salt),
+                     _b64encode(_scrypt(password, salt, n, r, p))))
+
+
+def is_password_hash(value):
+    """是否为可校验的哈希（scrypt 或早期的 SHA-256）；否则是明文或无效值"""
+    return bool(value) and (value.startswith(SCRYPT_PREFIX + '$') or bool(_LEGACY_SHA256.match(value)))
+
+
+def check_password(password, stored, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P):
+    """校验密码，返回 (是否匹配, 是否需要按当前参数重新哈希)（在调用线程中计算）
+
+    明文或格式不对的存储值一律视为不匹配。
+    """
+    if not stored:
+        return False, False
+    if stored.startswith(SCRYPT_PREFIX + '$'):
+        try:
+            _, stored_n, stored_r, stored_p, salt, key = stored.split('$')
+            params = (int(stored_n), int(stored_r), int(stored_p))
+            salt, key = _b64decode(salt), _b64decode(key)
+        except ValueError:
+            return False, False
+        ok = hmac.compare_digest(_scrypt(password, salt, *params), key)
+        return ok, ok and params != (n, r, p)
+    if _LEGACY_SHA256.match(stored):
+        ok = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        return ok, ok
+    return False, False
+
+
+class PasswordHasher:
+    """有界线程池中执行 scrypt，附带已验证凭据缓存
+
+    workers 为同时计算的哈希数（每个约 128 * r * n 字节内存），max_pending 为排队上限，
+    cache_size=0 或 cache_ttl=0 时不缓存。
+    """
+
+    def __init__(self, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P, workers=2,
+                 max_pending=64, cache_size=10000, cache_ttl=300.0):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.cache_size = cache_size or 0
+        self.cache_ttl = cache_ttl or 0.0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._pid = os.getpid()
+        # customer_id -> (存储的哈希, HMAC 摘要, 过期时间)，按最近使用排序
+        self._cache = OrderedDict()
+        self._cache_key = secrets.token_bytes(32)
+        REGISTRY.gauge('jessdb_password_hash_pending', '等待或正在计算的密码哈希数', (),
+                       lambda: {(): self._pending})
+
+    def hash(self, password):
+        """按当前参数计算密码哈希（阻塞到线程池算完）"""
+        return self.submit_hash(password).result()
+
+    def submit_hash(self, password):
+        """提交哈希计算，返回结果为哈希字符串的 Future"""
+        return self._submit('hash', scrypt_hash, password, self.n, self.r, self.p)
+
+    def verify(self, password, stored):
+        """校验密码，返回 (是否匹配, 是否需要重新哈希)（阻塞到线程池算完）"""
+        if not stored:
+            return False, False
+        return self._submit('verify', check_password, password, stored, self.n, self.r, self.p).result()
+
+    def cached(self, customer_id, stored, password):
+        """该会员最近是否已用同一密码、针对同一存储哈希验证成功"""
+        if not self.cache_size or not self.cache_ttl:
+            return False
+        digest = self._digest(stored, password)
+        with self._lock:
+            entry = self._cache.get(customer_id)
+            if entry is not None and entry[2] < time.monotonic():
+                del self._cache[customer_id]
+                entry = None
+            if entry is not None:
+                self._cache.move_to_end(customer_id)
+        hit = entry is not None and entry[0] == stored and hmac.compare_digest(entry[1], digest)
+        LOGIN_CACHE.inc(1, 'hit' if hit else 'miss')
+        return hit
+
+    def remember(self, customer_id, stored, password):
+        """记录一次验证成功的登录"""
+        if not self.cache_size or not self.cache_ttl:
+            return
+        entry = (stored, self._digest(stored, password), time.monotonic() + self.cache_ttl)
+        with self._lock:
+            self._cache[customer_id] = entry
+            self._cache.move_to_end(customer_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def forget(self, customer_id=None):
+        """清除某个会员（或全部）的缓存"""
+        with self._lock:
+            if customer_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(customer_id, None)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _digest(self, stored, password):
+        return hmac.new(self._cache_key, f'{stored}\0{password}'.encode(), hashlib.sha256).digest()
+
+    def _submit(self, kind, func, *args):
+        with self._lock:
+            # 线程池不会随 fork 复制到子进程：进程号变化时重新创建
+            if self._pid != os.getpid():
+                self._executor = None
+                self._pending = 0
+                self._pid = os.getpid()
+            if self._pending >= self.max_pending:
+                raise PasswordHasherBusy("密码校验请求过多，请稍后重试")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='jessdb-password')
+            self._pending += 1
+            executor = self._executor
+        try:
+            future = executor.submit(self._timed, kind, func, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    @staticmethod
+    def _timed(kind, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            PASSWORD_HASH_DURATION.observe(time.perf_counter() - started, kind)
@@ -0,0 +1,123 @@
+"""
+会员会话令牌：无状态签名令牌 + 进程内吊销集合
+
+verify_member_login 成功后签发令牌，之后的会员请求带 Authorization: Bearer <token>，
+校验只是一次 HMAC 比较加 JSON 解析，不访问数据库，也不再计算 scrypt：
+
+    token, expires_at = sessions.issue(customer_id)
+    claims = sessions.verify(token)        # {'sub': customer_id, 'exp': ..., 'jti': ...}，无效为 None
+
+令牌格式为 base64url(payload).base64url(HMAC-SHA256(密钥, payload))。密钥取 JESSDB_SESSION_SECRET，
+未配置时使用迁移 12 生成并保存在 app_secrets 表中的随机值，同一数据库的所有进程签发的令牌互通。
+
+登出（revoke）把令牌的 jti 加入本进程的吊销集合，并经写队列记入 session_revocations；
+其他进程每隔 revocation_poll 秒由后台线程增量读取一次，校验本身始终只查内存。
+过期的吊销记录随之清理——令牌过期后本来就无法通过校验。
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class SessionTokens:
+    """会员会话令牌的签发、校验与吊销"""
+
+    def __init__(self, shop, secret=None, ttl=86400.0, revocation_poll=5.0):
+        self.shop = shop
+        self.ttl = ttl
+        self.revocation_poll = revocation_poll
+        self._secret = (secret or shop.get_session_secret()).encode()
+        self._lock = threading.Lock()
+        # jti -> 令牌过期时间戳
+        self._revoked = {}
+        self._revocation_id = 0
+        self._next_poll = 0.0
+        self._polling = False
+        self._pid = os.getpid()
+        self._poll()
+        self._next_poll = time.monotonic() + self.revocation_poll
+
+    def issue(self, customer_id):
+        """签发令牌，返回 (令牌, 过期时间戳)"""
+        expires_at = int(time.time() + self.ttl)
+        payload = json.dumps({'sub': int(customer_id), 'exp': expires_at, 'jti': secrets.token_hex(16)},
+                             separators=(',', ':')).encode()
+        return f'{_b64encode(payload)}.{_b64encode(self._sign(payload))}', expires_at
+
+    def verify(self, token):
+        """校验令牌，返回其中的声明；签名不对、已过期或已吊销时返回 None"""
+        if not token:
+            return None
+        try:
+            payload_part, signature_part = token.split('.')
+            payload = _b64decode(payload_part)
+            if not hmac.compare_digest(_b64decode(signature_part), self._sign(payload)):
+                return None
+            claims = json.loads(payload)
+            expired = claims['exp'] <= time.time()
+            jti = claims['jti']
+        except (ValueError, KeyError, TypeError):
+            return None
+        if expired:
+            return None
+        self._maybe_poll()
+        if jti in self._revoked:
+            return None
+        return claims
+
+    def revoke(self, token):
+        """吊销令牌（登出），返回是否为有效令牌；写回数据库的 Future 不必等待"""
+        claims = self.verify(token)
+        if claims is None:
+            return False
+        with self._lock:
+            self._revoked[claims['jti']] = claims['exp']
+        self.shop.writes.revoke_session_token(claims['jti'], claims['exp'])
+        return True
+
+    def _sign(self, payload):
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()
+
+    def _maybe_poll(self):
+        """到时间就起一个后台线程读取其他进程的吊销记录，不在校验路径上访问数据库"""
+        now = time.monotonic()
+        with self._lock:
+            # 后台线程不会随 fork 复制到子进程：进程号变化时清除“正在读取”的标记
+            if self._pid != os.getpid():
+                self._polling = False
+                self._pid = os.getpid()
+            if self._polling or now < self._next_poll:
+                return
+            self._polling = True
+            self._next_poll = now + self.revocation_poll
+        threading.Thread(target=self._poll, name='jessdb-session-revocations', daemon=True).start()
+
+    def _poll(self):
+        try:
+            rows = self.shop.get_session_revocations(self._revocation_id)
+            now = time.time()
+            with self._lock:
+                for revocation_id, token_id, expires_at in rows:
+                    self._revoked[token_id] = expires_at
+                    self._revocation_id = max(self._revocation_id, revocation_id)
+                for token_id in [token_id for token_id, expires_at in self._revoked.items() if expires_at <= now]:
+                    del self._revoked[token_id]
+        except Exception as e:
+            print(f"读取会话吊销记录失败: {e}")
+        finally:
+            with self._lock:
+                self._polling = False
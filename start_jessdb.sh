@@ -1,7 +1,14 @@
 #!/bin/bash
+# 用法:
+#   ./start_jessdb.sh           开发服务器（Flask，单进程）
+#   ./start_jessdb.sh prod      生产模式（gunicorn 多进程 × 多线程，见 gunicorn_jessdb.conf.py）
+#   ./start_jessdb.sh reload    平滑重载生产模式的工作进程
+#   ./start_jessdb.sh async     异步服务（Quart + Hypercorn）
+
+PIDFILE="${JESSDB_PIDFILE:-jessdb_gunicorn.pid}"
 
 echo "启动基于 JessDB 的咖啡店管理系统..."
-echo "数据库文件: jessdb.db"
+echo "数据库文件: ${JESSDB_PATH:-jessdb.db}"
 echo "端口: 5000"
 echo "访问地址: http://localhost:5000"
 echo ""
@@ -12,5 +19,36 @@ if ! python3 -c "import flask" 2>/dev/null; then
     pip3 install flask flask-cors
 fi
 
-# 启动应用
-python3 app_jessdb.py
\ No newline at end of file
+case "$1" in
+    prod)
+        if ! python3 -c "import gunicorn" 2>/dev/null; then
+            echo "安装 gunicorn..."
+            pip3 install gunicorn
+        fi
+        # 先执行迁移，避免多个工作进程启动时同时等待迁移锁
+        python3 manage_jessdb.py migrate || exit 1
+        # 执行计划回归检查：热点查询不走索引（迁移漏建、语句改坏）时拒绝启动；
+        # JESSDB_SKIP_PLAN_CHECK=1 跳过
+        if [ "${JESSDB_SKIP_PLAN_CHECK:-0}" != "1" ]; then
+            python3 manage_jessdb.py check-plans || exit 1
+        fi
+        exec gunicorn -c gunicorn_jessdb.conf.py app_jessdb:app
+        ;;
+    reload)
+        if [ ! -f "$PIDFILE" ]; then
+            echo "找不到 $PIDFILE，生产模式未运行？"
+            exit 1
+        fi
+        kill -HUP "$(cat "$PIDFILE")" && echo "已发送 HUP，工作进程将平滑重启"
+        ;;
+    async)
+        if ! python3 -c "import quart, hypercorn" 2>/dev/null; then
+            echo "安装异步服务依赖..."
+            pip3 install quart quart-cors hypercorn
+        fi
+        exec hypercorn app_jessdb_async:app --bind 0.0.0.0:5000
+        ;;
+    *)
+        python3 app_jessdb.py
+        ;;
+esac
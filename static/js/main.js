@@ -14,6 +14,7 @@ async function initializeApp() {
         await loadProducts();
         setupEventListeners();
         showTab('menu');
+        document.addEventListener('visibilitychange', handleVisibilityChange);
     } catch (error) {
         console.error('初始化失败:', error);
         showAlert('系统初始化失败，请刷新页面重试', 'error');
@@ -257,6 +258,8 @@ function showTab(tabName) {
     document.getElementById(`${tabName}Tab`).classList.add('active');
 
     currentTab = tabName;
+    // 先订阅再加载，加载期间发生的变化不会遗漏
+    updateOrderEventSubscription();
 
     // 如果切换到订单历史标签，加载订单数据
     if (tabName === 'orders') {
@@ -264,17 +267,123 @@ function showTab(tabName) {
     }
 }
 
-// 加载订单历史
-async function loadOrderHistory() {
-    try {
-        const response = await fetch('/api/orders');
-        const result = await response.json();
-        
-        if (result.success) {
-            renderOrderHistory(result.data);
+// 已随订单列表取回的订单项：order_id -> items，查看详情时直接使用，不再逐单请求
+const orderItemsCache = new Map();
+
+// 分页获取订单列表（附带订单项，整页一次请求），返回 { data, next_cursor }
+async function fetchOrderPage(params = {}) {
+    const query = new URLSearchParams({ include: 'items' });
+    Object.entries(params).forEach(([key, value]) => {
+        if (value) query.set(key, value);
+    });
+    const response = await fetch(`/api/orders?${query.toString()}`);
+    const result = await response.json();
+    if (!result.success) {
+        throw new Error(result.error);
+    }
+    result.data.forEach(order => {
+        if (order.items) {
+            orderItemsCache.set(order.order_id, order.items);
+        }
+    });
+    return result;
+}
+
+// 订阅订单事件流（SSE）：新订单与状态变更。EventSource 断线后自动重连，
+// 并通过 Last-Event-ID 从断点续传，只收到这期间的变化。返回带 close() 的订阅，不支持时返回 null
+function subscribeOrderEvents(onEvent) {
+    if (!window.EventSource) {
+        return null;
+    }
+    let source = null;
+    let retryTimer = null;
+    let lastEventId = '';
+    let closed = false;
+
+    const connect = () => {
+        const query = lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '';
+        source = new EventSource(`/api/orders/events${query}`);
+        ['order_created', 'order_status'].forEach(type => {
+            source.addEventListener(type, (e) => {
+                lastEventId = e.lastEventId || lastEventId;
+                onEvent(JSON.parse(e.data));
+            });
+        });
+        // 服务端连接数已满时返回 503，EventSource 不会自动重连：稍后从最后收到的事件处重新订阅
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED && !closed) {
+                retryTimer = setTimeout(connect, 5000 + Math.random() * 5000);
+            }
+        };
+    };
+
+    connect();
+    return {
+        close() {
+            closed = true;
+            clearTimeout(retryTimer);
+            source.close();
+        }
+    };
+}
+
+// 顾客页面只在订单历史标签可见时订阅事件流：每个连接在服务端占用一个请求线程，不看的页面不占名额
+let orderEventSubscription = null;
+
+function updateOrderEventSubscription() {
+    const wanted = currentTab === 'orders' && !document.hidden;
+    if (wanted && !orderEventSubscription) {
+        // 订单状态变化由服务端推送，已加载的订单历史随之更新，无需整表重新拉取
+        orderEventSubscription = subscribeOrderEvents(event => {
+            if (applyOrderEvent(orderHistory, event)) {
+                renderOrderHistory(orderHistory);
+            }
+        });
+    } else if (!wanted && orderEventSubscription) {
+        orderEventSubscription.close();
+        orderEventSubscription = null;
+    }
+}
+
+// 页面隐藏期间不订阅；回到订单历史时重新订阅并重新加载，补上隐藏期间的变化
+function handleVisibilityChange() {
+    const resumed = !document.hidden && currentTab === 'orders' && !orderEventSubscription;
+    updateOrderEventSubscription();
+    if (resumed) {
+        loadOrderHistory();
+    }
+}
+
+// 把一条订单事件合并进已加载的订单列表（就地修改），返回列表是否有变化；
+// statusFilter 为当前的状态筛选，状态变更后不再符合的订单从列表移除
+function applyOrderEvent(orders, event, statusFilter = '') {
+    const index = orders.findIndex(order => order.order_id === event.order_id);
+    if (index >= 0) {
+        if (statusFilter && event.status !== statusFilter) {
+            orders.splice(index, 1);
         } else {
-            throw new Error(result.error);
+            orders[index] = { ...orders[index], status: event.status };
         }
+        return true;
+    }
+    if (event.type === 'created' && event.order && (!statusFilter || event.status === statusFilter)) {
+        orders.unshift(event.order);
+        return true;
+    }
+    return false;
+}
+
+// 订单历史已加载的数据与下一页游标
+let orderHistory = [];
+let orderHistoryCursor = null;
+
+// 加载订单历史（append 为 true 时加载下一页）
+async function loadOrderHistory(append = false) {
+    try {
+        const result = await fetchOrderPage({ after: append ? orderHistoryCursor : null });
+        orderHistory = append ? orderHistory.concat(result.data) : result.data;
+        orderHistoryCursor = result.next_cursor;
+        renderOrderHistory(orderHistory);
     } catch (error) {
         console.error('加载订单历史失败:', error);
         showAlert('加载订单历史失败', 'error');
@@ -327,10 +436,30 @@ function renderOrderHistory(orders) {
 
     container.innerHTML = '';
     container.appendChild(table);
+
+    if (orderHistoryCursor) {
+        container.appendChild(createLoadMoreButton(() => loadOrderHistory(true)));
+    }
+}
+
+// “加载更多”按钮
+function createLoadMoreButton(onClick) {
+    const wrapper = document.createElement('div');
+    wrapper.style.cssText = 'text-align: center; margin-top: 15px;';
+    const button = document.createElement('button');
+    button.className = 'btn btn-secondary';
+    button.textContent = '加载更多';
+    button.addEventListener('click', onClick);
+    wrapper.appendChild(button);
+    return wrapper;
 }
 
 // 查看订单详情
 async function viewOrderDetails(orderId) {
+    if (orderItemsCache.has(orderId)) {
+        showOrderDetailsModal(orderId, orderItemsCache.get(orderId));
+        return;
+    }
     try {
         const response = await fetch(`/api/orders/${orderId}/details`);
         const result = await response.json();
@@ -0,0 +1,252 @@
+"""
+写入串行化：进程内所有写操作交给一个写线程执行
+
+SQLite 同一时刻只允许一个写事务，多个请求线程各自开事务写入时会在写锁上互相等待，
+等到 busy_timeout 仍拿不到锁就报 database is locked。这里把 create_order、create_customer、
+update_order_status、create_member_customer、批量订单的每一块（create_orders_chunk）等写操作排进队列，由唯一的写线程逐批执行：
+
+- 每批在一个 BEGIN IMMEDIATE 事务中执行，只提交（fsync）一次（group commit）
+- 每个操作包在 SAVEPOINT 中，失败只回滚自己，不影响同批其他操作
+- 调用方拿到 concurrent.futures.Future，事务提交后才设置结果（订单ID/客户ID）
+
+    future = shop.writes.create_order(customer_id, 'CASH', items)
+    order_id = future.result()
+    order_id = await asyncio.wrap_future(future)   # 异步服务中
+
+多进程部署时每个进程各有一个写线程，进程之间仍靠 busy_timeout 排队，
+但同时争抢写锁的从“所有请求线程”降到“每个进程一个”。
+
+需要密码哈希的操作（create_member_customer、登录时的哈希升级）先在密码哈希线程池中算好 scrypt，
+完成后才排进写队列，几十毫秒的哈希不会在写事务里占着写锁。
+"""
+
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics_jessdb import REGISTRY, WRITE_BATCH_SIZE, WRITE_QUEUE_WAIT
+
+# 可以经写线程执行的 JessDBCoffeeShop 方法
+WRITE_METHODS = ('create_order', 'create_customer', 'update_order_status', 'create_member_customer',
+                 'update_member_password_hash', 'revoke_session_token', 'create_orders_chunk')
+
+
+class WriteQueueClosed(RuntimeError):
+    """写队列已关闭"""
+
+
+def _chain(source, target):
+    """source 完成后把结果或异常转给 target"""
+    def copy(future):
+        if future.cancelled():
+            target.cancel()
+        elif future.exception() is not None:
+            target.set_exception(future.exception())
+        else:
+            target.set_result(future.result())
+    source.add_done_callback(copy)
+
+
+class _WriteOp:
+    __slots__ = ('method', 'args', 'kwargs', 'future', 'context', 'submitted')
+
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        # 在提交方的上下文中执行，SQL 耗时照常计入所属请求的 Server-Timing
+        self.context = contextvars.copy_context()
+        self.submitted = time.perf_counter()
+
+
+class WriteQueue:
+    """单写线程 + 批量提交
+
+    enabled=False 时不启动写线程，submit() 在调用线程中直接执行并返回已完成的 Future，
+    调用方写法不变。
+    """
+
+    _STOP = object()
+
+    def __init__(self, shop, batch_size=64, batch_wait_ms=0.0, enabled=True):
+        self.shop = shop
+        self.db_manager = shop.db_manager
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = max(0.0, batch_wait_ms or 0.0) / 1000.0
+        self.enabled = enabled
+        # 每批提交成功后回调（无参数），如唤醒订单事件推送
+        self.on_commit = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+        self._pid = os.getpid()
+        REGISTRY.gauge('jessdb_write_queue_depth', '等待写线程执行的操作数', (),
+                       lambda: {(): self._queue.qsize()})
+
+    def submit(self, method, *args, **kwargs):
+        """提交一个写操作，返回 Future，结果为对应 JessDBCoffeeShop 方法的返回值"""
+        if method not in WRITE_METHODS:
+            raise ValueError(f"不支持的写操作: {method}")
+        op = _WriteOp(method, args, kwargs)
+        if not self.enabled:
+            self._run_inline(op)
+            return op.future
+        with self._lock:
+            if self._closed:
+                raise WriteQueueClosed("写队列已关闭")
+            self._ensure_thread()
+            self._queue.put(op)
+        return op.future
+
+    def create_order(self, *args, **kwargs):
+        return self.submit('create_order', *args, **kwargs)
+
+    def create_customer(self, *args, **kwargs):
+        return self.submit('create_customer', *args, **kwargs)
+
+    def update_order_status(self, *args, **kwargs):
+        return self.submit('update_order_status', *args, **kwargs)
+
+    def create_member_customer(self, customer_id, password=None, date_of_birth=None, password_hash=None):
+        if password_hash is not None:
+            return self.submit('create_member_customer', customer_id, date_of_birth=date_of_birth,
+                               password_hash=password_hash)
+        return self._after_hash(password, lambda hashed: self.submit(
+            'create_member_customer', customer_id, date_of_birth=date_of_birth, password_hash=hashed))
+
+    def update_member_password_hash(self, *args, **kwargs):
+        return self.submit('update_member_password_hash', *args, **kwargs)
+
+    def revoke_session_token(self, *args, **kwargs):
+        return self.submit('revoke_session_token', *args, **kwargs)
+
+    def create_orders_chunk(self, *args, **kwargs):
+        return self.submit('create_orders_chunk', *args, **kwargs)
+
+    def rehash_member_password(self, customer_id, old_hash, password):
+        """按当前参数重新计算会员密码哈希，并在存储值仍为 old_hash 时写回；结果为是否更新"""
+        return self._after_hash(password, lambda hashed: self.submit(
+            'update_member_password_hash', customer_id, old_hash, hashed))
+
+    def _after_hash(self, password, then):
+        """在密码哈希线程池中计算哈希，算完后在提交方的上下文中调用 then(哈希) 排入写操作
+
+        立即返回 Future，跟随 then 返回的写操作的结果；哈希排队已满时直接抛出 PasswordHasherBusy。
+        """
+        result = Future()
+        context = contextvars.copy_context()
+
+        def on_hashed(hashed):
+            try:
+                write = context.run(then, hashed.result())
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            _chain(write, result)
+
+        self.shop.db_manager.passwords.submit_hash(password).add_done_callback(on_hashed)
+        return result
+
+    def close(self, timeout=None):
+        """不再接受新操作，等写线程处理完已排队的操作后退出"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            if thread is not None and self._pid == os.getpid():
+                self._queue.put(self._STOP)
+        if thread is not None:
+            thread.join(timeout)
+
+    def _ensure_thread(self):
+        # 写线程不会随 fork 复制到子进程：进程号变化时丢弃继承来的队列，重新启动
+        if self._pid != os.getpid():
+            self._queue = queue.Queue()
+            self._thread = None
+            self._pid = os.getpid()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='jessdb-writer', daemon=True)
+            self._thread.start()
+
+    def _run_inline(self, op):
+        if not op.future.set_running_or_notify_cancel():
+            return
+        try:
+            op.future.set_result(op.context.run(getattr(self.shop, op.method), *op.args, **op.kwargs))
+        except BaseException as e:
+            op.future.set_exception(e)
+            return
+        if self.on_commit:
+            self.on_commit()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            stop = batch[-1] is self._STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._execute_batch(batch)
+            if stop:
+                return
+
+    def _next_batch(self):
+        """阻塞取到第一个操作，再取出已在排队的操作（最多等 batch_wait 秒）凑成一批"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _execute_batch(self, batch):
+        ops = [op for op in batch if op.future.set_running_or_notify_cancel()]
+        if not ops:
+            return
+        started = time.perf_counter()
+        for op in ops:
+            WRITE_QUEUE_WAIT.observe(started - op.submitted)
+        WRITE_BATCH_SIZE.observe(len(ops))
+
+        results = []
+        try:
+            with self.db_manager.transaction() as conn:
+                cursor = conn.cursor()
+                # 一开始就拿写锁：先读后写的事务在 WAL 下升级写锁失败时不会等待 busy_timeout
+                cursor.execute("BEGIN IMMEDIATE")
+                for op in ops:
+                    cursor.execute("SAVEPOINT write_op")
+                    try:
+                        result = op.context.run(getattr(self.shop, op.method), *op.args, **op.kwargs)
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO write_op")
+                        cursor.execute("RELEASE write_op")
+                        results.append((op, None, e))
+                        continue
+                    cursor.execute("RELEASE write_op")
+                    results.append((op, result, None))
+        except BaseException as e:
+            # 开事务或提交失败：整批都没有写入
+            for op in ops:
+                op.future.set_exception(e)
+            return
+
+        if self.on_commit:
+            self.on_commit()
+        for op, result, error in results:
+            if error is None:
+                op.future.set_result(result)
+            else:
+                op.future.set_exception(error)